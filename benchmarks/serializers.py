@@ -0,0 +1,81 @@
+"""Compare the speed and payload size of the serializers.
+
+Run from the repository root:
+
+    python -m benchmarks.serializers
+
+msgpack, orjson and numpy are used if installed.
+"""
+from datetime import datetime
+import pickle
+import timeit
+
+from src.cachecore.serializers import CompressedSerializer, JSONSerializer, \
+    MsgPackSerializer, OrjsonSerializer, Pickle5Serializer, RedisSerializer, \
+    TaggedSerializer
+
+
+def _record(i):
+    return {
+        'id': i,
+        'username': f'user{i}',
+        'email': f'user{i}@example.com',
+        'active': i % 3 != 0,
+        'score': i * 1.5,
+        'tags': ['admin', 'beta'] if i % 10 == 0 else ['user'],
+        'created_at': datetime(2023, 1, 1, 12, i % 60).isoformat(),
+    }
+
+
+def payloads():
+    yield 'int', 12345
+    yield 'record', _record(1)
+    yield '100 records', [_record(i) for i in range(100)]
+    yield 'html 10 KiB', '<div class="row">cell</div>' * 380
+    yield 'bytes 1 MiB', bytes(range(256)) * 4096
+    try:
+        import numpy
+    except ImportError:
+        return
+    yield 'ndarray 8 MiB', numpy.arange(1 << 20, dtype=numpy.float64)
+
+
+def serializers():
+    yield 'pickle', pickle
+    yield 'RedisSerializer', RedisSerializer()
+    yield 'TaggedSerializer', TaggedSerializer()
+    yield 'Pickle5Serializer', Pickle5Serializer()
+    yield 'CompressedSerializer', CompressedSerializer()
+    yield 'JSONSerializer', JSONSerializer()
+    for name, cls in (('OrjsonSerializer', OrjsonSerializer), ('MsgPackSerializer', MsgPackSerializer)):
+        try:
+            yield name, cls()
+        except ImportError:
+            pass
+
+
+def _time(fn):
+    number, _ = timeit.Timer(fn).autorange()
+    best = min(timeit.repeat(fn, number=number, repeat=3))
+    return best / number * 1e6
+
+
+def main():
+    print(f"{'payload':<16}{'serializer':<22}{'dumps µs':>12}{'loads µs':>12}{'bytes':>12}")
+    for payload_name, value in payloads():
+        for name, serializer in serializers():
+            try:
+                data = serializer.dumps(value)
+                serializer.loads(data)
+            except (TypeError, ValueError):
+                # e.g. JSON can't encode bytes.
+                continue
+
+            dumps = _time(lambda: serializer.dumps(value))
+            loads = _time(lambda: serializer.loads(data))
+            print(f'{payload_name:<16}{name:<22}{dumps:>12.2f}{loads:>12.2f}{len(data):>12}')
+        print()
+
+
+if __name__ == '__main__':
+    main()
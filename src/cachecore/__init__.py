@@ -1,8 +1,13 @@
-from .interface import CacheInterface
-from .base import BaseCache
+from .interface import AsyncCacheInterface, CacheInterface
+from .base import AsyncBaseCache, BaseCache
 from .dummy import DummyCache
 from .file import FileCache
 from .local import LocalCache
-from .memcached import MemcachedCache
-from .redis import RedisCache
-
+from .memcached import AsyncMemcachedCache, MemcachedCache
+from .redis import AsyncRedisCache, RedisCache
+from .sharded import ShardedCache
+from .shm import SharedMemoryCache
+from .tiered import TieredCache
+from .aio import AsyncCacheWrapper, AsyncFileCache, AsyncLocalCache
+from .memoize import make_key, memoize
+from .metrics import HotKeySampler, InstrumentedCache
@@ -0,0 +1,142 @@
+import asyncio
+from concurrent.futures import Executor
+from functools import partial
+import typing as t
+
+from .base import AsyncBaseCache
+from .file import FileCache
+from .interface import CacheInterface
+from .local import LocalCache
+from .utils import KEEP_TTL, iter_pairs
+
+
+class AsyncCacheWrapper(AsyncBaseCache):
+    """Exposes a blocking cache through the AsyncCacheInterface.
+
+    :param cache: The cache to wrap.
+    :param executor: The executor blocking calls are run in. None means the
+        event loop's default thread pool.
+    :param offload: False, if the cache never blocks, e.g. an in-memory
+        cache, so that calls are made directly on the event loop. By
+        default, calls are offloaded unless the cache isn't thread-safe.
+    """
+
+    def __init__(
+        self,
+        cache: CacheInterface,
+        executor: Executor | None = None,
+        offload: bool | None = None
+    ):
+        self.cache = cache
+        self._executor = executor
+        if offload is None:
+            offload = cache._thread_safe
+        self._offload = offload
+
+    @property
+    def _distributed(self) -> bool:
+        return self.cache._distributed
+
+    async def _call(self, fn: t.Callable, *args) -> t.Any:
+        if not self._offload:
+            return fn(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(fn, *args))
+
+    async def __aiter__(self) -> t.AsyncIterator[str]:
+        for key in await self._call(list, self.cache):
+            yield key
+
+    def keys(self, pattern: str | None = None) -> t.AsyncIterator[str]:
+        return self._keys(pattern)
+
+    async def _keys(self, pattern: str | None) -> t.AsyncIterator[str]:
+        keys = await self._call(lambda: list(self.cache.keys(pattern)))
+        for key in keys:
+            yield key
+
+    async def get(self, key: str, default: t.Any = None) -> t.Any:
+        return await self._call(self.cache.get, key, default)
+
+    async def set(self, key: str, value: t.Any, ttl: int | None = None) -> None:
+        await self._call(self.cache.set, key, value, ttl)
+
+    async def add(self, key: str, value: t.Any, ttl: int | None = None) -> bool:
+        return await self._call(self.cache.add, key, value, ttl)
+
+    async def replace(self, key: str, value: t.Any, ttl: int | None = KEEP_TTL) -> bool:
+        return await self._call(self.cache.replace, key, value, ttl)
+
+    async def delete(self, key: str) -> bool:
+        return await self._call(self.cache.delete, key)
+
+    async def pop(self, key: str, default: t.Any = None) -> t.Any:
+        return await self._call(self.cache.pop, key, default)
+
+    async def exists(self, key: str) -> bool:
+        return await self._call(self.cache.exists, key)
+
+    async def get_many(self, keys: t.Iterable[str], default: t.Any = None) -> list[t.Any]:
+        # Batch calls are materialized in the executor, as a single job.
+        keys = list(keys)
+        return await self._call(lambda: list(self.cache.get_many(keys, default)))
+
+    async def set_many(self, mapping: t.Mapping[str, t.Any] | t.Iterable[tuple[str, t.Any]], ttl: int | None = None) -> None:
+        await self._call(self.cache.set_many, list(iter_pairs(mapping)), ttl)
+
+    async def delete_many(self, keys: t.Iterable[str]) -> list[bool]:
+        keys = list(keys)
+        return await self._call(lambda: list(self.cache.delete_many(keys)))
+
+    async def get_ttl(self, key: str, default: int = 0) -> int | None:
+        return await self._call(self.cache.get_ttl, key, default)
+
+    async def set_ttl(self, key: str, ttl: int | None = None) -> bool:
+        return await self._call(self.cache.set_ttl, key, ttl)
+
+    async def incr(self, key: str, delta: int = 1) -> int:
+        return await self._call(self.cache.incr, key, delta)
+
+    async def decr(self, key: str, delta: int = 1) -> int:
+        return await self._call(self.cache.decr, key, delta)
+
+    async def clear(self) -> None:
+        await self._call(self.cache.clear)
+
+    async def _get_fresh(self, key: str, ttl: int | None, soft_ttl: int) -> tuple[t.Any, bool]:
+        return await self._call(self.cache._get_fresh, key, ttl, soft_ttl)
+
+    async def _set_fresh(self, key: str, value: t.Any, ttl: int | None, soft_ttl: int | None) -> None:
+        await self._call(self.cache._set_fresh, key, value, ttl, soft_ttl)
+
+    async def _lock(self, key: str, timeout: float) -> str | None:
+        return await self._call(self.cache._lock, key, timeout)
+
+    async def _unlock(self, key: str, token: str) -> None:
+        await self._call(self.cache._unlock, key, token)
+
+    async def aclose(self) -> None:
+        close = getattr(self.cache, 'close', None)
+        if close is not None:
+            await self._call(close)
+
+
+class AsyncLocalCache(AsyncCacheWrapper):
+    """A LocalCache used from asyncio. Calls are made directly on the event
+    loop since they never block on I/O.
+
+    Takes the same arguments as LocalCache.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(LocalCache(*args, **kwargs), offload=False)
+
+
+class AsyncFileCache(AsyncCacheWrapper):
+    """A FileCache used from asyncio. File I/O is run in a thread pool.
+
+    Takes the same arguments as FileCache, plus `executor`.
+    """
+
+    def __init__(self, *args, executor: Executor | None = None, **kwargs):
+        super().__init__(FileCache(*args, **kwargs), executor=executor)
@@ -1,11 +1,54 @@
+import asyncio
 from fnmatch import fnmatch
+import inspect
+import secrets
+import time
 import typing as t
 
+from .memoize import memoize
+from .utils import AsyncRefresher, AsyncSingleFlight, ComputeTimes, Refresher, \
+    SingleFlight, iter_pairs, should_refresh
+
+
+_MISSING = object()
+
+# How often a worker waiting on another process's lock polls for the value.
+_LOCK_POLL_INTERVAL = 0.05
+
+
+# Keys get_or_set uses for its own state start with this prefix. They are
+# left out when iterating over a cache.
+_RESERVED_PREFIX = '__cachecore__:'
+
+
+def _lock_key(key: str) -> str:
+    """Returns the key of the lock get_or_set takes to compute a key.
+    """
+    return f'{_RESERVED_PREFIX}lock:{key}'
+
+
+def _fresh_key(key: str) -> str:
+    """Returns the key of the marker that a key's value is within its soft
+    TTL, for backends that can't store the soft TTL with the value.
+    """
+    return f'{_RESERVED_PREFIX}fresh:{key}'
+
+
+def _is_reserved(key: str) -> bool:
+    return key.startswith(_RESERVED_PREFIX)
+
 
 class BaseCache:
 
+    # True for caches shared between processes, where get_or_set() also
+    # takes a lock in the cache so that only one process computes a value.
+    _distributed = False
+
+    # False for caches that must only be used from one thread.
+    _thread_safe = True
+
     def __len__(self) -> int:
-        return len(list(self))
+        return sum(1 for _ in self)
 
     def keys(self, pattern: str | None = None) -> t.Iterator[str]:
         for key in self:
@@ -44,8 +87,8 @@ class BaseCache:
     def get_many(self, keys: list[str], default: t.Any=None) -> t.Iterable[t.Any]:
         return (self.get(k, default) for k in keys)
 
-    def set_many(self, mapping: t.Mapping[str, t.Any], ttl: int | None = None) -> None:
-        for k, v in mapping:
+    def set_many(self, mapping: t.Mapping[str, t.Any] | t.Iterable[tuple[str, t.Any]], ttl: int | None = None) -> None:
+        for k, v in iter_pairs(mapping):
             self.set(k, v, ttl)
 
     def delete_many(self, keys: list[str]) -> t.Iterable[bool]:
@@ -53,3 +96,292 @@ class BaseCache:
 
     def decr(self, key: str, delta: int = 1) -> int:
         return self.incr(key, -delta)
+
+    def _get_or_set_state(self) -> tuple[SingleFlight, ComputeTimes, Refresher]:
+        # setdefault is atomic, so threads racing on the first call share
+        # the same objects.
+        state = self.__dict__.get('_get_or_set')
+        if state is None:
+            state = self.__dict__.setdefault(
+                '_get_or_set', (SingleFlight(), ComputeTimes(), Refresher())
+            )
+        return state
+
+    def _get_fresh(self, key: str, ttl: int | None, soft_ttl: int) -> tuple[t.Any, bool]:
+        """Returns a 2-tuple of the value, or _MISSING, and whether it is
+        past its soft TTL.
+
+        Backends that can't store a soft TTL alongside the value keep a
+        marker key that expires after `soft_ttl` instead.
+        """
+        value, fresh = self.get_many([key, _fresh_key(key)], _MISSING)
+        return value, value is not _MISSING and fresh is _MISSING
+
+    def _set_fresh(self, key: str, value: t.Any, ttl: int | None, soft_ttl: int | None) -> None:
+        self.set(key, value, ttl)
+        if soft_ttl is not None:
+            self.set(_fresh_key(key), 1, soft_ttl)
+
+    def _lock(self, key: str, timeout: float) -> str | None:
+        """Take the lock that lets only one process compute a key's value.
+
+        :returns: The token to release the lock with, or None if another
+            worker holds it.
+        """
+        token = secrets.token_hex(16)
+        if self.add(_lock_key(key), token, max(1, round(timeout))):
+            return token
+        return None
+
+    def _unlock(self, key: str, token: str) -> None:
+        """Release a lock, unless it expired and another worker took it
+        since. Backends that can compare and delete atomically override this.
+        """
+        lock_key = _lock_key(key)
+        if self.get(lock_key) == token:
+            self.delete(lock_key)
+
+    def get_or_set(
+        self,
+        key: str,
+        fn: t.Callable[[], t.Any],
+        ttl: int | None = None,
+        beta: float = 1.0,
+        lock_timeout: float = 10.0,
+        soft_ttl: int | None = None
+    ) -> t.Any:
+        flight, times, refresher = self._get_or_set_state()
+        if soft_ttl is not None:
+            value, stale = self._get_fresh(key, ttl, soft_ttl)
+            if value is not _MISSING:
+                if stale:
+                    refresher.submit(key, lambda: flight.do(
+                        key, lambda: self._compute(key, fn, ttl, value, lock_timeout, soft_ttl)
+                    ))
+                return value
+            return flight.do(key, lambda: self._compute(key, fn, ttl, value, lock_timeout, soft_ttl))
+
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            delta = times.get(key)
+            if ttl is None or not beta or delta is None:
+                return value
+
+            try:
+                remaining = self.get_ttl(key, default=0)
+            except NotImplementedError:
+                return value
+            if remaining is None or not should_refresh(delta, remaining, beta):
+                return value
+
+        return flight.do(key, lambda: self._compute(key, fn, ttl, value, lock_timeout))
+
+    def memoize(
+        self,
+        ttl: int | None = None,
+        key: t.Callable[..., str] | None = None,
+        typed: bool = False,
+        soft_ttl: int | None = None,
+        prefix: str | None = None
+    ) -> t.Callable[[t.Callable], t.Callable]:
+        """Decorator caching a function's results in this cache. See
+        cachecore.memoize.memoize.
+        """
+        return memoize(self, ttl, key, typed, soft_ttl, prefix)
+
+    def _compute(self, key, fn, ttl, stale, lock_timeout, soft_ttl=None):
+        """Compute and store a value, or return the one another worker
+        stored meanwhile.
+
+        :param stale: The value being refreshed early, or _MISSING.
+        """
+        if stale is _MISSING:
+            # The previous flight may have finished after the miss.
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+
+        token = None
+        if self._distributed:
+            token = self._lock(key, lock_timeout)
+            if token is None:
+                if stale is not _MISSING:
+                    # Someone else is refreshing it.
+                    return stale
+
+                deadline = time.monotonic() + lock_timeout
+                while time.monotonic() < deadline:
+                    time.sleep(_LOCK_POLL_INTERVAL)
+                    value = self.get(key, _MISSING)
+                    if value is not _MISSING:
+                        return value
+
+        try:
+            start = time.monotonic()
+            value = fn()
+            self._get_or_set_state()[1].record(key, time.monotonic() - start)
+            self._set_fresh(key, value, ttl, soft_ttl)
+        finally:
+            if token is not None:
+                self._unlock(key, token)
+        return value
+
+
+class AsyncBaseCache:
+    """Default implementations of AsyncCacheInterface in terms of a few
+    primitives, mirroring BaseCache.
+    """
+
+    _distributed = False
+
+    def keys(self, pattern: str | None = None) -> t.AsyncIterator[str]:
+        return self._match(pattern)
+
+    async def _match(self, pattern: str | None) -> t.AsyncIterator[str]:
+        async for key in self:
+            if pattern is not None and not fnmatch(key, pattern):
+                continue
+            yield key
+
+    async def add(self, key: str, value: t.Any, ttl: int | None = None) -> bool:
+        if await self.exists(key):
+            return False
+        await self.set(key, value, ttl)
+        return True
+
+    async def pop(self, key: str, default: t.Any | None = None) -> t.Any:
+        value = await self.get(key, default)
+        await self.delete(key)
+        return value
+
+    async def get_many(self, keys: t.Iterable[str], default: t.Any = None) -> list[t.Any]:
+        return [await self.get(k, default) for k in keys]
+
+    async def set_many(self, mapping: t.Mapping[str, t.Any] | t.Iterable[tuple[str, t.Any]], ttl: int | None = None) -> None:
+        for k, v in iter_pairs(mapping):
+            await self.set(k, v, ttl)
+
+    async def delete_many(self, keys: t.Iterable[str]) -> list[bool]:
+        return [await self.delete(k) for k in keys]
+
+    async def decr(self, key: str, delta: int = 1) -> int:
+        return await self.incr(key, -delta)
+
+    def _get_or_set_state(self) -> tuple[AsyncSingleFlight, ComputeTimes, AsyncRefresher]:
+        state = self.__dict__.get('_get_or_set')
+        if state is None:
+            state = self.__dict__.setdefault(
+                '_get_or_set', (AsyncSingleFlight(), ComputeTimes(), AsyncRefresher())
+            )
+        return state
+
+    async def _get_fresh(self, key: str, ttl: int | None, soft_ttl: int) -> tuple[t.Any, bool]:
+        """See BaseCache._get_fresh.
+        """
+        value, fresh = await self.get_many([key, _fresh_key(key)], _MISSING)
+        return value, value is not _MISSING and fresh is _MISSING
+
+    async def _set_fresh(self, key: str, value: t.Any, ttl: int | None, soft_ttl: int | None) -> None:
+        await self.set(key, value, ttl)
+        if soft_ttl is not None:
+            await self.set(_fresh_key(key), 1, soft_ttl)
+
+    async def _lock(self, key: str, timeout: float) -> str | None:
+        """See BaseCache._lock.
+        """
+        token = secrets.token_hex(16)
+        if await self.add(_lock_key(key), token, max(1, round(timeout))):
+            return token
+        return None
+
+    async def _unlock(self, key: str, token: str) -> None:
+        """See BaseCache._unlock.
+        """
+        lock_key = _lock_key(key)
+        if await self.get(lock_key) == token:
+            await self.delete(lock_key)
+
+    async def get_or_set(
+        self,
+        key: str,
+        fn: t.Callable[[], t.Any],
+        ttl: int | None = None,
+        beta: float = 1.0,
+        lock_timeout: float = 10.0,
+        soft_ttl: int | None = None
+    ) -> t.Any:
+        flight, times, refresher = self._get_or_set_state()
+        if soft_ttl is not None:
+            value, stale = await self._get_fresh(key, ttl, soft_ttl)
+            if value is not _MISSING:
+                if stale:
+                    refresher.submit(key, lambda: flight.do(
+                        key, lambda: self._compute(key, fn, ttl, value, lock_timeout, soft_ttl)
+                    ))
+                return value
+            return await flight.do(key, lambda: self._compute(key, fn, ttl, value, lock_timeout, soft_ttl))
+
+        value = await self.get(key, _MISSING)
+        if value is not _MISSING:
+            delta = times.get(key)
+            if ttl is None or not beta or delta is None:
+                return value
+
+            try:
+                remaining = await self.get_ttl(key, default=0)
+            except NotImplementedError:
+                return value
+            if remaining is None or not should_refresh(delta, remaining, beta):
+                return value
+
+        return await flight.do(key, lambda: self._compute(key, fn, ttl, value, lock_timeout))
+
+    def memoize(
+        self,
+        ttl: int | None = None,
+        key: t.Callable[..., str] | None = None,
+        typed: bool = False,
+        soft_ttl: int | None = None,
+        prefix: str | None = None
+    ) -> t.Callable[[t.Callable], t.Callable]:
+        """Decorator caching a function's results in this cache. See
+        cachecore.memoize.memoize.
+        """
+        return memoize(self, ttl, key, typed, soft_ttl, prefix)
+
+    async def _compute(self, key, fn, ttl, stale, lock_timeout, soft_ttl=None):
+        """See BaseCache._compute.
+        """
+        if stale is _MISSING:
+            value = await self.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+
+        token = None
+        if self._distributed:
+            token = await self._lock(key, lock_timeout)
+            if token is None:
+                if stale is not _MISSING:
+                    return stale
+
+                deadline = time.monotonic() + lock_timeout
+                while time.monotonic() < deadline:
+                    await asyncio.sleep(_LOCK_POLL_INTERVAL)
+                    value = await self.get(key, _MISSING)
+                    if value is not _MISSING:
+                        return value
+
+        try:
+            start = time.monotonic()
+            value = fn()
+            if inspect.isawaitable(value):
+                value = await value
+            self._get_or_set_state()[1].record(key, time.monotonic() - start)
+            await self._set_fresh(key, value, ttl, soft_ttl)
+        finally:
+            if token is not None:
+                await self._unlock(key, token)
+        return value
+
+    async def aclose(self) -> None:
+        pass
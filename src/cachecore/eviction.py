@@ -0,0 +1,361 @@
+from collections import OrderedDict
+import typing as t
+
+
+@t.runtime_checkable
+class EvictionPolicy(t.Protocol):
+
+    def insert(self, key: str) -> None:
+        """Start tracking a key that was just added to the cache.
+
+        :param key: The key.
+        """
+        ...
+
+    def access(self, key: str) -> None:
+        """Record a hit on a key that is already tracked.
+
+        :param key: The key.
+        """
+        ...
+
+    def remove(self, key: str) -> None:
+        """Stop tracking a key that was deleted or expired.
+
+        :param key: The key.
+        """
+        ...
+
+    def evict(self) -> str:
+        """Choose a victim and stop tracking it.
+
+        :returns: The key that should be evicted from the cache.
+        """
+        ...
+
+    def clear(self) -> None:
+        """Stop tracking all keys.
+        """
+        ...
+
+
+_HALVE = bytes(c >> 1 for c in range(256))
+
+
+class CountMinSketch:
+    """Approximate frequency counter using a fixed amount of memory.
+
+    :param width: The number of counters per row.
+    :param depth: The number of rows.
+    :param max_count: Counters saturate at this value. None means no limit.
+    :param sample_size: Halve every counter after this many additions so that
+        old popularity fades out. None disables aging.
+    """
+
+    def __init__(
+        self,
+        width: int = 1024,
+        depth: int = 4,
+        max_count: int | None = None,
+        sample_size: int | None = None
+    ):
+        self._width = width
+        self._depth = depth
+        self._max_count = max_count
+        # Small saturating counters fit in a byte each.
+        self._compact = max_count is not None and max_count <= 255
+        self._rows = [self._new_row() for _ in range(depth)]
+        self._sample_size = sample_size
+        self._additions = 0
+
+    def _indexes(self, key: t.Hashable) -> t.Iterator[int]:
+        h = hash(key)
+        h1 = h & 0xffffffff
+        h2 = ((h >> 32) & 0xffffffff) | 1
+        return ((h1 + i * h2) % self._width for i in range(self._depth))
+
+    def add(self, key: t.Hashable) -> None:
+        max_count = self._max_count
+        for row, i in zip(self._rows, self._indexes(key)):
+            if max_count is None or row[i] < max_count:
+                row[i] += 1
+
+        self._additions += 1
+        if self._sample_size is not None and self._additions >= self._sample_size:
+            self._age()
+
+    def estimate(self, key: t.Hashable) -> int:
+        return min(row[i] for row, i in zip(self._rows, self._indexes(key)))
+
+    def clear(self) -> None:
+        self._rows = [self._new_row() for _ in range(self._depth)]
+        self._additions = 0
+
+    def _new_row(self):
+        if self._compact:
+            return bytearray(self._width)
+        return [0] * self._width
+
+    def _age(self) -> None:
+        """Halve all counters. This is O(width) but only happens once every
+        sample_size additions.
+        """
+        for row in self._rows:
+            if self._compact:
+                row[:] = row.translate(_HALVE)
+            else:
+                row[:] = [c >> 1 for c in row]
+        self._additions //= 2
+
+
+class LRUPolicy:
+    """Evicts the least recently used key.
+    """
+
+    def __init__(self):
+        self._keys: OrderedDict[str, None] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def insert(self, key: str) -> None:
+        self._keys[key] = None
+        self._keys.move_to_end(key)
+
+    def access(self, key: str) -> None:
+        if key in self._keys:
+            self._keys.move_to_end(key)
+
+    def remove(self, key: str) -> None:
+        self._keys.pop(key, None)
+
+    def evict(self) -> str:
+        key, _ = self._keys.popitem(last=False)
+        return key
+
+    def clear(self) -> None:
+        self._keys.clear()
+
+
+class _FrequencyBucket:
+    __slots__ = ('count', 'keys', 'prev', 'next')
+
+    def __init__(self, count: int):
+        self.count = count
+        self.keys: OrderedDict[str, None] = OrderedDict()
+        self.prev: _FrequencyBucket | None = None
+        self.next: _FrequencyBucket | None = None
+
+
+class LFUPolicy:
+    """Evicts the least frequently used key, breaking ties by recency.
+
+    Keys are kept in a linked list of frequency buckets so that every
+    operation is O(1).
+    """
+
+    def __init__(self):
+        self._buckets: dict[str, _FrequencyBucket] = {}
+        self._head: _FrequencyBucket | None = None
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def insert(self, key: str) -> None:
+        if key in self._buckets:
+            self.access(key)
+            return
+
+        head = self._head
+        if head is None or head.count != 1:
+            head = self._link(1, None, head)
+        head.keys[key] = None
+        self._buckets[key] = head
+
+    def access(self, key: str) -> None:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return
+
+        next_bucket = bucket.next
+        if next_bucket is None or next_bucket.count != bucket.count + 1:
+            next_bucket = self._link(bucket.count + 1, bucket, next_bucket)
+
+        del bucket.keys[key]
+        next_bucket.keys[key] = None
+        self._buckets[key] = next_bucket
+        if not bucket.keys:
+            self._unlink(bucket)
+
+    def remove(self, key: str) -> None:
+        bucket = self._buckets.pop(key, None)
+        if bucket is None:
+            return
+
+        del bucket.keys[key]
+        if not bucket.keys:
+            self._unlink(bucket)
+
+    def evict(self) -> str:
+        bucket = self._head
+        if bucket is None:
+            raise KeyError('evict from an empty policy')
+
+        key, _ = bucket.keys.popitem(last=False)
+        del self._buckets[key]
+        if not bucket.keys:
+            self._unlink(bucket)
+        return key
+
+    def clear(self) -> None:
+        self._buckets.clear()
+        self._head = None
+
+    def _link(self, count, prev, next):
+        bucket = _FrequencyBucket(count)
+        bucket.prev = prev
+        bucket.next = next
+        if prev is None:
+            self._head = bucket
+        else:
+            prev.next = bucket
+        if next is not None:
+            next.prev = bucket
+        return bucket
+
+    def _unlink(self, bucket):
+        if bucket.prev is None:
+            self._head = bucket.next
+        else:
+            bucket.prev.next = bucket.next
+        if bucket.next is not None:
+            bucket.next.prev = bucket.prev
+
+
+class TinyLFUPolicy:
+    """W-TinyLFU: a small LRU admission window in front of a segmented LRU
+    main space. A key leaving the window is only admitted into the main
+    space if a frequency sketch says it is more popular than the main
+    space's own victim.
+
+    :param capacity: The expected number of entries, used to size the sketch.
+    :param window_ratio: The share of entries kept in the admission window.
+    :param protected_ratio: The share of the main space reserved for keys
+        that have been hit at least twice.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 1024,
+        window_ratio: float = 0.01,
+        protected_ratio: float = 0.8
+    ):
+        # Four counters per entry keeps collisions rare; the counters are
+        # aged every ten entries' worth of traffic, as in Caffeine.
+        self._sketch = CountMinSketch(
+            width=max(64, 4 * capacity),
+            max_count=15,
+            sample_size=10 * max(16, capacity)
+        )
+        self._window_ratio = window_ratio
+        self._protected_ratio = protected_ratio
+        self._window: OrderedDict[str, None] = OrderedDict()
+        self._probation: OrderedDict[str, None] = OrderedDict()
+        self._protected: OrderedDict[str, None] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._window) + len(self._probation) + len(self._protected)
+
+    def insert(self, key: str) -> None:
+        if key in self._window or key in self._probation or key in self._protected:
+            self.access(key)
+            return
+
+        self._sketch.add(key)
+        self._window[key] = None
+
+    def access(self, key: str) -> None:
+        self._sketch.add(key)
+        if key in self._window:
+            self._window.move_to_end(key)
+
+        elif key in self._probation:
+            del self._probation[key]
+            self._protected[key] = None
+            main_size = len(self._probation) + len(self._protected)
+            if len(self._protected) > self._protected_ratio * main_size:
+                demoted, _ = self._protected.popitem(last=False)
+                self._probation[demoted] = None
+
+        elif key in self._protected:
+            self._protected.move_to_end(key)
+
+    def remove(self, key: str) -> None:
+        self._window.pop(key, None)
+        self._probation.pop(key, None)
+        self._protected.pop(key, None)
+
+    def evict(self) -> str:
+        limit = max(1, int(len(self) * self._window_ratio))
+
+        # While the cache was filling up, keys overflowed the window without
+        # any competition. Move them into the main space now; each key is
+        # only ever moved once so this is amortized O(1).
+        while len(self._window) > limit + 1:
+            key, _ = self._window.popitem(last=False)
+            self._probation[key] = None
+
+        if len(self._window) > limit:
+            candidate, _ = self._window.popitem(last=False)
+            victim = self._main_victim()
+            if victim is None:
+                return candidate
+
+            if self._sketch.estimate(candidate) > self._sketch.estimate(victim):
+                self.remove(victim)
+                self._probation[candidate] = None
+                return victim
+
+            return candidate
+
+        victim = self._main_victim()
+        if victim is None:
+            victim, _ = self._window.popitem(last=False)
+            return victim
+
+        self.remove(victim)
+        return victim
+
+    def clear(self) -> None:
+        self._sketch.clear()
+        self._window.clear()
+        self._probation.clear()
+        self._protected.clear()
+
+    def _main_victim(self) -> str | None:
+        for segment in (self._probation, self._protected):
+            if segment:
+                return next(iter(segment))
+        return None
+
+
+def make_policy(policy: str | EvictionPolicy, capacity: int | None = None) -> EvictionPolicy:
+    """Returns an eviction policy.
+
+    :param policy: One of 'lru', 'lfu' or 'tinylfu', or a policy instance.
+    :param capacity: The maximum number of entries, if known.
+    :returns: An eviction policy.
+    """
+    if not isinstance(policy, str):
+        return policy
+
+    if policy == 'lru':
+        return LRUPolicy()
+
+    if policy == 'lfu':
+        return LFUPolicy()
+
+    if policy == 'tinylfu':
+        return TinyLFUPolicy(capacity or 1024)
+
+    raise ValueError(f"Unknown eviction policy '{policy}'.")
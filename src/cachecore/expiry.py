@@ -0,0 +1,74 @@
+import heapq
+import threading
+import typing as t
+import weakref
+
+
+class ExpiryIndex:
+    """A min-heap of (expires_at, key) pairs.
+
+    Entries are never updated in place. When a key's expiry changes a new
+    pair is pushed, so callers must check popped pairs against the live
+    value and skip the ones that are stale.
+    """
+
+    def __init__(self):
+        self._heap: list[tuple[float, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def push(self, key: str, expires_at: float) -> None:
+        heapq.heappush(self._heap, (expires_at, key))
+
+    def pop_expired(self, now: float) -> tuple[float, str] | None:
+        """Pop the earliest pair if it has expired.
+
+        :param now: The current timestamp.
+        :returns: An (expires_at, key) pair, or None.
+        """
+        heap = self._heap
+        if heap and heap[0][0] <= now:
+            return heapq.heappop(heap)
+        return None
+
+    def rebuild(self, pairs: t.Iterable[tuple[float, str]]) -> None:
+        """Replace the contents of the index, dropping stale pairs.
+
+        :param pairs: An iterable of (expires_at, key) pairs.
+        """
+        self._heap = list(pairs)
+        heapq.heapify(self._heap)
+
+    def clear(self) -> None:
+        self._heap.clear()
+
+
+class Sweeper(threading.Thread):
+    """A daemon thread that periodically calls `sweep` on a cache.
+
+    Only a weak reference to the cache is held so the thread does not keep
+    it alive; the thread exits once the cache is garbage collected.
+
+    :param cache: An object with a `sweep(budget=...)` method.
+    :param interval: The number of seconds between sweeps.
+    :param budget: The maximum number of seconds each sweep may take.
+    """
+
+    def __init__(self, cache: t.Any, interval: float, budget: float):
+        super().__init__(name='cachecore-sweeper', daemon=True)
+        self._cache = weakref.ref(cache)
+        self._interval = interval
+        self._budget = budget
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self._stopped.wait(self._interval):
+            cache = self._cache()
+            if cache is None:
+                return
+            cache.sweep(budget=self._budget)
+            del cache
+
+    def stop(self) -> None:
+        self._stopped.set()
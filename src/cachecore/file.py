@@ -1,17 +1,173 @@
 from base64 import b32encode, b32decode
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+from hashlib import blake2b
+import mmap
+import os
 from pathlib import Path
-import pickle
-from struct import pack, unpack
+import random
+import sqlite3
+from struct import Struct, error as StructError
+import threading
+import time
+
+from .base import _MISSING, BaseCache, _is_reserved
+from .serializers import tagged_serializer
+from .utils import ttl_to_exptime, ttl_remaining, is_expired, KEEP_TTL, \
+    chunked, iter_pairs, map_in_context
+
+
+class _Index:
+    """A SQLite table of key -> expires_at kept next to the cache files, so
+    that metadata lookups don't have to open the value files.
+
+    :param path: The path of the database file.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, expires_at REAL)'
+        )
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS entries_expires_at ON entries (expires_at)'
+        )
+
+    def _conn(self):
+        # SQLite connections can't be shared between threads.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        """Returns a 2-tuple of exists and expires_at.
+        """
+        row = self._conn().execute(
+            'SELECT expires_at FROM entries WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return False, None
+        return True, row[0]
+
+    def set(self, key, expires_at):
+        self._conn().execute(
+            'INSERT OR REPLACE INTO entries (key, expires_at) VALUES (?, ?)',
+            (key, expires_at)
+        )
+
+    def delete(self, key, expires_at=KEEP_TTL):
+        """Delete the key. If expires_at is given, the key is only deleted if
+        it hasn't been updated since.
+
+        :returns: True, if the key was deleted, else False.
+        """
+        if expires_at is KEEP_TTL:
+            cursor = self._conn().execute(
+                'DELETE FROM entries WHERE key = ?', (key,)
+            )
+        else:
+            cursor = self._conn().execute(
+                'DELETE FROM entries WHERE key = ? AND expires_at = ?',
+                (key, expires_at)
+            )
+        return cursor.rowcount > 0
+
+    def keys(self, now):
+        rows = self._conn().execute(
+            'SELECT key FROM entries WHERE expires_at IS NULL OR expires_at > ?',
+            (now,)
+        )
+        return [key for key, in rows]
+
+    def expired(self, now, limit=-1):
+        """Returns a list of (key, expires_at) pairs that have expired.
+        """
+        rows = self._conn().execute(
+            'SELECT key, expires_at FROM entries WHERE expires_at <= ? LIMIT ?',
+            (now, limit)
+        )
+        return rows.fetchall()
+
+    def clear(self):
+        self._conn().execute('DELETE FROM entries')
+
 
-from .base import BaseCache
-from .utils import ttl_to_exptime, ttl_remaining, is_expired, KEEP_TTL
+# Every file starts with a magic number, the format version, and then
+# expires_at and stale_at, 0.0 meaning never. Files with any other header,
+# e.g. from an older version, are deleted when found.
+_MAGIC = b'\xccCF'
+_VERSION = 1
+_HEADER = Struct('<3sBdd')
+_EXPIRES_AT = Struct('<d')
+_EXPIRES_AT_OFFSET = 4
+
+# Culling stops once usage is back under this share of the limits, so that
+# it doesn't run again on the very next write.
+_CULL_TARGET = 0.9
+# The maximum number of expired index rows handled by each cull.
+_CULL_BATCH = 256
+# Temporary files older than this many seconds were left by a writer that
+# crashed before renaming them, and are deleted by clear() and cull().
+_TMP_GRACE = 3600
+_TMP_SUFFIX = '.tmp'
 
 
 class FileCache(BaseCache):
 
-    serializer = pickle
+    serializer = tagged_serializer
+
+    # The maximum number of keys handed to the thread pool at once.
+    batch_size = 1000
+
+    def __init__(
+        self,
+        dir,
+        ext='.cachecore',
+        levels=2,
+        fsync=False,
+        index=False,
+        max_bytes=None,
+        max_files=None,
+        cull_sample=4,
+        serializer=None,
+        mmap_threshold=None,
+        batch_workers=8
+    ):
+        """
+        :param dir: The cache directory.
+        :param ext: The extension of cache files.
+        :param levels: The number of levels of hashed subdirectories, each
+            with up to 256 entries, that cache files are spread across.
+            Files left in the top directory by a flat layout are moved into
+            the subdirectories when the cache is opened.
+        :param fsync: True, if writes should be flushed to disk before they
+            become visible, so that they survive a power failure.
+        :param index: True, if expiry times should also be kept in a SQLite
+            index. exists(), get_ttl(), iteration and sweep() then consult
+            the index instead of opening files. Files written without going
+            through the index are not seen until rebuild_index() is called.
+        :param max_bytes: The maximum total size of the cache files.
+        :param max_files: The maximum number of cache files.
+        :param cull_sample: The number of directories examined each time the
+            cache has to be culled. Within them, expired files are deleted
+            first and then the least recently read ones.
+        :param serializer: Overrides the class's serializer.
+        :param mmap_threshold: If set, files of at least this many bytes are
+            memory-mapped and the serializer is given a memoryview of the
+            value instead of a copy. Use with a serializer that accepts
+            memoryviews, e.g. Pickle5Serializer.
+        :param batch_workers: The number of threads get_many(), set_many()
+            and delete_many() spread their files across.
+        """
+        if serializer is not None:
+            self.serializer = serializer
 
-    def __init__(self, dir, ext='.cachecore'):
         self._dir = Path(dir)
         if not self._dir.is_absolute():
             self._dir = self._dir.resolve()
@@ -21,40 +177,68 @@ class FileCache(BaseCache):
 
         self._mkdir()
         self._ext = ext
+        self._levels = levels
+        self._fsync = fsync
+        self._mmap_threshold = mmap_threshold
+        self._batch_workers = batch_workers
+        self._dirname = str(self._dir)
+
+        self._index = None
+        if index:
+            self._index = _Index(os.path.join(self._dirname, '.index.sqlite3'))
+
+        self._max_bytes = max_bytes
+        self._max_files = max_files
+        self._cull_sample = cull_sample
+        self._limited = max_bytes is not None or max_files is not None
+
+        # A running [files, bytes] tally for this process, so that the
+        # directory is only walked once.
+        self._usage = [0, 0]
+        self._usage_lock = threading.Lock()
+        self._migrate()
+        if self._limited:
+            self._measure()
 
     def __getitem__(self, key):
         path = self._key_to_path(key)
-        exists, _, value = self._read(path, incval=True)
+        exists, _, _, value = self._read(path, incval=True)
         if not exists:
             raise KeyError(key)
         return value
 
     def __setitem__(self, key, value):
-        path = self._key_to_path(key)
-        self._write(path, value, None)
+        self._put(key, value, None)
 
     def __delitem__(self, key):
         if not self.exists(key):
             raise KeyError(key)
 
+        if self._index is not None:
+            self._index.delete(key)
+
         path = self._key_to_path(key)
-        try:
-            path.unlink()
-        except FileNotFoundError:
+        if not self._unlink(path):
             raise KeyError(key)
 
     def __contains__(self, key):
-        path = self._key_to_path(key)
-        exists, _, _ = self._read(path)
+        exists, _ = self._stat(key)
         return exists
 
     def __iter__(self):
-        for path in self._iterdir():
-            exists, _, _ = self._read(path)
+        if self._index is not None:
+            for key in self._index.keys(time.time()):
+                if not _is_reserved(key):
+                    yield key
+            return
+
+        for entry in self._iterdir():
+            exists, _, _, _ = self._read(entry.path)
             if not exists:
                 continue
-            fname = path.name.rstrip(self._ext)
-            yield b32decode(fname).decode()
+            key = self._name_to_key(entry.name)
+            if not _is_reserved(key):
+                yield key
 
     def _mkdir(self):
         """Create the directory if it doesn/t exist.
@@ -63,113 +247,557 @@ class FileCache(BaseCache):
             self._dir.mkdir()
 
     def _iterdir(self):
-        """Returns a generator of Path objects.
-        :returns: A generator of Path objects.
+        """Returns a generator of os.DirEntry objects for the cache files.
+        :returns: A generator of os.DirEntry objects.
         """
-        for path in self._dir.iterdir():
-            if not path.is_file():
+        return self._scandir(self._dirname, self._levels)
+
+    def _scandir(self, dirname, depth, suffix=None):
+        """Yields the cache files `depth` levels of subdirectories below
+        dirname, or at any depth if depth is None.
+
+        :param suffix: Yield the files ending with this instead.
+        """
+        suffix = suffix or self._ext
+        try:
+            entries = os.scandir(dirname)
+        except FileNotFoundError:
+            return
+
+        # DirEntry.is_dir() and is_file() use the type returned by the
+        # directory listing, so no stat() call is made per entry.
+        with entries:
+            for entry in entries:
+                if depth != 0 and len(entry.name) == 2 and entry.is_dir(follow_symlinks=False):
+                    yield from self._scandir(entry.path, None if depth is None else depth - 1, suffix)
+                    continue
+
+                if depth:
+                    continue
+
+                if entry.name.endswith(suffix) and entry.is_file(follow_symlinks=False):
+                    yield entry
+
+    def _migrate(self):
+        """Move cache files from the top directory, where a flat layout keeps
+        them, into the hashed subdirectories.
+        """
+        if not self._levels:
+            return
+
+        for entry in self._scandir(self._dirname, 0):
+            try:
+                path = self._key_to_path(self._name_to_key(entry.name))
+            except ValueError:
                 continue
 
-            if not path.name.endswith(self._ext):
+            if os.path.exists(path):
+                # A newer value was already written with this layout.
+                self._unlink(entry.path)
                 continue
 
-            yield path
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                os.replace(entry.path, path)
+            except FileNotFoundError:
+                pass
 
     def _key_to_path(self, key):
-        """Convert the key into a Path object.
+        """Convert the key into a file path.
 
         :param key: The key.
-        :returns: A Path object.
+        :returns: The path as a string.
+        """
+        kb = key.encode()
+        fname = b32encode(kb).decode() + self._ext
+        if not self._levels:
+            return os.path.join(self._dirname, fname)
+
+        digest = blake2b(kb, digest_size=self._levels).hexdigest()
+        parts = (digest[i:i + 2] for i in range(0, 2 * self._levels, 2))
+        return os.path.join(self._dirname, *parts, fname)
+
+    def _name_to_key(self, name):
+        return b32decode(name[:-len(self._ext)]).decode()
+
+    def _stat(self, key):
+        """Returns a 2-tuple of exists and expires_at without reading the value.
         """
-        fname = b32encode(key.encode()).decode()
-        fname += self._ext
-        return self._dir / fname
+        if self._index is None:
+            exists, expires_at, _, _ = self._read(self._key_to_path(key))
+            return exists, expires_at
+
+        exists, expires_at = self._index.get(key)
+        if exists and is_expired(expires_at):
+            self._remove(key, expires_at)
+            return False, None
+        return exists, expires_at
 
     def _read(self, path, incval=False):
         """Reads data from the file.
 
         :param path: The path to read.
         :param incval: True, if the value should be read, else False
-        :returns: A 3-tuple of exists, expires_at, and value.
+        :returns: A 4-tuple of exists, expires_at, stale_at and value.
         """
-        if not path.exists():
-            return False, None, None
+        # Unbuffered, so that reading the header doesn't read the value.
+        try:
+            f = open(path, 'rb', buffering=0)
+        except FileNotFoundError:
+            return False, None, None, None
+
+        with f:
+            exists, expires_at, stale_at = self._read_header(path, f)
+            if not exists or not incval:
+                return exists, expires_at, stale_at, None
+
+            if self._limited:
+                # Culling evicts by access time, which many file systems
+                # only update lazily, if at all.
+                os.utime(f.fileno())
+
+            try:
+                value = self._load(f)
+            except Exception:
+                # Serializers raise all sorts of errors on a truncated or
+                # foreign payload. The file will never become readable, so
+                # treat it the same as a missing one.
+                self._discard(path, f)
+                return False, None, None, None
+            return True, expires_at, stale_at, value
+
+    def _load(self, f):
+        """Deserialize the value of an open file positioned after the header.
+        """
+        threshold = self._mmap_threshold
+        if threshold is None or os.fstat(f.fileno()).st_size < threshold:
+            return self.serializer.loads(f.read())
+
+        # Files are replaced rather than rewritten, so the mapping stays valid
+        # for as long as the value refers to it.
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mm)[_HEADER.size:]
+        value = self.serializer.loads(view)
+        try:
+            view.release()
+            mm.close()
+        except BufferError:
+            # The value holds views of the mapping; it is closed once they
+            # are garbage collected.
+            pass
+        return value
 
-        with path.open('rb') as f:
-            expires_at = unpack('d', f.read(8))[0]
-            if expires_at == 0.0:
-                expires_at = None
+    def _read_header(self, path, f):
+        """Reads the header of an open file, deleting the file if it expired
+        or isn't a cache file of this version.
 
-            if is_expired(expires_at):
-                f.close()
-                path.unlink(missing_ok=True)
-                return False, None, None
+        :returns: A 3-tuple of exists, expires_at and stale_at.
+        """
+        try:
+            magic, version, expires_at, stale_at = _HEADER.unpack(f.read(_HEADER.size))
+        except StructError:
+            magic = version = None
 
-            if not incval:
-                return True, expires_at, None
+        if magic != _MAGIC or version != _VERSION:
+            # Files are replaced whole, so this one will never become valid.
+            self._discard(path, f)
+            return False, None, None
 
-            value = self.serializer.loads(f.read())
-            return True, expires_at, value
+        expires_at = expires_at or None
+        if is_expired(expires_at):
+            self._discard(path, f)
+            return False, None, None
 
-    def _write(self, path, value, expires_at):
+        return True, expires_at, stale_at or None
+
+    def _put(self, key, value, expires_at, stale_at=None):
+        self._write(self._key_to_path(key), value, expires_at, stale_at)
+        if self._index is not None:
+            self._index.set(key, expires_at)
+
+    def _write(self, path, value, expires_at, stale_at=None):
         """Write data to the file.
 
-        :param path: A Path object.
+        :param path: The path of the file.
         :param value: The value to write to the file.
         :param expires_at: A timestamp of the expiration time.
+        :param stale_at: A timestamp after which the value should be refreshed.
+        """
+
+        # Serializers that return buffers separately spare a copy of them.
+        dumps_buffers = getattr(self.serializer, 'dumps_buffers', None)
+        if dumps_buffers is not None:
+            parts = dumps_buffers(value)
+        else:
+            parts = [self.serializer.dumps(value)]
+
+        old_size = None
+        if self._limited:
+            try:
+                old_size = os.stat(path).st_size
+            except FileNotFoundError:
+                pass
+
+        # Write to a temporary file in the same directory and rename it over
+        # the destination, so that readers in other processes only ever see
+        # a complete file. Temporary files don't end with the extension, so
+        # they are never mistaken for entries.
+        dirname, fname = os.path.split(path)
+        tmp_path = os.path.join(dirname, f'.{fname}.{os.urandom(6).hex()}.tmp')
+        while True:
+            try:
+                f = open(tmp_path, 'xb')
+                break
+            except FileNotFoundError:
+                # Subdirectories are created lazily, on the first write to
+                # them, and culling may remove them again once empty.
+                os.makedirs(dirname, exist_ok=True)
+
+        try:
+            with f:
+                f.write(_HEADER.pack(_MAGIC, _VERSION, expires_at or 0.0, stale_at or 0.0))
+                f.writelines(parts)
+                if self._fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+        if self._fsync:
+            fd = os.open(dirname, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+        if self._limited:
+            size = _HEADER.size + sum(memoryview(part).nbytes for part in parts)
+            if old_size is None:
+                self._track(1, size)
+            else:
+                self._track(0, size - old_size)
+
+            while self._over_limit():
+                if not self.cull():
+                    # Other processes deleted files behind this one's back.
+                    self._measure()
+                    break
+
+    @cached_property
+    def _executor(self):
+        return ThreadPoolExecutor(self._batch_workers, thread_name_prefix='cachecore-file')
+
+    def _map(self, fn, items):
+        """Apply fn to every item, in the thread pool if there is more than
+        one item.
         """
-        with path.open('wb') as f:
-            if expires_at is None:
-                expires_at = 0.0
+        items = list(items)
+        if len(items) < 2 or self._batch_workers < 2:
+            return [fn(item) for item in items]
+
+        results = []
+        for chunk in chunked(items, self.batch_size):
+            results.extend(map_in_context(self._executor, fn, chunk))
+        return results
+
+    def close(self):
+        """Shut down the thread pool used by batch operations.
+        """
+        executor = self.__dict__.pop('_executor', None)
+        if executor is not None:
+            executor.shutdown()
+
+    def get_many(self, keys, default=None):
+        return iter(self._map(lambda k: self.get(k, default), keys))
 
-            f.write(pack('d', expires_at))
-            f.write(self.serializer.dumps(value))
+    def set_many(self, mapping, ttl=None):
+        expires_at = ttl_to_exptime(ttl)
+        self._map(lambda item: self._put(*item, expires_at), iter_pairs(mapping))
+
+    def delete_many(self, keys):
+        return iter(self._map(self.delete, keys))
 
     def set(self, key, value, ttl=None):
-        path = self._key_to_path(key)
         expires_at = ttl_to_exptime(ttl)
-        self._write(path, value, expires_at)
+        self._put(key, value, expires_at)
+
+    def _get_fresh(self, key, ttl, soft_ttl):
+        exists, _, stale_at, value = self._read(self._key_to_path(key), incval=True)
+        if not exists:
+            return _MISSING, False
+        return value, stale_at is not None and time.time() >= stale_at
+
+    def _set_fresh(self, key, value, ttl, soft_ttl):
+        self._put(key, value, ttl_to_exptime(ttl), ttl_to_exptime(soft_ttl))
 
     def replace(self, key, value, ttl=KEEP_TTL):
-        path = self._key_to_path(key)
-        exists, expires_at, _ = self._read(path)
+        # The header is read even with an index, for the soft deadline.
+        exists, expires_at, stale_at, _ = self._read(self._key_to_path(key))
         if not exists:
             return False
 
         if ttl is not KEEP_TTL:
+            # A new TTL replaces the soft deadline too.
             expires_at = ttl_to_exptime(ttl)
+            stale_at = None
 
-        self._write(path, value, expires_at)
+        self._put(key, value, expires_at, stale_at)
         return True
 
     def get_ttl(self, key, default=0):
-        path = self._key_to_path(key)
-        exists, expires_at, _ = self._read(path)
+        exists, expires_at = self._stat(key)
         if not exists:
             return default
         return ttl_remaining(expires_at)
 
     def set_ttl(self, key, ttl=None):
         path = self._key_to_path(key)
-        exists, _, value = self._read(path, incval=True)
-        if not exists:
+        try:
+            f = open(path, 'r+b', buffering=0)
+        except FileNotFoundError:
             return False
+
+        # Patch the header in place rather than rewriting the value.
         expires_at = ttl_to_exptime(ttl)
-        self._write(path, value, expires_at)
+        with f:
+            exists, _, _ = self._read_header(path, f)
+            if not exists:
+                return False
+
+            os.pwrite(f.fileno(), _EXPIRES_AT.pack(expires_at or 0.0), _EXPIRES_AT_OFFSET)
+            if self._fsync:
+                os.fsync(f.fileno())
+
+        if self._index is not None:
+            self._index.set(key, expires_at)
         return True
 
     def incr(self, key, delta=1):
         path = self._key_to_path(key)
-        exists, expires_at, value = self._read(path, incval=True)
+        exists, expires_at, stale_at, value = self._read(path, incval=True)
 
         if not exists:
             value = 0
-            expires_at = None
+            expires_at = stale_at = None
 
         value += delta
-        self._write(path, value, expires_at)
+        self._put(key, value, expires_at, stale_at)
         return value
 
+    def sweep(self, limit=None):
+        """Delete expired files.
+
+        :param limit: The maximum number of files to delete.
+        :returns: The number of files deleted.
+        """
+        if self._index is None:
+            removed = 0
+            for entry in self._iterdir():
+                if limit is not None and removed >= limit:
+                    break
+                exists, _, _, _ = self._read(entry.path)
+                if not exists:
+                    removed += 1
+            return removed
+
+        expired = self._index.expired(time.time(), -1 if limit is None else limit)
+        return sum(self._remove(key, expires_at) for key, expires_at in expired)
+
+    def cull(self):
+        """Delete expired files and then the least recently read ones until
+        usage is back under 90% of the limits, examining at most
+        `cull_sample` directories.
+
+        :returns: The number of files deleted.
+        """
+        removed = 0
+        if self._index is not None:
+            removed += self.sweep(limit=_CULL_BATCH)
+
+        candidates = []
+        visited = set()
+        # Empty directories don't count towards the sample; they are removed
+        # so that later samples are less likely to hit them.
+        for _ in range(4 * self._cull_sample):
+            if len(visited) >= self._cull_sample or not self._over_limit(_CULL_TARGET):
+                break
+
+            dirname = self._random_leaf()
+            if dirname is None or dirname in visited:
+                continue
+
+            self._sweep_tmp(dirname, 0)
+            for entry in self._scandir(dirname, 0):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+
+                visited.add(dirname)
+
+                if self._index is None:
+                    # Reading the header deletes the file if it expired.
+                    exists, _, _, _ = self._read(entry.path)
+                    if not exists:
+                        removed += 1
+                        continue
+
+                candidates.append((stat.st_atime, entry.path, entry.name, stat.st_size))
+
+            if dirname not in visited:
+                self._prune(dirname)
+
+        candidates.sort()
+        for _, path, name, size in candidates:
+            if not self._over_limit(_CULL_TARGET):
+                break
+
+            if self._index is not None:
+                self._index.delete(self._name_to_key(name))
+            if self._unlink(path, size):
+                removed += 1
+        return removed
+
+    def _random_leaf(self):
+        """Returns a random directory that cache files are stored in, or None.
+        """
+        dirname = self._dirname
+        for _ in range(self._levels):
+            try:
+                with os.scandir(dirname) as entries:
+                    subdirs = [
+                        entry.path for entry in entries
+                        if len(entry.name) == 2 and entry.is_dir(follow_symlinks=False)
+                    ]
+            except FileNotFoundError:
+                return None
+
+            if not subdirs:
+                self._prune(dirname)
+                return None
+            dirname = random.choice(subdirs)
+        return dirname
+
+    def _sweep_tmp(self, dirname, depth):
+        """Delete the temporary files that crashed writers left behind,
+        once they are older than _TMP_GRACE.
+        """
+        deadline = time.time() - _TMP_GRACE
+        for entry in self._scandir(dirname, depth, _TMP_SUFFIX):
+            if not entry.name.startswith('.'):
+                continue
+            try:
+                if entry.stat().st_mtime < deadline:
+                    os.unlink(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def _prune(self, dirname):
+        """Remove an empty subdirectory.
+        """
+        if dirname == self._dirname:
+            return
+        try:
+            os.rmdir(dirname)
+        except OSError:
+            pass
+
+    def _measure(self):
+        """Reset the usage tally from the files on disk.
+        """
+        files = nbytes = 0
+        for entry in self._iterdir():
+            try:
+                nbytes += entry.stat().st_size
+            except FileNotFoundError:
+                continue
+            files += 1
+
+        with self._usage_lock:
+            self._usage[:] = [files, nbytes]
+
+    def _track(self, files, nbytes):
+        with self._usage_lock:
+            self._usage[0] += files
+            self._usage[1] += nbytes
+
+    def _over_limit(self, ratio=1.0):
+        files, nbytes = self._usage
+        if self._max_files is not None and files > self._max_files * ratio:
+            return True
+        return self._max_bytes is not None and nbytes > self._max_bytes * ratio
+
+    def rebuild_index(self):
+        """Rebuild the index from the files on disk.
+        """
+        if self._index is None:
+            return
+
+        self._index.clear()
+        for entry in self._iterdir():
+            exists, expires_at, _, _ = self._read(entry.path)
+            if exists:
+                self._index.set(self._name_to_key(entry.name), expires_at)
+
+    def _remove(self, key, expires_at):
+        """Delete an expired key from the index and disk, unless it was
+        updated since the index was read.
+
+        :returns: True, if the key was deleted, else False.
+        """
+        if not self._index.delete(key, expires_at):
+            return False
+        self._unlink(self._key_to_path(key))
+        return True
+
+    def _discard(self, path, f):
+        """Delete an expired or unreadable file, unless another process has
+        already replaced it with a fresh one.
+
+        :param path: The path of the file.
+        :param f: The open file that was found to be expired or unreadable.
+        """
+        opened = os.fstat(f.fileno())
+        try:
+            current = os.stat(path)
+        except FileNotFoundError:
+            return
+
+        if (current.st_dev, current.st_ino) == (opened.st_dev, opened.st_ino):
+            self._unlink(path, opened.st_size)
+
+    def _unlink(self, path, size=None):
+        """Delete a file.
+
+        :param path: The path of the file.
+        :param size: The size of the file, if already known.
+        :returns: True, if the file was deleted, else False.
+        """
+        if self._limited and size is None:
+            try:
+                size = os.stat(path).st_size
+            except FileNotFoundError:
+                return False
+
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            return False
+
+        if self._limited:
+            self._track(-1, -size)
+        return True
+
     def clear(self):
-        for path in self._iterdir():
-            path.unlink(missing_ok=True)
+        if self._index is not None:
+            self._index.clear()
+
+        # Files at any depth are removed, in case the layout changed.
+        for entry in self._scandir(self._dirname, None):
+            self._unlink(entry.path)
+        self._sweep_tmp(self._dirname, None)
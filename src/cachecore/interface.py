@@ -103,10 +103,10 @@ class CacheInterface(t.Protocol):
         """
         ...
 
-    def set_many(self, mapping: t.Iterable[tuple[str, t.Any]], ttl: int | None = None):
+    def set_many(self, mapping: t.Mapping[str, t.Any] | t.Iterable[tuple[str, t.Any]], ttl: int | None = None):
         """Stores the mapping of key value pairs.
 
-        :param mapping: An iterable of key, value tuples.
+        :param mapping: A mapping, or an iterable of key, value tuples.
         :param ttl: The time-to-live.
         """
         ...
@@ -157,7 +157,218 @@ class CacheInterface(t.Protocol):
         """
         ...
 
+    def get_or_set(
+        self,
+        key: str,
+        fn: t.Callable[[], t.Any],
+        ttl: int | None = None,
+        beta: float = 1.0,
+        lock_timeout: float = 10.0,
+        soft_ttl: int | None = None
+    ) -> t.Any:
+        """Returns the value associated with the key, computing and storing
+        it if the key does not exist. Concurrent callers in this process
+        wait for a single computation; caches shared between processes also
+        hold a lock in the cache while computing. Values are recomputed
+        early, with a probability that grows as they near expiry (XFetch).
+
+        :param key: The key.
+        :param fn: A function computing the value.
+        :param ttl: The time-to-live of the computed value.
+        :param beta: Scales early recomputation; 0 disables it.
+        :param lock_timeout: The maximum number of seconds to wait for
+            another process computing the value.
+        :param soft_ttl: If given, values older than this are returned
+            as is while they are recomputed in the background, instead of
+            early recomputation. A failed recomputation is ignored, so the
+            stale value is served until `ttl` expires.
+        :returns: The value.
+        """
+        ...
+
     def clear(self):
         """Clears all keys in the cache.
         """
-        ...
\ No newline at end of file
+        ...
+
+@t.runtime_checkable
+class AsyncCacheInterface(t.Protocol):
+    """The asyncio counterpart of CacheInterface. Every method is a
+    coroutine except `keys`, which returns an async iterator.
+    """
+
+    def __aiter__(self) -> t.AsyncIterator[str]:
+        ...
+
+    def keys(self, pattern: str | None = None) -> t.AsyncIterator[str]:
+        """Returns an async iterator of keys that match the pattern.
+
+        :param pattern: The pattern to be matched.
+        :returns: An async iterator of keys that match the pattern.
+        """
+        ...
+
+    async def get(self, key: str, default: t.Any = None) -> t.Any:
+        """Returns the value associated with the key.
+
+        :param key: The key to be retrieved.
+        :param default: The default value if the key is not found.
+        :returns: The value associated with the key.
+        """
+        ...
+
+    async def set(self, key: str, value: t.Any, ttl: int | None = None):
+        """Assign a value to a key.
+
+        :param key: The key to be set.
+        :param value: The value to be stored.
+        :param ttl: The time-to-live. If None, then the value will not expire.
+        """
+        ...
+
+    async def add(self, key: str, value: t.Any, ttl: int | None = None) -> bool:
+        """Set the value only if the key doesn't already exist.
+
+        :param key: The key to be set.
+        :param value: The value to be stored.
+        :param ttl: The time-to-live.
+        :returns: True, if the key was added, else False.
+        """
+        ...
+
+    async def replace(self, key: str, value: t.Any, ttl: int | None = KEEP_TTL) -> bool:
+        """Set the value only if the key already exists.
+
+        :param key: The key to be set.
+        :param value: The value to be stored.
+        :param ttl: The time-to-live. By default, it will keep the ttl.
+        :returns: True, if the key was added, else False.
+        """
+        ...
+
+    async def delete(self, key: str) -> bool:
+        """Delete the key.
+
+        :param key: The key to be deleted.
+        :returns: True, if the key was deleted, else False.
+        """
+        ...
+
+    async def pop(self, key: str, default: t.Any = None):
+        """Deletes the key and returns the associated value.
+
+        :param key: The key to be deleted.
+        :param default: The value to be returned if the key does not exist.
+        :returns: The value associated with the key, or the default.
+        """
+        ...
+
+    async def exists(self, key: str) -> bool:
+        """Returns whether or not the key exists.
+
+        :param key: The key to check.
+        :returns: True, if the key exists, else False.
+        """
+        ...
+
+    async def get_many(self, keys: t.Iterable[str], default: t.Any = None) -> list[t.Any]:
+        """Returns a list of values.
+
+        :param keys: An iterable of keys to retrieve.
+        :param default: A default value in case a key is not found.
+        :returns: A list of values.
+        """
+        ...
+
+    async def set_many(self, mapping: t.Mapping[str, t.Any] | t.Iterable[tuple[str, t.Any]], ttl: int | None = None):
+        """Stores the mapping of key value pairs.
+
+        :param mapping: A mapping, or an iterable of key, value tuples.
+        :param ttl: The time-to-live.
+        """
+        ...
+
+    async def delete_many(self, keys: t.Iterable[str]) -> list[bool]:
+        """Deletes all of the keys in the iterable.
+
+        :param keys: An iterable of keys to be deleted.
+        :returns: A list of boolean values indicating if the key was deleted.
+        """
+        ...
+
+    async def get_ttl(self, key: str, default: int = 0) -> int | None:
+        """Returns the TTL of the key.
+
+        :param key: The key.
+        :param default: The default value to return if the key does not exist.
+        :returns: The time-to-live.
+        """
+        ...
+
+    async def set_ttl(self, key: str, ttl: int | None = None) -> bool:
+        """Sets the TTL of the key.
+
+        :param key: The key.
+        :param ttl: The time-to-live.
+        :returns: True, if the TTL was updated, else False.
+        """
+        ...
+
+    async def incr(self, key, delta=1) -> int:
+        """Increment the value associated with the key.
+        Creates the key if it does not exist.
+
+        :param key: The key.
+        :param delta: The amount to increment.
+        :returns: The amount.
+        """
+        ...
+
+    async def decr(self, key, delta=1) -> int:
+        """Decrement the value associated with the key.
+        Creates the key if it does not exist.
+
+        :param key: The key.
+        :param delta: The amount to decrement.
+        :returns: The amount.
+        """
+        ...
+
+    async def get_or_set(
+        self,
+        key: str,
+        fn: t.Callable[[], t.Any],
+        ttl: int | None = None,
+        beta: float = 1.0,
+        lock_timeout: float = 10.0,
+        soft_ttl: int | None = None
+    ) -> t.Any:
+        """Returns the value associated with the key, computing and storing
+        it if the key does not exist. Concurrent callers in this process
+        wait for a single computation; caches shared between processes also
+        hold a lock in the cache while computing. Values are recomputed
+        early, with a probability that grows as they near expiry (XFetch).
+
+        :param key: The key.
+        :param fn: A function or coroutine function computing the value.
+        :param ttl: The time-to-live of the computed value.
+        :param beta: Scales early recomputation; 0 disables it.
+        :param lock_timeout: The maximum number of seconds to wait for
+            another process computing the value.
+        :param soft_ttl: If given, values older than this are returned
+            as is while they are recomputed in the background, instead of
+            early recomputation. A failed recomputation is ignored, so the
+            stale value is served until `ttl` expires.
+        :returns: The value.
+        """
+        ...
+
+    async def clear(self):
+        """Clears all keys in the cache.
+        """
+        ...
+
+    async def aclose(self):
+        """Release the connections or threads held by the cache.
+        """
+        ...
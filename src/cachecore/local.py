@@ -1,90 +1,451 @@
-import pickle
+from contextlib import nullcontext
+from dataclasses import fields
+import threading
+import time
 import typing as t
 
-from .base import BaseCache
-from .utils import KEEP_TTL, ExpiryValue
+from .base import _MISSING, BaseCache, _is_reserved
+from .eviction import EvictionPolicy, make_policy
+from .expiry import ExpiryIndex, Sweeper
+from .serializers import SerializerInterface, tagged_serializer
+from .utils import KEEP_TTL, CacheStats, ExpiryValue, ttl_to_exptime
+
+
+class _Shard:
+    """A partition of a LocalCache with its own dict, eviction policy,
+    expiry index and lock. Public methods take the lock themselves; it is
+    reentrant so callers may already hold it.
+    """
+
+    def __init__(self, max_entries, max_bytes, policy, sweep_batch, lock):
+        self.data: dict[str, ExpiryValue] = {}
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.stats = CacheStats()
+        self.expiry = ExpiryIndex()
+        self.sweep_batch = sweep_batch
+        self.lock = lock
+
+        # An unbounded cache does not pay for any eviction bookkeeping.
+        self.policy: EvictionPolicy | None = None
+        if max_entries is not None or max_bytes is not None:
+            self.policy = make_policy(policy, max_entries)
+
+    def get(self, key: str, record: bool = False) -> ExpiryValue | None:
+        """Returns the live entry for the key, or None.
+
+        :param key: The key.
+        :param record: True, if the lookup should count as a hit or miss.
+        """
+        with self.lock:
+            expval = self.data.get(key)
+            if expval is not None and expval.is_expired():
+                self._remove(key)
+                self.stats.expirations += 1
+                expval = None
+
+            if expval is None:
+                if record:
+                    self.stats.misses += 1
+                return None
+
+            if record:
+                self.stats.hits += 1
+            if self.policy is not None:
+                self.policy.access(key)
+            return expval
+
+    def store(self, key: str, expval: ExpiryValue) -> None:
+        with self.lock:
+            self.expire(self.sweep_batch)
+            if expval.expires_at is not None:
+                self._index(key, expval.expires_at)
+
+            if self.policy is None:
+                self.data[key] = expval
+                return
+
+            size = self._size(expval)
+            if self.max_bytes is not None and size > self.max_bytes:
+                # The value can never fit, so don't evict everything else for it.
+                self._remove(key)
+                return
+
+            old = self.data.get(key)
+            if old is None:
+                # Make room before the key is tracked, so that it can't be
+                # chosen as the victim of its own insertion.
+                self._evict(1, size)
+                self.policy.insert(key)
+                self.data[key] = expval
+                self.bytes += size
+                return
+
+            self.bytes -= self._size(old)
+            self.policy.access(key)
+            self.data[key] = expval
+            self.bytes += size
+            self._evict()
+
+    def delete(self, key: str) -> bool:
+        with self.lock:
+            expval = self.data.get(key)
+            if expval is None:
+                return False
+            self._remove(key)
+            return not expval.is_expired()
+
+    def set_ttl(self, key: str, ttl: int | None) -> bool:
+        with self.lock:
+            expval = self.get(key)
+            if expval is None:
+                return False
+
+            expval.ttl = ttl
+            if expval.expires_at is not None:
+                self._index(key, expval.expires_at)
+            return True
+
+    def keys(self) -> t.Iterator[str]:
+        with self.lock:
+            items = tuple(self.data.items())
+
+        for k, v in items:
+            if v.is_expired():
+                with self.lock:
+                    # Only remove the entry if it wasn't overwritten meanwhile.
+                    if self.data.get(k) is v:
+                        self._remove(k)
+                continue
+            yield k
+
+    def expire(self, limit: int, deadline: float | None = None) -> int:
+        """Remove up to `limit` expired entries, earliest expiry first.
+
+        :param limit: The maximum number of entries to remove.
+        :param deadline: A time.monotonic() value to stop at.
+        :returns: The number of entries removed.
+        """
+        removed = 0
+        now = time.time()
+        with self.lock:
+            while removed < limit:
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+
+                pair = self.expiry.pop_expired(now)
+                if pair is None:
+                    break
+
+                expires_at, key = pair
+                expval = self.data.get(key)
+                if expval is None or expval.expires_at != expires_at:
+                    continue
+
+                self._remove(key)
+                self.stats.expirations += 1
+                removed += 1
+        return removed
+
+    def clear(self) -> None:
+        with self.lock:
+            self.data.clear()
+            self.expiry.clear()
+            self.bytes = 0
+            if self.policy is not None:
+                self.policy.clear()
+
+    def _remove(self, key: str) -> None:
+        expval = self.data.pop(key, None)
+        if expval is None or self.policy is None:
+            return
+
+        self.policy.remove(key)
+        self.bytes -= self._size(expval)
+
+    def _index(self, key: str, expires_at: float) -> None:
+        """Add the key to the expiry index.
+        """
+        # Every TTL change leaves a stale pair behind, so compact the index
+        # once it is mostly garbage.
+        if len(self.expiry) > 2 * len(self.data) + 64:
+            self.expiry.rebuild(
+                (v.expires_at, k) for k, v in self.data.items()
+                if v.expires_at is not None
+            )
+        self.expiry.push(key, expires_at)
+
+    def _evict(self, entries: int = 0, size: int = 0) -> None:
+        """Evict entries until the shard is within its limits, leaving room
+        for the given number of entries and bytes.
+        """
+        while self._over_limit(entries, size):
+            key = self.policy.evict()
+            expval = self.data.pop(key)
+            self.bytes -= self._size(expval)
+            self.stats.evictions += 1
+
+    def _size(self, expval: ExpiryValue) -> int:
+        # Sizes are only tracked for byte limits, which require serialized
+        # values.
+        if self.max_bytes is None:
+            return 0
+        return len(expval.value)
+
+    def _over_limit(self, entries: int = 0, size: int = 0) -> bool:
+        if self.max_entries is not None and len(self.data) + entries > self.max_entries:
+            return True
+        return self.max_bytes is not None and self.bytes + size > self.max_bytes
+
+
+def _split(limit: int | None, shards: int) -> int | None:
+    if limit is None:
+        return None
+    return -(-limit // shards)
 
 
 class LocalCache(BaseCache):
 
-    serializer = pickle
+    serializer = tagged_serializer
+
+    def __init__(
+        self,
+        max_entries: int | None = None,
+        max_bytes: int | None = None,
+        policy: str | EvictionPolicy = 'lru',
+        sweep_batch: int = 20,
+        sweep_interval: float | None = None,
+        sweep_budget: float = 0.01,
+        thread_safe: bool = False,
+        shards: int = 1,
+        serializer: SerializerInterface | None = None,
+        serialize: bool = True,
+        copier: t.Callable[[t.Any], t.Any] | None = None
+    ):
+        """
+        :param max_entries: The maximum number of entries to hold.
+        :param max_bytes: The maximum total size of the serialized values.
+        :param policy: The eviction policy used once a limit is reached.
+            One of 'lru', 'lfu' or 'tinylfu', or an EvictionPolicy instance.
+        :param sweep_batch: The maximum number of expired entries removed
+            on each write.
+        :param sweep_interval: If set, expired entries are also removed by
+            a background thread every `sweep_interval` seconds.
+        :param sweep_budget: The maximum number of seconds each background
+            sweep may take.
+        :param thread_safe: True, if the cache is shared between threads.
+            Implied by `sweep_interval`.
+        :param shards: The number of partitions, each with its own lock.
+            Limits are split evenly between shards.
+        :param serializer: Overrides the class's serializer.
+        :param serialize: If False, values are stored by reference and the
+            serializer is not used. Mutating a value mutates the cached entry.
+        :param copier: Used with `serialize=False` to copy values as they
+            are read, e.g. copy.deepcopy.
+        """
+        if serializer is not None:
+            self.serializer = serializer
+
+        if not serialize and max_bytes is not None:
+            raise ValueError('max_bytes requires serialized values.')
+
+        if serialize and copier is not None:
+            raise ValueError('A copier can only be used with serialize=False.')
+
+        self._serialize = serialize
+        self._copier = copier
 
-    def __init__(self):
-        self._data: dict[str, ExpiryValue] = {}
+        if shards > 1 and not isinstance(policy, str):
+            raise ValueError('An eviction policy instance cannot be shared between shards.')
+
+        thread_safe = thread_safe or sweep_interval is not None
+        self._thread_safe = thread_safe
+        self._shards = [
+            _Shard(
+                _split(max_entries, shards),
+                _split(max_bytes, shards),
+                policy,
+                sweep_batch,
+                threading.RLock() if thread_safe else nullcontext()
+            )
+            for _ in range(shards)
+        ]
+
+        self._sweeper = None
+        if sweep_interval is not None:
+            self._sweeper = Sweeper(self, sweep_interval, sweep_budget)
+            self._sweeper.start()
 
     def __getitem__(self, key: str) -> t.Any:
-        expval = self._get(key)
+        expval = self._shard(key).get(key, record=True)
         if expval is None:
             raise KeyError(key)
-        return self.serializer.loads(expval.value)
+        return self._loads(expval.value)
 
     def __setitem__(self, key: str, value: t.Any):
-        self._set(key, value)
+        self.set(key, value)
 
     def __delitem__(self, key: str) -> None:
-        self._get(key) # delete key if it has expired.
-        del self._data[key]
+        if not self._shard(key).delete(key):
+            raise KeyError(key)
 
     def __contains__(self, key: str) -> bool:
-        return self._get(key) is not None
+        return self._shard(key).get(key) is not None
 
     def __iter__(self) -> t.Iterable:
-        for k, v in tuple(self._data.items()):
-            if v.is_expired():
-                del self._data[k]
-                continue
-            yield k
+        for shard in self._shards:
+            for key in shard.keys():
+                if not _is_reserved(key):
+                    yield key
 
-    def _get(self, key: str):
-        expval = self._data.get(key)
-        if expval is None:
-            return None
+    def _shard(self, key: str) -> _Shard:
+        shards = self._shards
+        if len(shards) == 1:
+            return shards[0]
+        return shards[hash(key) % len(shards)]
 
-        if expval.is_expired():
-            del self._data[key]
-            return None
+    def _dumps(self, value: t.Any) -> t.Any:
+        if self._serialize:
+            return self.serializer.dumps(value)
+        return value
 
-        return expval
+    def _loads(self, data: t.Any) -> t.Any:
+        if self._serialize:
+            return self.serializer.loads(data)
+        if self._copier is not None:
+            return self._copier(data)
+        return data
 
-    def _set(self, key: str, value: t.Any, ttl: int | None = None) -> None:
-        value = self.serializer.dumps(value)
-        expval = ExpiryValue(value=value)
+    def _make(self, value: t.Any, ttl: int | None) -> ExpiryValue:
+        expval = ExpiryValue(value=self._dumps(value))
         expval.ttl = ttl
-        self._data[key] = expval
+        return expval
+
+    def sweep(self, budget: float | None = None) -> int:
+        """Remove expired entries without scanning the whole cache.
+
+        :param budget: The maximum number of seconds to spend.
+        :returns: The number of entries removed.
+        """
+        deadline = None if budget is None else time.monotonic() + budget
+        removed = 0
+        for shard in self._shards:
+            while True:
+                # Work in small batches so that other threads can get the lock.
+                count = shard.expire(64, deadline)
+                removed += count
+                if count < 64:
+                    break
+        return removed
+
+    def close(self) -> None:
+        """Stop the background sweeper, if there is one.
+        """
+        if self._sweeper is not None:
+            self._sweeper.stop()
+            self._sweeper = None
+
+    def stats(self) -> CacheStats:
+        """Returns a snapshot of the hit, miss, eviction and expiration counters.
+        """
+        stats = CacheStats()
+        for shard in self._shards:
+            with shard.lock:
+                for field in fields(stats):
+                    total = getattr(stats, field.name) + getattr(shard.stats, field.name)
+                    setattr(stats, field.name, total)
+        return stats
+
+    def get(self, key: str, default: t.Any = None) -> t.Any:
+        expval = self._shard(key).get(key, record=True)
+        if expval is None:
+            return default
+        return self._loads(expval.value)
 
     def set(self, key: str, value: t.Any, ttl: int | None = None):
-        self._set(key, value, ttl)
+        expval = self._make(value, ttl)
+        self._shard(key).store(key, expval)
 
-    def replace(self, key: str, value: int | None, ttl: int | None = KEEP_TTL):
-        expval = self._get(key)
+    def _get_fresh(self, key: str, ttl: int | None, soft_ttl: int) -> tuple[t.Any, bool]:
+        expval = self._shard(key).get(key, record=True)
         if expval is None:
-            return False
+            return _MISSING, False
+        return self._loads(expval.value), expval.is_stale()
 
-        expval.value = self.serializer.dumps(value)
-        if ttl is not KEEP_TTL:
-            expval.ttl = ttl
+    def _set_fresh(self, key: str, value: t.Any, ttl: int | None, soft_ttl: int | None) -> None:
+        expval = self._make(value, ttl)
+        expval.stale_at = ttl_to_exptime(soft_ttl)
+        self._shard(key).store(key, expval)
+
+    def add(self, key: str, value: t.Any, ttl: int | None = None) -> bool:
+        expval = self._make(value, ttl)
+        shard = self._shard(key)
+        with shard.lock:
+            if shard.get(key) is not None:
+                return False
+            shard.store(key, expval)
+        return True
+
+    def replace(self, key: str, value: int | None, ttl: int | None = KEEP_TTL):
+        value = self._dumps(value)
+        shard = self._shard(key)
+        with shard.lock:
+            expval = shard.get(key)
+            if expval is None:
+                return False
+
+            new_expval = ExpiryValue(
+                value=value, expires_at=expval.expires_at, stale_at=expval.stale_at
+            )
+            if ttl is not KEEP_TTL:
+                # A new TTL replaces the soft deadline too.
+                new_expval.ttl = ttl
+                new_expval.stale_at = None
+            shard.store(key, new_expval)
         return True
 
+    def delete(self, key: str) -> bool:
+        return self._shard(key).delete(key)
+
+    def pop(self, key: str, default: t.Any = None) -> t.Any:
+        shard = self._shard(key)
+        with shard.lock:
+            expval = shard.get(key)
+            if expval is None:
+                return default
+            shard.delete(key)
+        return self._loads(expval.value)
+
     def get_ttl(self, key: str, default: int = 0) -> int:
-        expval = self._get(key)
+        expval = self._shard(key).get(key)
         if expval is None:
             return default
         return expval.ttl
 
     def set_ttl(self, key: str, ttl: int | None = None) -> bool:
-        expval = self._get(key)
-        if expval is None:
-            return False
-
-        expval.ttl = ttl
-        return True
+        return self._shard(key).set_ttl(key, ttl)
 
     def incr(self, key: str, delta: int = 1) -> int:
-        value = self.get(key, default=0)
-        value += delta
-        if not self.add(key, value):
-            self.replace(key, value)
+        shard = self._shard(key)
+        with shard.lock:
+            expval = shard.get(key)
+            if expval is None:
+                value = delta
+                expires_at = stale_at = None
+            else:
+                value = self._loads(expval.value) + delta
+                expires_at = expval.expires_at
+                stale_at = expval.stale_at
+
+            new_expval = ExpiryValue(
+                value=self._dumps(value),
+                expires_at=expires_at,
+                stale_at=stale_at
+            )
+            shard.store(key, new_expval)
         return value
 
     def clear(self) -> None:
-        self._data.clear()
+        for shard in self._shards:
+            shard.clear()
@@ -1,16 +1,35 @@
-from cachecore.utils import KEEP_TTL
-from .base import BaseCache
-from .serializers import redis_serializer
+import asyncio
+
+from cachecore.utils import KEEP_TTL, chunked, iter_pairs
+from .base import AsyncBaseCache, BaseCache, _lock_key
+from .serializers import SerializerInterface, tagged_serializer
 
 
 class MemcachedCache(BaseCache):
 
-    serializer = redis_serializer
+    serializer = tagged_serializer
+    _distributed = True
+
+    # The maximum number of keys sent in a single request.
+    batch_size = 1000
 
-    def __init__(self, client=None, **client_kwargs):
+    def __init__(
+        self,
+        client=None,
+        serializer: SerializerInterface | None = None,
+        **client_kwargs
+    ):
+        """
+        :param client: A pymemcache client.
+        :param serializer: Overrides the class's serializer.
+        :param client_kwargs: Arguments for pymemcache.client.Client.
+        """
         if client and client_kwargs:
             raise ValueError("Cannot pass a client and client kwargs.")
 
+        if serializer is not None:
+            self.serializer = serializer
+
         if client:
             self._client = client
             return
@@ -48,6 +67,19 @@ class MemcachedCache(BaseCache):
             ttl = 0
         self._client.set(key, value, expire=ttl)
 
+    def add(self, key, value, ttl=None):
+        value = self.serializer.dumps(value)
+        return self._client.add(key, value, expire=ttl or 0, noreply=False)
+
+    def _unlock(self, key, token):
+        lock_key = _lock_key(key)
+        value, cas = self._client.gets(lock_key)
+        if not value or self.serializer.loads(value) != token:
+            return
+        # Memcached has no conditional delete, so expire the lock with a
+        # write that fails if another worker took it since.
+        self._client.cas(lock_key, b'', cas, expire=-1, noreply=False)
+
     def replace(self, key, value, ttl=KEEP_TTL):
         if ttl is KEEP_TTL:
             raise NotImplementedError('Cannot keep TTL with Memcached backend.')
@@ -61,6 +93,29 @@ class MemcachedCache(BaseCache):
         self._client.replace(key, value, expire=ttl)
         return True
 
+    def get_many(self, keys, default=None):
+        keys = list(keys)
+        found = {}
+        for chunk in chunked(keys, self.batch_size):
+            found.update(self._client.get_many(chunk))
+        return (
+            default if k not in found else self.serializer.loads(found[k])
+            for k in keys
+        )
+
+    def set_many(self, mapping, ttl=None):
+        if ttl is None:
+            ttl = 0
+
+        for chunk in chunked(iter_pairs(mapping), self.batch_size):
+            values = {k: self.serializer.dumps(v) for k, v in chunk}
+            self._client.set_many(values, expire=ttl, noreply=True)
+
+    def delete_many(self, keys):
+        # Memcached doesn't say which keys a multi-delete found, so each
+        # key is deleted on its own, with the reply telling whether it was.
+        return iter([self._client.delete(k, noreply=False) for k in keys])
+
     def get_ttl(self, key, default=0):
         raise NotImplementedError
 
@@ -91,4 +146,126 @@ class MemcachedCache(BaseCache):
 
     def clear(self):
         self._client.flush_all()
-    
\ No newline at end of file
+
+
+class AsyncMemcachedCache(AsyncBaseCache):
+    """MemcachedCache for asyncio, built on aiomcache.
+    """
+
+    serializer = tagged_serializer
+    batch_size = MemcachedCache.batch_size
+    _distributed = True
+
+    def __init__(
+        self,
+        client=None,
+        serializer: SerializerInterface | None = None,
+        **client_kwargs
+    ):
+        if client and client_kwargs:
+            raise ValueError("Cannot pass a client and client kwargs.")
+
+        if serializer is not None:
+            self.serializer = serializer
+
+        if client:
+            self._client = client
+            return
+
+        import aiomcache
+        self._client = aiomcache.Client(**client_kwargs)
+
+    def __aiter__(self):
+        raise NotImplementedError
+
+    def keys(self, pattern=None):
+        raise NotImplementedError
+
+    async def get(self, key, default=None):
+        value = await self._client.get(key.encode())
+        if value is None:
+            return default
+        return self.serializer.loads(value)
+
+    async def set(self, key, value, ttl=None):
+        value = self.serializer.dumps(value)
+        await self._client.set(key.encode(), value, exptime=ttl or 0)
+
+    async def add(self, key, value, ttl=None):
+        value = self.serializer.dumps(value)
+        return await self._client.add(key.encode(), value, exptime=ttl or 0)
+
+    async def _unlock(self, key, token):
+        lock_key = _lock_key(key).encode()
+        value, cas = await self._client.gets(lock_key)
+        if not value or self.serializer.loads(value) != token:
+            return
+        # aiomcache rejects negative expiry times, so the lock is replaced
+        # by one that expires within a second.
+        await self._client.cas(lock_key, b'', cas, exptime=1)
+
+    async def replace(self, key, value, ttl=KEEP_TTL):
+        if ttl is KEEP_TTL:
+            raise NotImplementedError('Cannot keep TTL with Memcached backend.')
+
+        value = self.serializer.dumps(value)
+        return await self._client.replace(key.encode(), value, exptime=ttl or 0)
+
+    async def delete(self, key):
+        return await self._client.delete(key.encode())
+
+    async def exists(self, key):
+        return await self._client.get(key.encode()) is not None
+
+    async def get_many(self, keys, default=None):
+        values = []
+        for chunk in chunked(keys, self.batch_size):
+            values.extend(await self._client.multi_get(*(k.encode() for k in chunk)))
+        return [default if v is None else self.serializer.loads(v) for v in values]
+
+    async def set_many(self, mapping, ttl=None):
+        # aiomcache has no multi-set, so the writes of a chunk are sent
+        # concurrently over the client's connection pool.
+        for chunk in chunked(iter_pairs(mapping), self.batch_size):
+            await asyncio.gather(*(
+                self._client.set(k.encode(), self.serializer.dumps(v), exptime=ttl or 0)
+                for k, v in chunk
+            ))
+
+    async def delete_many(self, keys):
+        results = []
+        for chunk in chunked(keys, self.batch_size):
+            results.extend(await asyncio.gather(*(self._client.delete(k.encode()) for k in chunk)))
+        return results
+
+    async def get_ttl(self, key, default=0):
+        raise NotImplementedError
+
+    async def set_ttl(self, key, ttl=None):
+        raise NotImplementedError
+
+    async def incr(self, key, delta=1):
+        # Memcached does not accept negative values.
+        if delta < 0:
+            return await self.decr(key, abs(delta))
+
+        # incr/decr fail if there isn't already a value.
+        await self.add(key, 0)
+        return await self._client.incr(key.encode(), delta)
+
+    async def decr(self, key, delta=1):
+        # Memcached does not accept negative values.
+        if delta < 0:
+            return await self.incr(key, abs(delta))
+
+        # Memcached will not decrement the value below zero.
+        value = await self.get(key, 0)
+        value -= delta
+        await self.set(key, value)
+        return value
+
+    async def clear(self):
+        await self._client.flush_all()
+
+    async def aclose(self):
+        await self._client.close()
@@ -0,0 +1,218 @@
+import dataclasses
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+import enum
+from functools import wraps
+from hashlib import blake2b
+import inspect
+import typing as t
+from uuid import UUID
+
+
+# Types whose repr() spells out their value.
+_REPR_TYPES = frozenset((complex, Decimal, UUID, date, datetime, time, timedelta))
+
+# The keyword argument skipping the cache for a single call.
+_BYPASS = 'cache_bypass'
+
+
+def _normalize(obj: t.Any, typed: bool) -> t.Any:
+    """Converts an argument into a structure of builtins whose repr() is
+    stable across processes.
+
+    Every container becomes a (type tag, contents) pair, so that no
+    argument can spell out the normalized form of another. Objects are
+    never pickled, which would be slow and, for objects holding state such
+    as `self`, unstable: they must be enums, dataclasses or define a
+    `__cache_key__()` method returning a normalizable value.
+    """
+    tp = type(obj)
+    if tp is str or tp is int or tp is bytes or obj is None:
+        return obj
+
+    if tp is bool or tp is float:
+        # Equal numbers share an entry unless typed, as with lru_cache.
+        if typed:
+            return obj
+        if tp is bool or obj.is_integer():
+            return int(obj)
+        return obj
+
+    if tp is tuple:
+        return ('tuple', tuple(_normalize(v, typed) for v in obj))
+
+    if tp is list:
+        return ('list', tuple(_normalize(v, typed) for v in obj))
+
+    if tp is dict:
+        items = ((_normalize(k, typed), _normalize(v, typed)) for k, v in obj.items())
+        return ('dict', tuple(sorted(items, key=repr)))
+
+    if tp is set or tp is frozenset:
+        return ('set', tuple(sorted((_normalize(v, typed) for v in obj), key=repr)))
+
+    name = f'{tp.__module__}.{tp.__qualname__}'
+    cache_key = getattr(obj, '__cache_key__', None)
+    if cache_key is not None:
+        return ('object', name, _normalize(cache_key(), typed))
+
+    if tp in _REPR_TYPES:
+        return ('repr', repr(obj))
+
+    if isinstance(obj, enum.Enum):
+        return ('enum', name, obj.name)
+
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        fields = tuple(
+            (f.name, _normalize(getattr(obj, f.name), typed)) for f in dataclasses.fields(obj)
+        )
+        return ('dataclass', name, fields)
+
+    raise TypeError(
+        f'Cannot build a cache key from a {name} argument: define its '
+        '__cache_key__() method or pass key= to memoize.'
+    )
+
+
+def make_key(prefix: str, args: tuple, kwargs: dict, typed: bool = False) -> str:
+    """Builds a cache key from a function's arguments.
+
+    The arguments are hashed with BLAKE2b, so keys are short and the same
+    in every process. The order of keyword arguments doesn't matter.
+    Raises TypeError for arguments that can't be normalized, see
+    _normalize.
+
+    :param prefix: Prepended to the hash, usually the function's name.
+    :param args: The positional arguments.
+    :param kwargs: The keyword arguments.
+    :param typed: True, if arguments of different types, e.g. 1 and 1.0,
+        should have different keys.
+    """
+    kwargs = sorted(kwargs.items())
+    parts = (
+        tuple(_normalize(v, typed) for v in args),
+        tuple((k, _normalize(v, typed)) for k, v in kwargs),
+    )
+    if typed:
+        parts += (
+            tuple(type(v).__qualname__ for v in args),
+            tuple(type(v).__qualname__ for _, v in kwargs),
+        )
+
+    digest = blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+    return f'{prefix}:{digest}'
+
+
+def memoize(
+    cache: t.Any,
+    ttl: int | None = None,
+    key: t.Callable[..., str] | None = None,
+    typed: bool = False,
+    soft_ttl: int | None = None,
+    prefix: str | None = None
+) -> t.Callable[[t.Callable], t.Callable]:
+    """Decorator caching a function's results in a cache.
+
+    Values are computed through `get_or_set`, so concurrent calls with the
+    same arguments compute once. The decorated function has these extra
+    attributes:
+
+    * `invalidate(*args, **kwargs)` deletes the cached result.
+    * `refresh(*args, **kwargs)` recomputes and stores the result.
+    * `uncached(*args, **kwargs)` calls the function without the cache.
+    * `make_key(*args, **kwargs)` returns the cache key.
+
+    Passing `cache_bypass=True` to the decorated function calls it without
+    reading or writing the cache, e.g. to skip it for a single request.
+
+    Coroutine functions may be used with any cache; blocking caches are
+    wrapped in an AsyncCacheWrapper. Their extra attributes, except
+    `make_key`, are coroutine functions too.
+
+    :param cache: A cache implementing CacheInterface or AsyncCacheInterface.
+    :param ttl: The time-to-live of the results.
+    :param key: A function taking the same arguments, returning the part of
+        the key after the prefix. By default the arguments are hashed,
+        see make_key.
+    :param typed: True, if arguments of different types, e.g. 1 and 1.0,
+        should be cached separately.
+    :param soft_ttl: See get_or_set.
+    :param prefix: The start of every key. Defaults to the function's
+        module and qualified name.
+    """
+    async_cache = inspect.iscoroutinefunction(cache.get)
+
+    def decorator(fn: t.Callable) -> t.Callable:
+        name = prefix or f'{fn.__module__}.{fn.__qualname__}'
+
+        def build_key(*args, **kwargs) -> str:
+            if key is not None:
+                return f'{name}:{key(*args, **kwargs)}'
+            return make_key(name, args, kwargs, typed)
+
+        if inspect.iscoroutinefunction(fn):
+            target = cache
+            if not async_cache:
+                from .aio import AsyncCacheWrapper
+                target = AsyncCacheWrapper(cache)
+            wrapper = _async_wrapper(fn, target, build_key, ttl, soft_ttl)
+        elif async_cache:
+            raise TypeError('Only coroutine functions can be memoized in an async cache.')
+        else:
+            wrapper = _wrapper(fn, cache, build_key, ttl, soft_ttl)
+
+        wrapper.uncached = fn
+        wrapper.make_key = build_key
+        return wrapper
+
+    return decorator
+
+
+def _wrapper(fn, cache, build_key, ttl, soft_ttl):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if kwargs and kwargs.pop(_BYPASS, False):
+            return fn(*args, **kwargs)
+        return cache.get_or_set(
+            build_key(*args, **kwargs), lambda: fn(*args, **kwargs), ttl, soft_ttl=soft_ttl
+        )
+
+    def invalidate(*args, **kwargs) -> bool:
+        return cache.delete(build_key(*args, **kwargs))
+
+    def refresh(*args, **kwargs):
+        value = fn(*args, **kwargs)
+        if soft_ttl is None:
+            cache.set(build_key(*args, **kwargs), value, ttl)
+        else:
+            cache._set_fresh(build_key(*args, **kwargs), value, ttl, soft_ttl)
+        return value
+
+    wrapper.invalidate = invalidate
+    wrapper.refresh = refresh
+    return wrapper
+
+
+def _async_wrapper(fn, cache, build_key, ttl, soft_ttl):
+    @wraps(fn)
+    async def wrapper(*args, **kwargs):
+        if kwargs and kwargs.pop(_BYPASS, False):
+            return await fn(*args, **kwargs)
+        return await cache.get_or_set(
+            build_key(*args, **kwargs), lambda: fn(*args, **kwargs), ttl, soft_ttl=soft_ttl
+        )
+
+    async def invalidate(*args, **kwargs) -> bool:
+        return await cache.delete(build_key(*args, **kwargs))
+
+    async def refresh(*args, **kwargs):
+        value = await fn(*args, **kwargs)
+        if soft_ttl is None:
+            await cache.set(build_key(*args, **kwargs), value, ttl)
+        else:
+            await cache._set_fresh(build_key(*args, **kwargs), value, ttl, soft_ttl)
+        return value
+
+    wrapper.invalidate = invalidate
+    wrapper.refresh = refresh
+    return wrapper
@@ -0,0 +1,706 @@
+from contextvars import ContextVar
+import random
+import threading
+import time
+import typing as t
+import warnings
+
+from .base import _MISSING, BaseCache
+from .eviction import CountMinSketch
+from .interface import CacheInterface
+from .utils import KEEP_TTL, iter_pairs
+
+
+# Values below 2 * _SUB_BUCKETS are counted exactly; above that, every
+# power of two is split into _SUB_BUCKETS buckets, so a recorded value is
+# off by at most 1 / _SUB_BUCKETS.
+_SUB_BITS = 4
+_SUB_BUCKETS = 1 << _SUB_BITS
+
+# The upper bounds, in seconds, of the buckets exported to Prometheus.
+_PROMETHEUS_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+OPERATIONS = (
+    'get', 'set', 'add', 'replace', 'delete', 'pop', 'exists', 'get_many',
+    'set_many', 'delete_many', 'get_ttl', 'set_ttl', 'incr', 'decr', 'clear',
+    'keys'
+)
+
+
+# The InstrumentedCache operation running in the current context, as a
+# 3-tuple of the cache, its OperationStats and, for writes checked by a
+# sampler, the keys of each value being written, by id of the value. A
+# context variable rather than a thread-local, so that backends which
+# serialize in a thread pool can carry it over with copy_context().
+_current_op: ContextVar[tuple | None] = ContextVar('cachecore_current_op', default=None)
+
+
+def _serializing(cache: t.Any) -> t.Iterator[t.Any]:
+    """Yields the caches that serialize values on behalf of a cache: the
+    cache itself, or the caches nested in a composite such as a TieredCache
+    or a ShardedCache, which lists them in _children.
+    """
+    if getattr(cache, 'serializer', None) is not None:
+        yield cache
+        return
+    for child in getattr(cache, '_children', ()):
+        yield from _serializing(child)
+
+
+def _bucket(value: int) -> int:
+    if value < 2 * _SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - _SUB_BITS - 1
+    return (shift << _SUB_BITS) + (value >> shift)
+
+
+def _bucket_upper(idx: int) -> int:
+    """Returns the largest value counted in a bucket.
+    """
+    if idx < 2 * _SUB_BUCKETS:
+        return idx
+    shift = (idx >> _SUB_BITS) - 1
+    mantissa = (idx & (_SUB_BUCKETS - 1)) + _SUB_BUCKETS
+    return ((mantissa + 1) << shift) - 1
+
+
+class Histogram:
+    """A log-linear histogram of non-negative integers, like HdrHistogram:
+    recording is a few integer operations and the memory used grows with
+    the logarithm of the largest value.
+
+    Not thread-safe; callers hold a lock.
+    """
+
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts: list[int] = []
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value: int) -> None:
+        idx = _bucket(value)
+        counts = self.counts
+        if idx >= len(counts):
+            counts.extend([0] * (idx + 1 - len(counts)))
+        counts[idx] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def copy(self) -> 'Histogram':
+        other = Histogram()
+        other.counts = list(self.counts)
+        other.count = self.count
+        other.total = self.total
+        other.max = self.max
+        return other
+
+    def percentile(self, q: float) -> int:
+        """Returns an upper bound of the q-th percentile, 0 <= q <= 100.
+        """
+        if not self.count:
+            return 0
+        rank = max(1, round(q / 100 * self.count))
+        seen = 0
+        for idx, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(_bucket_upper(idx), self.max)
+        return self.max
+
+    def count_at_most(self, value: int) -> int:
+        """Returns the number of recorded values no larger than value, to
+        bucket precision.
+        """
+        seen = 0
+        for idx, n in enumerate(self.counts):
+            if _bucket_upper(idx) > value:
+                break
+            seen += n
+        return seen
+
+
+class OperationStats:
+    """Counters of one kind of operation. Latencies are in microseconds.
+    """
+
+    __slots__ = (
+        'calls', 'errors', 'hits', 'misses', 'bytes_read', 'bytes_written',
+        'latency', 'lock'
+    )
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.hits = 0
+        self.misses = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.latency = Histogram()
+        self.lock = threading.Lock()
+
+    def snapshot(self) -> dict[str, t.Any]:
+        with self.lock:
+            latency = self.latency.copy()
+            snapshot = {
+                'calls': self.calls,
+                'errors': self.errors,
+                'hits': self.hits,
+                'misses': self.misses,
+                'bytes_read': self.bytes_read,
+                'bytes_written': self.bytes_written,
+            }
+
+        lookups = snapshot['hits'] + snapshot['misses']
+        snapshot['hit_ratio'] = snapshot['hits'] / lookups if lookups else 0.0
+        snapshot['latency'] = {
+            'count': latency.count,
+            'mean': latency.total / latency.count / 1e6 if latency.count else 0.0,
+            'p50': latency.percentile(50) / 1e6,
+            'p90': latency.percentile(90) / 1e6,
+            'p99': latency.percentile(99) / 1e6,
+            'max': latency.max / 1e6,
+        }
+        snapshot['histogram'] = latency
+        return snapshot
+
+
+class HotKeySampler:
+    """Finds the most used keys and the largest values with a fixed amount
+    of memory.
+
+    Sampled accesses are counted in a Count-Min sketch, and the k keys with
+    the highest estimates are kept in a table, as in Space-Saving: a new key
+    replaces the coldest one once its estimate is higher.
+
+    :param k: The number of hot keys kept.
+    :param sample_rate: The fraction of accesses counted. Reported counts
+        are scaled back up.
+    :param width: The number of counters per row of the sketch.
+    :param depth: The number of rows of the sketch.
+    :param decay_after: Halve all counts after this many sampled accesses,
+        so that keys that are no longer used cool down. None disables aging.
+    :param max_value_size: Serialized values larger than this many bytes
+        are reported by big_keys.
+    :param max_big_keys: The number of big keys kept, the largest first.
+    """
+
+    def __init__(
+        self,
+        k: int = 32,
+        sample_rate: float = 1.0,
+        width: int = 4096,
+        depth: int = 4,
+        decay_after: int | None = None,
+        max_value_size: int = 1 << 20,
+        max_big_keys: int = 32
+    ):
+        if not 0 < sample_rate <= 1:
+            raise ValueError('sample_rate must be in (0, 1].')
+
+        self.k = k
+        self.sample_rate = sample_rate
+        self.max_value_size = max_value_size
+        self.max_big_keys = max_big_keys
+        self._sketch = CountMinSketch(width, depth)
+        self._decay_after = decay_after
+        self._sampled = 0
+        self._top: dict[str, int] = {}
+        # A lower bound of the smallest count in _top, to skip scanning it
+        # for keys that can't get in.
+        self._floor = 0
+        self._big: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: str) -> None:
+        """Count an access to a key, if it is sampled.
+        """
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+
+        with self._lock:
+            sketch = self._sketch
+            sketch.add(key)
+            count = sketch.estimate(key)
+            top = self._top
+            if key in top or len(top) < self.k:
+                top[key] = count
+            elif count > self._floor:
+                coldest = min(top, key=top.__getitem__)
+                if count > top[coldest]:
+                    del top[coldest]
+                    top[key] = count
+                self._floor = min(top.values())
+
+            self._sampled += 1
+            if self._decay_after is not None and self._sampled >= self._decay_after:
+                self._decay()
+
+    def _decay(self) -> None:
+        self._sketch._age()
+        self._top = {key: count >> 1 for key, count in self._top.items() if count > 1}
+        self._floor >>= 1
+        self._sampled = 0
+
+    def record_size(self, key: str, size: int) -> None:
+        """Remember a key if the size of its serialized value is above
+        max_value_size.
+        """
+        if size <= self.max_value_size:
+            return
+
+        with self._lock:
+            big = self._big
+            if key in big or len(big) < self.max_big_keys:
+                big[key] = size
+                return
+            smallest = min(big, key=big.__getitem__)
+            if size > big[smallest]:
+                del big[smallest]
+                big[key] = size
+
+    def hot_keys(self, n: int | None = None) -> list[tuple[str, int]]:
+        """Returns up to n of the most used keys with their estimated number
+        of accesses, the hottest first.
+        """
+        with self._lock:
+            items = list(self._top.items())
+        scale = 1 / self.sample_rate
+        items.sort(key=lambda item: item[1], reverse=True)
+        return [(key, round(count * scale)) for key, count in items[:n]]
+
+    def big_keys(self) -> list[tuple[str, int]]:
+        """Returns the keys of values larger than max_value_size with the
+        size of their last write, the largest first.
+        """
+        with self._lock:
+            items = list(self._big.items())
+        return sorted(items, key=lambda item: item[1], reverse=True)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sketch.clear()
+            self._sampled = 0
+            self._top = {}
+            self._floor = 0
+            self._big = {}
+
+
+class _MeasuringSerializer:
+    """Wraps a cache's serializer to count the bytes of every payload
+    against the operation running in the current context.
+    """
+
+    def __init__(self, serializer: t.Any, owner: 'InstrumentedCache'):
+        self.serializer = serializer
+        self._owner = owner
+        if hasattr(serializer, 'dumps_buffers'):
+            self.dumps_buffers = self._dumps_buffers
+
+    def __getattr__(self, name: str) -> t.Any:
+        return getattr(self.serializer, name)
+
+    def _current(self) -> tuple | None:
+        current = _current_op.get()
+        if current is None or current[0] is not self._owner:
+            return None
+        return current
+
+    def _count(self, field: str, size: int) -> None:
+        current = self._current()
+        if current is not None:
+            stats = current[1]
+            with stats.lock:
+                setattr(stats, field, getattr(stats, field) + size)
+
+    def _written(self, obj: t.Any, size: int) -> None:
+        self._count('bytes_written', size)
+        current = self._current()
+        if current is not None and current[2] is not None:
+            # Values are matched to their keys by identity, since batches
+            # may be serialized in any order and in other threads.
+            for key in current[2].get(id(obj), ()):
+                self._owner.sampler.record_size(key, size)
+
+    def dumps(self, obj: t.Any) -> bytes:
+        data = self.serializer.dumps(obj)
+        self._written(obj, len(data))
+        return data
+
+    def _dumps_buffers(self, obj: t.Any) -> list:
+        parts = self.serializer.dumps_buffers(obj)
+        self._written(obj, sum(memoryview(p).nbytes for p in parts))
+        return parts
+
+    def loads(self, data: t.Any) -> t.Any:
+        self._count('bytes_read', memoryview(data).nbytes)
+        return self.serializer.loads(data)
+
+
+class InstrumentedCache(BaseCache):
+    """Wraps a cache to record, for every kind of operation, the number of
+    calls, errors, hits and misses, a latency histogram and the sizes of
+    serialized payloads.
+
+    Payload sizes are measured by wrapping the cache's serializer, or the
+    serializers of the caches nested in a TieredCache or ShardedCache, so
+    they are only recorded for caches that serialize values.
+
+    :param cache: The cache to instrument.
+    :param name: Added as a `cache` label to exported metrics.
+    :param callback: Called after every operation with a metric name, a
+        value and a statsd type: 'ms' for the latency in milliseconds and
+        'c' for hit, miss and error counts, e.g.
+        callback('cachecore.get.ms', 0.21, 'ms').
+    :param prefix: The prefix of metric names.
+    :param enabled: False, to pass calls through without recording them.
+    :param sampler: A HotKeySampler, to track the most used keys and the
+        largest values. Off by default.
+    """
+
+    def __init__(
+        self,
+        cache: CacheInterface,
+        name: str | None = None,
+        callback: t.Callable[[str, float, str], None] | None = None,
+        prefix: str = 'cachecore',
+        enabled: bool = True,
+        sampler: HotKeySampler | None = None
+    ):
+        self.cache = cache
+        self.sampler = sampler
+        self.name = name
+        self._callback = callback
+        self._prefix = prefix
+        self._ops = {op: OperationStats() for op in OPERATIONS}
+        self._enabled = False
+        self.enabled = enabled
+
+    @property
+    def _distributed(self) -> bool:
+        return self.cache._distributed
+
+    @property
+    def _thread_safe(self) -> bool:
+        return self.cache._thread_safe
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, enabled: bool) -> None:
+        # The serializer is only wrapped while enabled, so that a disabled
+        # cache costs one attribute check per call.
+        if enabled == self._enabled:
+            return
+        self._enabled = enabled
+
+        caches = list(_serializing(self.cache))
+        if not caches and enabled:
+            warnings.warn(
+                f'{type(self.cache).__name__} does not expose a serializer, '
+                'payload sizes will not be recorded', RuntimeWarning, stacklevel=3
+            )
+        for cache in caches:
+            serializer = cache.serializer
+            if enabled:
+                cache.serializer = _MeasuringSerializer(serializer, self)
+            elif isinstance(serializer, _MeasuringSerializer):
+                cache.serializer = serializer.serializer
+
+    def _call(self, op: str, fn: t.Callable, *args, keys: dict[int, list[str]] | None = None) -> t.Any:
+        stats = self._ops[op]
+        token = _current_op.set((self, stats, keys))
+        start = time.perf_counter_ns()
+        try:
+            result = fn(*args)
+        except Exception:
+            self._error(op)
+            raise
+        finally:
+            elapsed = time.perf_counter_ns() - start
+            _current_op.reset(token)
+            self._timed(op, elapsed)
+        return result
+
+    def _error(self, op: str) -> None:
+        stats = self._ops[op]
+        with stats.lock:
+            stats.errors += 1
+        if self._callback is not None:
+            self._callback(f'{self._prefix}.{op}.errors', 1, 'c')
+
+    def _timed(self, op: str, elapsed: int) -> None:
+        stats = self._ops[op]
+        with stats.lock:
+            stats.calls += 1
+            stats.latency.record(elapsed // 1000)
+        if self._callback is not None:
+            self._callback(f'{self._prefix}.{op}.ms', elapsed / 1e6, 'ms')
+
+    def _iter_keys(self, pattern: str | None) -> t.Iterator[str]:
+        """Yields the keys of the cache as they are fetched, recording a
+        single call timed over the steps spent in the cache, not in the
+        caller's loop.
+        """
+        elapsed = 0
+        it = None
+        try:
+            while True:
+                start = time.perf_counter_ns()
+                try:
+                    if it is None:
+                        it = iter(self.cache.keys(pattern))
+                    key = next(it)
+                except StopIteration:
+                    return
+                except Exception:
+                    self._error('keys')
+                    raise
+                finally:
+                    elapsed += time.perf_counter_ns() - start
+                yield key
+        finally:
+            self._timed('keys', elapsed)
+
+    def _lookups(self, op: str, hits: int, misses: int) -> None:
+        stats = self._ops[op]
+        with stats.lock:
+            stats.hits += hits
+            stats.misses += misses
+        if self._callback is not None:
+            if hits:
+                self._callback(f'{self._prefix}.{op}.hits', hits, 'c')
+            if misses:
+                self._callback(f'{self._prefix}.{op}.misses', misses, 'c')
+
+    def _op(self, op: str, fn: t.Callable, *args) -> t.Any:
+        if not self._enabled:
+            return fn(*args)
+        return self._call(op, fn, *args)
+
+    def _sample(self, keys: t.Iterable[str]) -> None:
+        sampler = self.sampler
+        if sampler is not None and self._enabled:
+            for key in keys:
+                sampler.record(key)
+
+    def _write(self, op: str, pairs: list[tuple[str, t.Any]], fn: t.Callable, *args) -> t.Any:
+        """Like _op, for operations serializing the values of key-value
+        pairs, whose sizes are checked by the sampler.
+        """
+        if self.sampler is None or not self._enabled:
+            return self._op(op, fn, *args)
+
+        keys = {}
+        for key, value in pairs:
+            keys.setdefault(id(value), []).append(key)
+        self._sample(key for key, _ in pairs)
+        return self._call(op, fn, *args, keys=keys)
+
+    def __getitem__(self, key: str) -> t.Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: t.Any):
+        self.set(key, value)
+
+    def __delitem__(self, key: str):
+        if not self.delete(key):
+            raise KeyError(key)
+
+    def __contains__(self, key: str) -> bool:
+        return self.exists(key)
+
+    def __iter__(self) -> t.Iterator[str]:
+        return self.keys()
+
+    def __len__(self) -> int:
+        return len(self.cache)
+
+    def keys(self, pattern: str | None = None) -> t.Iterator[str]:
+        if not self._enabled:
+            return iter(self.cache.keys(pattern))
+        return self._iter_keys(pattern)
+
+    def get(self, key: str, default: t.Any = None) -> t.Any:
+        if not self._enabled:
+            return self.cache.get(key, default)
+        self._sample((key,))
+        value = self._call('get', self.cache.get, key, _MISSING)
+        hit = value is not _MISSING
+        self._lookups('get', hit, not hit)
+        return value if hit else default
+
+    def set(self, key: str, value: t.Any, ttl: int | None = None) -> None:
+        self._write('set', [(key, value)], self.cache.set, key, value, ttl)
+
+    def add(self, key: str, value: t.Any, ttl: int | None = None) -> bool:
+        return self._write('add', [(key, value)], self.cache.add, key, value, ttl)
+
+    def replace(self, key: str, value: t.Any, ttl: int | None = KEEP_TTL) -> bool:
+        return self._write('replace', [(key, value)], self.cache.replace, key, value, ttl)
+
+    def delete(self, key: str) -> bool:
+        self._sample((key,))
+        return self._op('delete', self.cache.delete, key)
+
+    def pop(self, key: str, default: t.Any = None) -> t.Any:
+        if not self._enabled:
+            return self.cache.pop(key, default)
+        self._sample((key,))
+        value = self._call('pop', self.cache.pop, key, _MISSING)
+        hit = value is not _MISSING
+        self._lookups('pop', hit, not hit)
+        return value if hit else default
+
+    def exists(self, key: str) -> bool:
+        self._sample((key,))
+        return self._op('exists', self.cache.exists, key)
+
+    def get_many(self, keys: t.Iterable[str], default: t.Any = None) -> t.Iterable[t.Any]:
+        if not self._enabled:
+            return self.cache.get_many(keys, default)
+        keys = list(keys)
+        self._sample(keys)
+        values = self._call('get_many', lambda: list(self.cache.get_many(keys, _MISSING)))
+        misses = sum(1 for v in values if v is _MISSING)
+        self._lookups('get_many', len(values) - misses, misses)
+        return (default if v is _MISSING else v for v in values)
+
+    def set_many(self, mapping: t.Mapping[str, t.Any] | t.Iterable[tuple[str, t.Any]], ttl: int | None = None) -> None:
+        pairs = list(iter_pairs(mapping))
+        self._write('set_many', pairs, self.cache.set_many, pairs, ttl)
+
+    def delete_many(self, keys: t.Iterable[str]) -> t.Iterable[bool]:
+        keys = list(keys)
+        self._sample(keys)
+        return iter(self._op('delete_many', lambda: list(self.cache.delete_many(keys))))
+
+    def get_ttl(self, key: str, default: int = 0) -> int | None:
+        self._sample((key,))
+        return self._op('get_ttl', self.cache.get_ttl, key, default)
+
+    def set_ttl(self, key: str, ttl: int | None = None) -> bool:
+        self._sample((key,))
+        return self._op('set_ttl', self.cache.set_ttl, key, ttl)
+
+    def incr(self, key: str, delta: int = 1) -> int:
+        self._sample((key,))
+        return self._op('incr', self.cache.incr, key, delta)
+
+    def decr(self, key: str, delta: int = 1) -> int:
+        self._sample((key,))
+        return self._op('decr', self.cache.decr, key, delta)
+
+    def clear(self) -> None:
+        self._op('clear', self.cache.clear)
+
+    def _get_fresh(self, key: str, ttl: int | None, soft_ttl: int) -> tuple[t.Any, bool]:
+        if not self._enabled:
+            return self.cache._get_fresh(key, ttl, soft_ttl)
+        self._sample((key,))
+        value, stale = self._call('get', self.cache._get_fresh, key, ttl, soft_ttl)
+        hit = value is not _MISSING
+        self._lookups('get', hit, not hit)
+        return value, stale
+
+    def _set_fresh(self, key: str, value: t.Any, ttl: int | None, soft_ttl: int | None) -> None:
+        self._write('set', [(key, value)], self.cache._set_fresh, key, value, ttl, soft_ttl)
+
+    def _lock(self, key: str, timeout: float) -> str | None:
+        return self.cache._lock(key, timeout)
+
+    def _unlock(self, key: str, token: str) -> None:
+        self.cache._unlock(key, token)
+
+    def stats(self) -> dict[str, dict[str, t.Any]]:
+        """Returns a snapshot of the counters of every kind of operation
+        that was called, plus their sum under 'total'. Latencies are in
+        seconds.
+        """
+        ops = {}
+        for op, stats in self._ops.items():
+            snapshot = stats.snapshot()
+            if snapshot['calls']:
+                del snapshot['histogram']
+                ops[op] = snapshot
+
+        total = {
+            field: sum(s[field] for s in ops.values())
+            for field in ('calls', 'errors', 'hits', 'misses', 'bytes_read', 'bytes_written')
+        }
+        lookups = total['hits'] + total['misses']
+        total['hit_ratio'] = total['hits'] / lookups if lookups else 0.0
+        ops['total'] = total
+        return ops
+
+    def hot_keys(self, n: int | None = None) -> list[tuple[str, int]]:
+        """Returns up to n of the most used keys with their estimated number
+        of accesses, the hottest first. Requires a sampler.
+        """
+        if self.sampler is None:
+            raise ValueError('Hot keys are only tracked with a sampler.')
+        return self.sampler.hot_keys(n)
+
+    def big_keys(self) -> list[tuple[str, int]]:
+        """Returns the keys of oversized values with their size in bytes,
+        the largest first. Requires a sampler.
+        """
+        if self.sampler is None:
+            raise ValueError('Big keys are only tracked with a sampler.')
+        return self.sampler.big_keys()
+
+    def reset(self) -> None:
+        """Zero all counters, and forget the keys seen by the sampler.
+        """
+        self._ops = {op: OperationStats() for op in OPERATIONS}
+        if self.sampler is not None:
+            self.sampler.clear()
+
+    def prometheus(self) -> str:
+        """Returns the metrics in the Prometheus text exposition format.
+        """
+        prefix = self._prefix
+        labels = '' if self.name is None else f'cache="{self.name}",'
+        snapshots = {op: s.snapshot() for op, s in self._ops.items()}
+        snapshots = {op: s for op, s in snapshots.items() if s['calls']}
+
+        lines = []
+        counters = (
+            ('operations', 'calls', 'Cache operations.'),
+            ('errors', 'errors', 'Cache operations that raised.'),
+            ('hits', 'hits', 'Keys found by lookups.'),
+            ('misses', 'misses', 'Keys not found by lookups.'),
+            ('read_bytes', 'bytes_read', 'Bytes of serialized values read.'),
+            ('written_bytes', 'bytes_written', 'Bytes of serialized values written.'),
+        )
+        for metric, field, help in counters:
+            lines.append(f'# HELP {prefix}_{metric}_total {help}')
+            lines.append(f'# TYPE {prefix}_{metric}_total counter')
+            for op, s in snapshots.items():
+                lines.append(f'{prefix}_{metric}_total{{{labels}op="{op}"}} {s[field]}')
+
+        metric = f'{prefix}_operation_duration_seconds'
+        lines.append(f'# HELP {metric} Latency of cache operations.')
+        lines.append(f'# TYPE {metric} histogram')
+        for op, s in snapshots.items():
+            histogram = s['histogram']
+            for bound in _PROMETHEUS_BUCKETS:
+                count = histogram.count_at_most(int(bound * 1e6))
+                lines.append(f'{metric}_bucket{{{labels}op="{op}",le="{bound}"}} {count}')
+            lines.append(f'{metric}_bucket{{{labels}op="{op}",le="+Inf"}} {histogram.count}')
+            lines.append(f'{metric}_sum{{{labels}op="{op}"}} {histogram.total / 1e6}')
+            lines.append(f'{metric}_count{{{labels}op="{op}"}} {histogram.count}')
+
+        return '\n'.join(lines) + '\n'
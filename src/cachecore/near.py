@@ -0,0 +1,200 @@
+import threading
+import typing as t
+
+from .local import LocalCache
+
+
+_INVALIDATE_CHANNEL = b'__redis__:invalidate'
+
+
+class NearCache:
+    """An in-process copy of values recently read from Redis.
+
+    On Redis 6 and newer, the connections used for reads enable
+    CLIENT TRACKING with their invalidation messages redirected to a
+    connection subscribed by a background thread, so entries are dropped as
+    soon as any client modifies the key. Older servers fall back to keeping
+    entries for `ttl` seconds.
+
+    Raw replies are stored, so every hit is deserialized into a new object.
+
+    :param client: The redis.Redis client of the cache.
+    :param max_entries: The maximum number of entries to hold.
+    :param ttl: The maximum number of seconds an entry is kept, or None.
+        Without tracking, None means one second.
+    """
+
+    def __init__(self, client: t.Any, max_entries: int, ttl: float | None = None):
+        self._client = client
+        self._ttl = ttl
+        self._local = LocalCache(max_entries=max_entries, serialize=False, thread_safe=True)
+
+        # A read only stores its reply if no invalidation for the key
+        # arrived while it was in flight, which is tracked by giving each
+        # read a token.
+        self._lock = threading.Lock()
+        self._pending: dict[str, object] = {}
+
+        self._tracking = False
+        self._tracked_client = None
+        self._redirect_id = None
+        self._ready = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        """Enable tracking if the server supports it.
+        """
+        info = self._client.info('server')
+        version = tuple(int(n) for n in info['redis_version'].split('.'))
+        if version < (6, 0, 0):
+            return
+
+        import redis
+        pool = self._client.connection_pool
+        kwargs = dict(pool.connection_kwargs, redis_connect_func=self._on_connect)
+        self._tracked_client = redis.Redis(
+            connection_pool=redis.ConnectionPool(connection_class=pool.connection_class, **kwargs)
+        )
+        self._tracking = True
+        self._thread = threading.Thread(
+            target=self._listen, name='cachecore-invalidations', daemon=True
+        )
+        self._thread.start()
+        self._ready.wait(5)
+
+        try:
+            self._tracked_client.ping()
+        except redis.ResponseError:
+            # A Redis compatible server without CLIENT TRACKING.
+            self.stop()
+            self._stopped.clear()
+            self._tracking = False
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._tracked_client is not None:
+            self._tracked_client.close()
+        self.clear()
+
+    def _on_connect(self, conn: t.Any) -> None:
+        conn.on_connect()
+        conn.send_command('CLIENT', 'TRACKING', 'ON', 'REDIRECT', self._redirect_id)
+        conn.read_response()
+
+    def _listen(self) -> None:
+        import redis
+        pool = self._client.connection_pool
+        while not self._stopped.is_set():
+            conn = pool.connection_class(**pool.connection_kwargs)
+            try:
+                conn.send_command('CLIENT', 'ID')
+                self._redirect_id = conn.read_response()
+                conn.send_command('SUBSCRIBE', _INVALIDATE_CHANNEL)
+                conn.read_response()
+
+                # Connections still redirecting to the previous listener
+                # have to reconnect.
+                self._tracked_client.connection_pool.disconnect()
+                self._ready.set()
+
+                while not self._stopped.is_set():
+                    if conn.can_read(timeout=1.0):
+                        self._handle(conn.read_response())
+
+            except redis.RedisError:
+                # Invalidations may have been missed.
+                self._stopped.wait(1.0)
+
+            finally:
+                self._ready.clear()
+                self.clear()
+                conn.disconnect()
+
+    def _handle(self, message: list) -> None:
+        kind, channel, keys = message
+        if kind != b'message' or channel != _INVALIDATE_CHANNEL:
+            return
+
+        # A null payload means the whole database was flushed.
+        if keys is None:
+            self.clear()
+            return
+
+        for key in keys:
+            self.invalidate(key.decode())
+
+    def _can_store(self) -> bool:
+        return not self._tracking or self._ready.is_set()
+
+    def _reader(self) -> t.Any:
+        if self._tracking and self._ready.is_set():
+            return self._tracked_client
+        return self._client
+
+    def _begin(self, key: str) -> object:
+        token = object()
+        with self._lock:
+            self._pending[key] = token
+        return token
+
+    def _store(self, key: str, token: object, data: bytes | None) -> None:
+        with self._lock:
+            if self._pending.get(key) is not token:
+                return
+            del self._pending[key]
+            if data is None or not self._can_store():
+                return
+
+            ttl = self._ttl
+            if ttl is None and not self._tracking:
+                ttl = 1
+            self._local.set(key, data, ttl)
+
+    def get(self, key: str) -> bytes | None:
+        """Returns the raw reply for the key, reading it from Redis on a miss.
+        """
+        data = self._local.get(key)
+        if data is not None:
+            return data
+
+        token = self._begin(key)
+        data = None
+        try:
+            data = self._reader().get(key)
+        finally:
+            self._store(key, token, data)
+        return data
+
+    def get_many(self, keys: list[str]) -> list[bytes | None]:
+        """Returns the raw replies for the keys, reading misses from Redis
+        with one MGET.
+        """
+        values = [self._local.get(k) for k in keys]
+        missing = [k for k, v in zip(keys, values) if v is None]
+        if not missing:
+            return values
+
+        tokens = [self._begin(k) for k in missing]
+        replies = [None] * len(missing)
+        try:
+            replies = self._reader().mget(missing)
+        finally:
+            for key, token, data in zip(missing, tokens, replies):
+                self._store(key, token, data)
+
+        fetched = dict(zip(missing, replies))
+        return [fetched[k] if v is None else v for k, v in zip(keys, values)]
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._pending.pop(key, None)
+            self._local.delete(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pending.clear()
+            self._local.clear()
@@ -1,27 +1,286 @@
 from functools import cached_property
+import secrets
+import typing as t
+
+from .base import AsyncBaseCache, BaseCache, _fresh_key, _is_reserved, _lock_key
+from .near import NearCache
+from .replicas import ReplicaSet
+from .serializers import tagged_serializer
+from .utils import KEEP_TTL, chunked, iter_pairs
+
+
+# Deletes a lock only if it still holds the caller's token.
+_UNLOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class Deferred:
+    """The result of an operation queued on a RedisPipeline, available once
+    the pipeline has been executed.
+    """
+
+    __slots__ = ('_value', '_done')
+
+    def __init__(self):
+        self._value = None
+        self._done = False
+
+    def __repr__(self):
+        if not self._done:
+            return '<Deferred pending>'
+        return f'<Deferred {self._value!r}>'
+
+    @property
+    def done(self) -> bool:
+        return self._done
+
+    @property
+    def value(self) -> t.Any:
+        if not self._done:
+            raise RuntimeError('The pipeline has not been executed yet.')
+        return self._value
+
+    def _resolve(self, value):
+        self._value = value
+        self._done = True
+
+
+class RedisPipeline:
+    """Queues cache operations and sends them to Redis in one round trip.
+
+    Every method returns a Deferred whose value is set by `execute`. Used as
+    a context manager, the pipeline is executed on exit unless an exception
+    was raised.
+    """
+
+    def __init__(self, cache, transaction=True):
+        self._cache = cache
+        self._serializer = cache.serializer
+        self._pipeline = cache._client.pipeline(transaction=transaction)
+        # (deferred, number of queued commands, converter) triples.
+        self._queued = []
+        # Keys to drop from the cache's near cache once executed.
+        self._written = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.execute()
+        else:
+            self.reset()
+
+    def __len__(self):
+        return len(self._queued)
+
+    def _queue(self, ncommands, convert):
+        deferred = Deferred()
+        self._queued.append((deferred, ncommands, convert))
+        return deferred
+
+    def _loads(self, value, default=None):
+        if value is None:
+            return default
+        return self._serializer.loads(value)
 
-from .base import BaseCache
-from .serializers import redis_serializer
-from .utils import KEEP_TTL
+    def execute(self) -> list:
+        """Send the queued operations and resolve their Deferreds.
 
+        :returns: The list of results, in the order they were queued.
+        """
+        queued, self._queued = self._queued, []
+        written, self._written = self._written, []
+        if not queued:
+            return []
+
+        try:
+            results = iter(self._pipeline.execute())
+        finally:
+            self._cache._invalidate(*written)
+
+        values = []
+        for deferred, ncommands, convert in queued:
+            replies = [next(results) for _ in range(ncommands)]
+            deferred._resolve(convert(*replies))
+            values.append(deferred.value)
+        return values
+
+    def reset(self) -> None:
+        """Discard the queued operations.
+        """
+        self._queued = []
+        self._written = []
+        self._pipeline.reset()
 
-class RedisCache(BaseCache):
+    def get(self, key, default=None):
+        self._pipeline.get(key)
+        return self._queue(1, lambda value: self._loads(value, default))
+
+    def set(self, key, value, ttl=None):
+        self._written.append(key)
+        self._pipeline.set(key, self._serializer.dumps(value), ex=ttl)
+        return self._queue(1, lambda _: None)
+
+    def add(self, key, value, ttl=None):
+        self._written.append(key)
+        self._pipeline.set(key, self._serializer.dumps(value), ex=ttl, nx=True)
+        return self._queue(1, bool)
+
+    def replace(self, key, value, ttl=KEEP_TTL):
+        self._written.append(key)
+        value = self._serializer.dumps(value)
+        if ttl is KEEP_TTL:
+            self._pipeline.set(key, value, keepttl=True, xx=True)
+        else:
+            self._pipeline.set(key, value, ex=ttl, xx=True)
+        return self._queue(1, bool)
+
+    def delete(self, key):
+        self._written.append(key)
+        self._pipeline.delete(key)
+        return self._queue(1, bool)
+
+    def pop(self, key, default=None):
+        self._written.append(key)
+        self._pipeline.get(key)
+        self._pipeline.delete(key)
+        return self._queue(2, lambda value, _: self._loads(value, default))
 
-    serializer = redis_serializer
+    def exists(self, key):
+        self._pipeline.exists(key)
+        return self._queue(1, bool)
+
+    def get_many(self, keys, default=None):
+        keys = list(keys)
+        if not keys:
+            return self._queue(0, lambda: [])
+
+        self._pipeline.mget(keys)
+        return self._queue(1, lambda values: [self._loads(v, default) for v in values])
+
+    def set_many(self, mapping, ttl=None):
+        pairs = list(iter_pairs(mapping))
+        self._written.extend(k for k, _ in pairs)
+        for k, v in pairs:
+            self._pipeline.set(k, self._serializer.dumps(v), ex=ttl)
+        return self._queue(len(pairs), lambda *_: None)
 
-    def __init__(self, client=None, **client_kwargs):
+    def delete_many(self, keys):
+        keys = list(keys)
+        self._written.extend(keys)
+        for k in keys:
+            self._pipeline.delete(k)
+        return self._queue(len(keys), lambda *results: [bool(r) for r in results])
+
+    def get_ttl(self, key, default=0):
+        self._pipeline.ttl(key)
+        return self._queue(1, lambda result: _ttl_result(result, default))
+
+    def set_ttl(self, key, ttl=None):
+        self._written.append(key)
+        if ttl is None:
+            self._pipeline.persist(key)
+            self._pipeline.exists(key)
+            return self._queue(2, lambda _, exists: bool(exists))
+
+        self._pipeline.expire(key, ttl)
+        return self._queue(1, bool)
+
+    def incr(self, key, delta=1):
+        self._written.append(key)
+        self._pipeline.incr(key, delta)
+        return self._queue(1, int)
+
+    def decr(self, key, delta=1):
+        self._written.append(key)
+        self._pipeline.decr(key, delta)
+        return self._queue(1, int)
+
+
+def _ttl_result(result, default):
+    """Convert the reply of TTL into the value get_ttl() returns.
+    """
+    if result == -2:
+        return default
+
+    if result == -1:
+        return None
+
+    return result
+
+
+class RedisCache(BaseCache):
+
+    serializer = tagged_serializer
+    _distributed = True
+
+    # The maximum number of keys sent in a single command or pipeline.
+    batch_size = 1000
+
+    # Values of at least this many bytes, from a serializer with
+    # dumps_buffers(), are sent as SET and APPENDs of their parts rather
+    # than joined into one bytes object first.
+    append_threshold = 1 << 16
+
+    def __init__(
+        self,
+        client=None,
+        near_cache=None,
+        near_ttl=None,
+        replicas=None,
+        replica_strategy='round_robin',
+        health_check_interval=5.0,
+        serializer=None,
+        **client_kwargs
+    ):
+        """
+        :param client: A redis.Redis client.
+        :param near_cache: If set, up to this many recently read values are
+            also kept in process and served from memory. Redis 6 and newer
+            invalidate them through client-side tracking.
+        :param near_ttl: The maximum number of seconds a value is kept in the
+            near cache. Defaults to one second on servers without tracking.
+        :param replicas: redis.Redis clients of read replicas. If given,
+            get, get_many, exists, get_ttl and keys are served by the
+            replicas, and the primary only takes writes, unless no replica
+            is healthy.
+        :param replica_strategy: 'round_robin' or 'least_latency'.
+        :param health_check_interval: The number of seconds between checks
+            of the replicas.
+        :param serializer: Overrides the class's serializer.
+        :param client_kwargs: Arguments for redis.Redis.
+        """
         if client and client_kwargs:
             raise ValueError("Cannot pass a client and client kwargs.")
 
+        if serializer is not None:
+            self.serializer = serializer
+
         if client:
             self._client = client
-            return
-
-        import redis
-        self._client = redis.Redis(**client_kwargs)
+        else:
+            import redis
+            self._client = redis.Redis(**client_kwargs)
+
+        self._near = None
+        if near_cache:
+            self._near = NearCache(self._client, near_cache, near_ttl)
+            self._near.start()
+
+        self._replicas = None
+        if replicas:
+            self._replicas = ReplicaSet(
+                self._client, replicas, replica_strategy, health_check_interval
+            )
+            self._replicas.start()
 
     def __getitem__(self, key):
-        value = self._client.get(key)
+        value = self._get(key)
         if value is None:
             raise KeyError(key)
         return self.serializer.loads(value)
@@ -29,14 +288,16 @@ class RedisCache(BaseCache):
     def __setitem__(self, key, value):
         value = self.serializer.dumps(value)
         self._client.set(key, value)
+        self._invalidate(key)
 
     def __delitem__(self, key):
         result = bool(self._client.delete(key))
+        self._invalidate(key)
         if not result:
             raise KeyError(key)
 
     def __contains__(self, key):
-        return bool(self._client.exists(key))
+        return self.exists(key)
 
     def __iter__(self):
         return self._scan()
@@ -63,81 +324,200 @@ class RedisCache(BaseCache):
             :param count: Number of elements to retrieve per call to the redis server.
         """
         key_set = set()
+        replica = None if self._replicas is None else self._replicas.choose()
+        client = self._client if replica is None else replica.client
+        errors = () if replica is None else self._replicas.errors
         cursor = -1
         while cursor != 0:
-            cursor, keys = self._client.scan(
-                cursor=cursor,
-                match=match,
-                count=count
-            )
+            try:
+                cursor, keys = client.scan(
+                    cursor=cursor,
+                    match=match,
+                    count=count
+                )
+            except errors:
+                # Start over on the primary; keys already seen are skipped.
+                replica.healthy = False
+                client = self._client
+                errors = ()
+                cursor = -1
+                continue
+
             for key in keys:
                 if key in key_set:
                     continue
                 key_set.add(key)
-                yield key.decode()
+                key = key.decode()
+                if not _is_reserved(key):
+                    yield key
 
     def keys(self, pattern=None):
         return self._scan(match=pattern)
 
+    def _read(self, fn):
+        """Call fn with the client reads should go to.
+        """
+        if self._replicas is None:
+            return fn(self._client)
+        return self._replicas.read(fn)
+
+    def _get(self, key):
+        if self._near is not None:
+            return self._near.get(key)
+        return self._read(lambda c: c.get(key))
+
+    def _invalidate(self, *keys):
+        """Drop keys this process just wrote from the near cache, rather than
+        waiting for the server to invalidate them.
+        """
+        if self._near is not None:
+            for key in keys:
+                self._near.invalidate(key)
+
+    def close(self):
+        """Stop the near cache's invalidation thread and the replica health
+        checks, if there are any.
+        """
+        if self._near is not None:
+            self._near.stop()
+            self._near = None
+        if self._replicas is not None:
+            self._replicas.stop()
+            self._replicas = None
+
+    def get(self, key, default=None):
+        value = self._get(key)
+        if value is None:
+            return default
+        return self.serializer.loads(value)
+
     def set(self, key, value, ttl=None):
-        value = self.serializer.dumps(value)
-        self._client.set(key, value, ex=ttl)
+        dumps_buffers = getattr(self.serializer, 'dumps_buffers', None)
+        if dumps_buffers is None:
+            self._client.set(key, self.serializer.dumps(value), ex=ttl)
+        else:
+            self._set_parts(key, dumps_buffers(value), ttl)
+        self._invalidate(key)
+
+    def _set_parts(self, key, parts, ttl):
+        if len(parts) < 2 or sum(memoryview(p).nbytes for p in parts) < self.append_threshold:
+            self._client.set(key, b''.join(parts), ex=ttl)
+            return
+
+        # redis-py writes large arguments to the socket as they are, so
+        # buffers are never copied into a joined value.
+        pipeline = self._client.pipeline(transaction=True)
+        pipeline.set(key, parts[0], ex=ttl)
+        for part in parts[1:]:
+            pipeline.append(key, part)
+        pipeline.execute()
 
     def add(self, key, value, ttl=None):
         value = self.serializer.dumps(value)
-        return bool(self._client.set(key, value, ex=ttl, nx=True))
+        result = bool(self._client.set(key, value, ex=ttl, nx=True))
+        self._invalidate(key)
+        return result
+
+    def _set_fresh(self, key, value, ttl, soft_ttl):
+        if soft_ttl is None:
+            self.set(key, value, ttl)
+            return
+
+        # The value and its freshness marker are written together.
+        pipeline = self._client.pipeline(transaction=True)
+        pipeline.set(key, self.serializer.dumps(value), ex=ttl)
+        if soft_ttl > 0:
+            pipeline.set(_fresh_key(key), self.serializer.dumps(1), ex=soft_ttl)
+        else:
+            pipeline.delete(_fresh_key(key))
+        pipeline.execute()
+        self._invalidate(key)
+
+    def _lock(self, key, timeout):
+        # The token is stored as is, so that the unlock script can compare it.
+        token = secrets.token_hex(16)
+        if self._client.set(_lock_key(key), token, ex=max(1, round(timeout)), nx=True):
+            return token
+        return None
+
+    def _unlock(self, key, token):
+        self._client.eval(_UNLOCK_SCRIPT, 1, _lock_key(key), token)
 
     def replace(self, key, value, ttl=KEEP_TTL):
         value = self.serializer.dumps(value)
         if ttl is KEEP_TTL:
-            return bool(self._client.set(key, value, keepttl=True, xx=True))
-        return bool(self._client.set(key, value, ex=ttl, xx=True))
+            result = self._client.set(key, value, keepttl=True, xx=True)
+        else:
+            result = self._client.set(key, value, ex=ttl, xx=True)
+        self._invalidate(key)
+        return bool(result)
+
+    def delete(self, key):
+        result = bool(self._client.delete(key))
+        self._invalidate(key)
+        return result
 
     def pop(self, key, default=None):
         # GETDEL is available since 6.2.0
         if self._redis_version >= (6, 2, 0):
             value = self._client.getdel(key)
-            if value is None:
-                return default
-            return self.serializer.loads(value)
-
-        p = self._client.pipeline()
-        p.get(key)
-        p.delete(key)
-        value, _ = p.execute()
+        else:
+            p = self._client.pipeline()
+            p.get(key)
+            p.delete(key)
+            value, _ = p.execute()
+
+        self._invalidate(key)
         if value is None:
             return default
         return self.serializer.loads(value)
 
     def get_many(self, keys, default=None):
-        values = self._client.mget(*keys)
+        values = []
+        for chunk in chunked(keys, self.batch_size):
+            if self._near is not None:
+                values.extend(self._near.get_many(chunk))
+            else:
+                values.extend(self._read(lambda c: c.mget(chunk)))
         return (default if v is None else self.serializer.loads(v) for v in values)
 
     def set_many(self, mapping, ttl=None):
-        pipeline = self._client.pipeline()
-        for k, v in mapping:
-            value = self.serializer.dumps(v)
-            pipeline.set(k, value, ex=ttl)
-
-        pipeline.execute()
+        for chunk in chunked(iter_pairs(mapping), self.batch_size):
+            if ttl is None:
+                self._client.mset({k: self.serializer.dumps(v) for k, v in chunk})
+            else:
+                # Atomicity isn't needed, so skip the MULTI/EXEC round trip.
+                pipeline = self._client.pipeline(transaction=False)
+                for k, v in chunk:
+                    pipeline.set(k, self.serializer.dumps(v), ex=ttl)
+                pipeline.execute()
+            self._invalidate(*(k for k, _ in chunk))
 
     def delete_many(self, keys):
-        pipeline = self._client.pipeline()
-        for k in keys:
-            pipeline.delete(k)
-        return (bool(result) for result in pipeline.execute())
+        # DEL with many keys only returns a count, so queue one command per
+        # key to learn which ones existed. UNLINK frees values in the
+        # background.
+        unlink = self._redis_version >= (4, 0, 0)
+        results = []
+        for chunk in chunked(keys, self.batch_size):
+            pipeline = self._client.pipeline(transaction=False)
+            for k in chunk:
+                if unlink:
+                    pipeline.unlink(k)
+                else:
+                    pipeline.delete(k)
+            results.extend(pipeline.execute())
+            self._invalidate(*chunk)
+        return (bool(result) for result in results)
+
+    def exists(self, key):
+        return bool(self._read(lambda c: c.exists(key)))
 
     def get_ttl(self, key, default=0):
-        result = self._client.ttl(key)
-        if result == -2:
-            return default
-
-        if result == -1:
-            return None
-
-        return result
+        return _ttl_result(self._read(lambda c: c.ttl(key)), default)
 
     def set_ttl(self, key, ttl=None):
+        self._invalidate(key)
         if ttl is None:
             pipeline = self._client.pipeline()
             # persist returns False if either the key does not exist
@@ -150,11 +530,207 @@ class RedisCache(BaseCache):
 
         return bool(self._client.expire(key, ttl))
 
+    def pipeline(self, transaction=True):
+        """Returns a RedisPipeline that queues operations until it is
+        executed.
+
+        :param transaction: True, if the operations should be applied
+            atomically with MULTI/EXEC.
+        """
+        return RedisPipeline(self, transaction=transaction)
+
+    def batch(self):
+        """Returns a non-transactional RedisPipeline, for when only the
+        round trip matters.
+        """
+        return self.pipeline(transaction=False)
+
     def incr(self, key, delta=1):
-        return self._client.incr(key, delta)
+        result = self._client.incr(key, delta)
+        self._invalidate(key)
+        return result
 
     def decr(self, key, delta=1):
-        return self._client.decr(key, delta)
+        result = self._client.decr(key, delta)
+        self._invalidate(key)
+        return result
 
     def clear(self):
         self._client.flushdb()
+        if self._near is not None:
+            self._near.clear()
+
+
+class AsyncRedisCache(AsyncBaseCache):
+    """RedisCache for asyncio, built on redis.asyncio.
+    """
+
+    serializer = tagged_serializer
+    batch_size = RedisCache.batch_size
+    _distributed = True
+
+    def __init__(self, client=None, serializer=None, **client_kwargs):
+        if client and client_kwargs:
+            raise ValueError("Cannot pass a client and client kwargs.")
+
+        if serializer is not None:
+            self.serializer = serializer
+
+        self._version = None
+        if client:
+            self._client = client
+            return
+
+        import redis.asyncio
+        self._client = redis.asyncio.Redis(**client_kwargs)
+
+    def __aiter__(self):
+        return self._scan()
+
+    async def _redis_version(self):
+        """Returns the redis version as a 3-tuple of ints.
+        """
+        if self._version is None:
+            info = await self._client.info()
+            version = info['redis_version']
+            self._version = tuple(int(n) for n in version.split('.'))
+        return self._version
+
+    async def _scan(self, match=None, count=None):
+        """See RedisCache._scan.
+        """
+        key_set = set()
+        cursor = -1
+        while cursor != 0:
+            cursor, keys = await self._client.scan(
+                cursor=max(cursor, 0),
+                match=match,
+                count=count
+            )
+            for key in keys:
+                if key in key_set:
+                    continue
+                key_set.add(key)
+                key = key.decode()
+                if not _is_reserved(key):
+                    yield key
+
+    def keys(self, pattern=None):
+        return self._scan(match=pattern)
+
+    async def get(self, key, default=None):
+        value = await self._client.get(key)
+        if value is None:
+            return default
+        return self.serializer.loads(value)
+
+    async def set(self, key, value, ttl=None):
+        value = self.serializer.dumps(value)
+        await self._client.set(key, value, ex=ttl)
+
+    async def add(self, key, value, ttl=None):
+        value = self.serializer.dumps(value)
+        return bool(await self._client.set(key, value, ex=ttl, nx=True))
+
+    async def _set_fresh(self, key, value, ttl, soft_ttl):
+        if soft_ttl is None:
+            await self.set(key, value, ttl)
+            return
+
+        pipeline = self._client.pipeline(transaction=True)
+        pipeline.set(key, self.serializer.dumps(value), ex=ttl)
+        if soft_ttl > 0:
+            pipeline.set(_fresh_key(key), self.serializer.dumps(1), ex=soft_ttl)
+        else:
+            pipeline.delete(_fresh_key(key))
+        await pipeline.execute()
+
+    async def _lock(self, key, timeout):
+        token = secrets.token_hex(16)
+        if await self._client.set(_lock_key(key), token, ex=max(1, round(timeout)), nx=True):
+            return token
+        return None
+
+    async def _unlock(self, key, token):
+        await self._client.eval(_UNLOCK_SCRIPT, 1, _lock_key(key), token)
+
+    async def replace(self, key, value, ttl=KEEP_TTL):
+        value = self.serializer.dumps(value)
+        if ttl is KEEP_TTL:
+            return bool(await self._client.set(key, value, keepttl=True, xx=True))
+        return bool(await self._client.set(key, value, ex=ttl, xx=True))
+
+    async def delete(self, key):
+        return bool(await self._client.delete(key))
+
+    async def pop(self, key, default=None):
+        # GETDEL is available since 6.2.0
+        if await self._redis_version() >= (6, 2, 0):
+            value = await self._client.getdel(key)
+        else:
+            p = self._client.pipeline()
+            p.get(key)
+            p.delete(key)
+            value, _ = await p.execute()
+
+        if value is None:
+            return default
+        return self.serializer.loads(value)
+
+    async def exists(self, key):
+        return bool(await self._client.exists(key))
+
+    async def get_many(self, keys, default=None):
+        values = []
+        for chunk in chunked(keys, self.batch_size):
+            values.extend(await self._client.mget(chunk))
+        return [default if v is None else self.serializer.loads(v) for v in values]
+
+    async def set_many(self, mapping, ttl=None):
+        for chunk in chunked(iter_pairs(mapping), self.batch_size):
+            if ttl is None:
+                await self._client.mset({k: self.serializer.dumps(v) for k, v in chunk})
+                continue
+
+            pipeline = self._client.pipeline(transaction=False)
+            for k, v in chunk:
+                pipeline.set(k, self.serializer.dumps(v), ex=ttl)
+            await pipeline.execute()
+
+    async def delete_many(self, keys):
+        unlink = await self._redis_version() >= (4, 0, 0)
+        results = []
+        for chunk in chunked(keys, self.batch_size):
+            pipeline = self._client.pipeline(transaction=False)
+            for k in chunk:
+                if unlink:
+                    pipeline.unlink(k)
+                else:
+                    pipeline.delete(k)
+            results.extend(await pipeline.execute())
+        return [bool(result) for result in results]
+
+    async def get_ttl(self, key, default=0):
+        return _ttl_result(await self._client.ttl(key), default)
+
+    async def set_ttl(self, key, ttl=None):
+        if ttl is None:
+            pipeline = self._client.pipeline()
+            pipeline.persist(key)
+            pipeline.exists(key)
+            _, exists = await pipeline.execute()
+            return bool(exists)
+
+        return bool(await self._client.expire(key, ttl))
+
+    async def incr(self, key, delta=1):
+        return await self._client.incr(key, delta)
+
+    async def decr(self, key, delta=1):
+        return await self._client.decr(key, delta)
+
+    async def clear(self):
+        await self._client.flushdb()
+
+    async def aclose(self):
+        await self._client.aclose()
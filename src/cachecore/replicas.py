@@ -0,0 +1,128 @@
+from itertools import count
+import threading
+import time
+import typing as t
+
+
+# The weight of the newest sample in a replica's latency average.
+_LATENCY_ALPHA = 0.2
+
+
+class Replica:
+    """A read replica and what is known about its state.
+    """
+
+    __slots__ = ('client', 'healthy', 'latency')
+
+    def __init__(self, client: t.Any):
+        self.client = client
+        self.healthy = True
+        self.latency = 0.0
+
+    def __repr__(self):
+        return f'<Replica healthy={self.healthy} latency={self.latency:.6f}>'
+
+    def observe(self, seconds: float) -> None:
+        self.latency += _LATENCY_ALPHA * (seconds - self.latency)
+
+
+class ReplicaSet:
+    """Spreads reads over Redis replicas, falling back to the primary.
+
+    A background thread checks every replica with INFO replication. A
+    replica is used while it answers and, for a replica of another server,
+    while its link to the primary is up. A replica that fails a read is
+    skipped until the next check succeeds.
+
+    :param primary: The redis.Redis client of the primary.
+    :param replicas: The redis.Redis clients of the replicas.
+    :param strategy: 'round_robin', or 'least_latency' to prefer the replica
+        with the lowest average response time.
+    :param check_interval: The number of seconds between health checks.
+    """
+
+    def __init__(
+        self,
+        primary: t.Any,
+        replicas: t.Iterable[t.Any],
+        strategy: str = 'round_robin',
+        check_interval: float = 5.0
+    ):
+        if strategy not in ('round_robin', 'least_latency'):
+            raise ValueError(f"Unknown replica strategy '{strategy}'.")
+
+        import redis
+        # The errors after which a read is retried on the primary.
+        self.errors = (redis.ConnectionError, redis.TimeoutError)
+
+        self._primary = primary
+        self.replicas = [Replica(client) for client in replicas]
+        self._strategy = strategy
+        self._check_interval = check_interval
+        self._counter = count()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        """Check the replicas and start checking them periodically.
+        """
+        self.check()
+        self._thread = threading.Thread(
+            target=self._run, name='cachecore-replicas', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self._check_interval):
+            self.check()
+
+    def check(self) -> None:
+        """Update the health and latency of every replica.
+        """
+        import redis
+        for replica in self.replicas:
+            start = time.perf_counter()
+            try:
+                info = replica.client.info('replication')
+            except redis.RedisError:
+                replica.healthy = False
+                continue
+
+            replica.observe(time.perf_counter() - start)
+            replica.healthy = (
+                info.get('role') != 'slave' or info.get('master_link_status') == 'up'
+            )
+
+    def choose(self) -> Replica | None:
+        """Returns the replica to read from, or None if none are healthy.
+        """
+        healthy = [r for r in self.replicas if r.healthy]
+        if not healthy:
+            return None
+        if self._strategy == 'least_latency':
+            return min(healthy, key=lambda r: r.latency)
+        return healthy[next(self._counter) % len(healthy)]
+
+    def read(self, fn: t.Callable[[t.Any], t.Any]) -> t.Any:
+        """Call fn with the client of a replica, or of the primary if no
+        replica is healthy or the chosen one fails.
+        """
+        replica = self.choose()
+        if replica is None:
+            return fn(self._primary)
+
+        start = time.perf_counter()
+        try:
+            result = fn(replica.client)
+        except self.errors:
+            replica.healthy = False
+            return fn(self._primary)
+
+        replica.observe(time.perf_counter() - start)
+        return result
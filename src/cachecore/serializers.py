@@ -1,6 +1,13 @@
+import dataclasses
+from datetime import date, datetime
+from decimal import Decimal
+from hashlib import blake2b
 import pickle
 import json
-from typing import Any, Protocol, runtime_checkable
+import threading
+from struct import Struct, error as StructError
+from typing import Any, Callable, Protocol, runtime_checkable
+from uuid import UUID
 
 
 @runtime_checkable
@@ -31,6 +38,107 @@ class JSONSerializer:
         return json.loads(data, cls=self.decoder)
 
 
+# MessagePack extension type codes used by MsgPackSerializer.
+_EXT_DATETIME = 1
+_EXT_DATE = 2
+_EXT_DECIMAL = 3
+_EXT_UUID = 4
+
+
+class MsgPackSerializer:
+    """Serializes with MessagePack, which is more compact and faster than
+    JSON. Requires the msgpack package.
+
+    datetimes, dates, Decimals and UUIDs round trip as extension types 1
+    to 4, and dataclasses are stored as dicts. Tuples come back as lists.
+
+    :param default: Called with objects msgpack can't serialize, returning
+        a serializable replacement, e.g. a msgpack.ExtType.
+    :param ext_hook: Called with the code and data of extension types other
+        than the ones above, returning the decoded object.
+    """
+
+    def __init__(
+        self,
+        default: Callable[[Any], Any] | None = None,
+        ext_hook: Callable[[int, bytes], Any] | None = None
+    ):
+        import msgpack
+        self._msgpack = msgpack
+        self._default = default
+        self._ext_hook = ext_hook
+
+    def _encode(self, obj: Any) -> Any:
+        tp = type(obj)
+        ExtType = self._msgpack.ExtType
+        if tp is datetime:
+            return ExtType(_EXT_DATETIME, obj.isoformat().encode())
+        if tp is date:
+            return ExtType(_EXT_DATE, obj.isoformat().encode())
+        if tp is Decimal:
+            return ExtType(_EXT_DECIMAL, str(obj).encode())
+        if tp is UUID:
+            return ExtType(_EXT_UUID, obj.bytes)
+        if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+            return dataclasses.asdict(obj)
+        if self._default is not None:
+            return self._default(obj)
+        raise TypeError(f'Cannot serialize {tp.__name__} with msgpack.')
+
+    def _decode(self, code: int, data: bytes) -> Any:
+        if code == _EXT_DATETIME:
+            return datetime.fromisoformat(data.decode())
+        if code == _EXT_DATE:
+            return date.fromisoformat(data.decode())
+        if code == _EXT_DECIMAL:
+            return Decimal(data.decode())
+        if code == _EXT_UUID:
+            return UUID(bytes=data)
+        if self._ext_hook is not None:
+            return self._ext_hook(code, data)
+        return self._msgpack.ExtType(code, data)
+
+    def dumps(self, obj: Any) -> bytes:
+        return self._msgpack.packb(obj, default=self._encode, use_bin_type=True, datetime=False)
+
+    def loads(self, data: bytes | memoryview) -> Any:
+        return self._msgpack.unpackb(
+            data, ext_hook=self._decode, raw=False, strict_map_key=False
+        )
+
+
+class OrjsonSerializer:
+    """Serializes JSON with orjson, several times faster than the json
+    module. Requires the orjson package.
+
+    datetimes, dates, UUIDs and dataclasses are serialized natively and
+    Decimals as strings. Like any JSON, they come back as strings and dicts.
+
+    :param default: Called with objects orjson can't serialize, returning a
+        serializable replacement.
+    :param option: orjson.OPT_* flags, e.g. orjson.OPT_SERIALIZE_NUMPY.
+    """
+
+    def __init__(self, default: Callable[[Any], Any] | None = None, option: int = 0):
+        import orjson
+        self._orjson = orjson
+        self._default = default
+        self._option = option
+
+    def _encode(self, obj: Any) -> Any:
+        if type(obj) is Decimal:
+            return str(obj)
+        if self._default is not None:
+            return self._default(obj)
+        raise TypeError(f'Cannot serialize {type(obj).__name__} with orjson.')
+
+    def dumps(self, obj: Any) -> bytes:
+        return self._orjson.dumps(obj, default=self._encode, option=self._option)
+
+    def loads(self, data: bytes | memoryview) -> Any:
+        return self._orjson.loads(data)
+
+
 class RedisSerializer:
 
     def __init__(self, protocol=pickle.DEFAULT_PROTOCOL):
@@ -48,4 +156,374 @@ class RedisSerializer:
             return pickle.loads(data)
 
 
+_RAW = b'R'
+_PICKLE = b'P'
+_COUNT = Struct('<I')
+_LENGTH = Struct('<Q')
+
+
+class Pickle5Serializer:
+    """Pickles with protocol 5, keeping buffers that support out-of-band
+    pickling (NumPy arrays, pickle.PickleBuffer, ...) out of the pickle
+    stream so that they are never copied into it. Top level bytes are
+    stored as is.
+
+    Loading from a memoryview, e.g. of a memory-mapped file, is zero-copy:
+    out-of-band buffers and top level bytes come back as read-only views
+    of it.
+
+    Layout: b'R' followed by the raw bytes, or b'P' followed by the number
+    of buffers, the length of the pickle and of each buffer, the pickle and
+    the buffers.
+    """
+
+    def dumps_buffers(self, obj: Any) -> list:
+        """Returns the serialized object as a list of bytes-like parts, so
+        that buffers can be written out without joining them first.
+        """
+        if type(obj) is bytes:
+            return [_RAW, obj]
+
+        buffers = []
+        data = pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+        raws = [buffer.raw() for buffer in buffers]
+        header = [_PICKLE, _COUNT.pack(len(raws)), _LENGTH.pack(len(data))]
+        header.extend(_LENGTH.pack(raw.nbytes) for raw in raws)
+        return [b''.join(header), data, *raws]
+
+    def dumps(self, obj: Any) -> bytes:
+        return b''.join(self.dumps_buffers(obj))
+
+    def loads(self, data: bytes | memoryview) -> Any:
+        view = memoryview(data)
+        flag = bytes(view[:1])
+        if flag == _RAW:
+            if isinstance(data, memoryview):
+                return view[1:].toreadonly()
+            return bytes(view[1:])
+
+        if flag != _PICKLE:
+            raise ValueError('Not a Pickle5Serializer payload.')
+
+        try:
+            count = _COUNT.unpack_from(view, 1)[0]
+            offset = 1 + _COUNT.size
+            lengths = [
+                _LENGTH.unpack_from(view, offset + i * _LENGTH.size)[0]
+                for i in range(count + 1)
+            ]
+        except StructError as e:
+            raise ValueError('Truncated Pickle5Serializer payload.') from e
+
+        offset += len(lengths) * _LENGTH.size
+        if offset + sum(lengths) > view.nbytes:
+            raise ValueError('Truncated Pickle5Serializer payload.')
+
+        parts = []
+        for length in lengths:
+            parts.append(view[offset:offset + length].toreadonly())
+            offset += length
+        return pickle.loads(parts[0], buffers=parts[1:])
+
+
+# Tags of TaggedSerializer payloads. Integers are not tagged, and pickles
+# written before the tags existed start with the PROTO opcode, 0x80.
+_TAG_BYTES = 0x10
+_TAG_STR = 0x11
+_TAG_PICKLE = 0x12
+_TAG_JSON = 0x13
+_TAG_MSGPACK = 0x14
+_LEGACY_PICKLE = 0x80
+
+# An optional minus sign followed by a digit.
+_INT_START = frozenset(b'-0123456789')
+
+
+class TaggedSerializer:
+    """Serializes values behind a one byte type tag, so that loading never
+    has to guess the type.
+
+    Integers are stored as ASCII digits without a tag, so that INCR and
+    DECR work on them in Redis and Memcached. Bytes and str are stored as
+    is after their tag. Anything else is pickled, or encoded with the
+    `fallback` format. Payloads of RedisSerializer, i.e. digits or a
+    pickle, can still be loaded.
+
+    Version 1 tags: 0x10 bytes, 0x11 str, 0x12 pickle, 0x13 JSON,
+    0x14 MessagePack.
+
+    :param fallback: How other values are encoded: 'pickle', 'json' or
+        'msgpack'. Any format can be loaded regardless.
+    :param protocol: The pickle protocol.
+    """
+
+    def __init__(self, fallback: str = 'pickle', protocol: int = pickle.DEFAULT_PROTOCOL):
+        if fallback not in ('pickle', 'json', 'msgpack'):
+            raise ValueError(f"Unknown fallback format '{fallback}'.")
+        if fallback == 'msgpack':
+            import msgpack  # noqa: F401
+
+        self.fallback = fallback
+        self.protocol = protocol
+
+    def dumps(self, obj: Any) -> bytes:
+        tp = type(obj)
+        if tp is int:
+            return b'%d' % obj
+        if tp is bytes:
+            return b'\x10' + obj
+        if tp is str:
+            return b'\x11' + obj.encode()
+
+        if self.fallback == 'json':
+            return b'\x13' + json.dumps(obj, separators=(',', ':')).encode()
+        if self.fallback == 'msgpack':
+            import msgpack
+            return b'\x14' + msgpack.packb(obj)
+        return b'\x12' + pickle.dumps(obj, protocol=self.protocol)
+
+    def loads(self, data: bytes | memoryview) -> Any:
+        if not data:
+            raise ValueError('Empty TaggedSerializer payload.')
+
+        tag = data[0]
+        if tag == _TAG_STR:
+            return str(data[1:], 'utf-8')
+        if tag == _TAG_BYTES:
+            return bytes(data[1:])
+        if tag == _TAG_PICKLE:
+            return pickle.loads(data[1:])
+        if tag in _INT_START:
+            return int(data)
+        if tag == _LEGACY_PICKLE:
+            return pickle.loads(data)
+        if tag == _TAG_JSON:
+            return json.loads(bytes(data[1:]))
+        if tag == _TAG_MSGPACK:
+            import msgpack
+            return msgpack.unpackb(data[1:])
+        raise ValueError(f'Unknown TaggedSerializer tag 0x{tag:02x}.')
+
+
 redis_serializer = RedisSerializer()
+tagged_serializer = TaggedSerializer()
+
+
+# Compressed payloads start with this byte, which no other payload of
+# TaggedSerializer starts with, followed by the codec's id. The id's high
+# bit is set if a dictionary was used, and then followed by the first
+# _DICTIONARY_ID_SIZE bytes of the dictionary's BLAKE2b hash.
+_COMPRESSED = 0xC1
+_STORED = 0
+_DICTIONARY = 0x80
+_DICTIONARY_ID_SIZE = 4
+
+
+class _ZlibCodec:
+    id = 1
+
+    def __init__(self, level, dictionary):
+        import zlib
+        self._zlib = zlib
+        self._level = -1 if level is None else level
+        self._dictionary = dictionary
+
+    def compress(self, data):
+        if self._dictionary is None:
+            return self._zlib.compress(data, self._level)
+        c = self._zlib.compressobj(self._level, zdict=self._dictionary)
+        return c.compress(data) + c.flush()
+
+    def decompress(self, data, dictionary):
+        if dictionary is None:
+            return self._zlib.decompress(data)
+        d = self._zlib.decompressobj(zdict=dictionary)
+        return d.decompress(data) + d.flush()
+
+
+class _LzmaCodec:
+    id = 2
+
+    def __init__(self, level, dictionary):
+        import lzma
+        if dictionary is not None:
+            raise ValueError('lzma does not support dictionaries.')
+        self._lzma = lzma
+        self._level = level
+
+    def compress(self, data):
+        return self._lzma.compress(data, preset=self._level)
+
+    def decompress(self, data, dictionary):
+        return self._lzma.decompress(data)
+
+
+class _ZstdCodec:
+    id = 3
+
+    def __init__(self, level, dictionary):
+        import zstandard
+        self._zstd = zstandard
+        self._level = 3 if level is None else level
+        self._dictionary = None
+        if dictionary is not None:
+            self._dictionary = zstandard.ZstdCompressionDict(dictionary)
+        # Compressors and decompressors may not be shared between threads.
+        self._local = threading.local()
+
+    def compress(self, data):
+        c = getattr(self._local, 'compressor', None)
+        if c is None:
+            c = self._local.compressor = self._zstd.ZstdCompressor(
+                level=self._level, dict_data=self._dictionary
+            )
+        return c.compress(data)
+
+    def decompress(self, data, dictionary):
+        d = getattr(self._local, 'decompressor', None)
+        if d is None:
+            d = self._local.decompressor = self._zstd.ZstdDecompressor(dict_data=self._dictionary)
+        return d.decompress(data)
+
+
+class _Lz4Codec:
+    id = 4
+
+    def __init__(self, level, dictionary):
+        import lz4.frame
+        if dictionary is not None:
+            raise ValueError('lz4 does not support dictionaries.')
+        self._lz4 = lz4.frame
+        self._level = 0 if level is None else level
+
+    def compress(self, data):
+        return self._lz4.compress(data, compression_level=self._level)
+
+    def decompress(self, data, dictionary):
+        return self._lz4.decompress(data)
+
+
+_CODECS = {
+    'zlib': _ZlibCodec,
+    'lzma': _LzmaCodec,
+    'zstd': _ZstdCodec,
+    'lz4': _Lz4Codec,
+}
+
+
+class CompressedSerializer:
+    """Wraps a serializer, compressing payloads of at least `threshold`
+    bytes. Smaller payloads, and ones that don't shrink, are stored
+    uncompressed, so reading them costs one byte comparison.
+
+    Compressed payloads start with 0xC1 and the codec's id, so payloads
+    compressed with any codec can be read as long as its package is
+    installed. Payloads compressed with a dictionary also carry its id, so
+    that reading one without the same codec and dictionary raises a
+    ValueError instead of failing to decompress. The wrapped serializer's payloads must not start with 0xC1,
+    which TaggedSerializer's never do; others are escaped.
+
+    :param serializer: The wrapped serializer. Defaults to TaggedSerializer.
+    :param codec: 'zlib' or 'lzma' from the standard library, or 'zstd' or
+        'lz4' if zstandard or lz4 is installed.
+    :param threshold: The minimum size of a payload to compress.
+    :param level: The compression level, or the codec's default.
+    :param dictionary: A dictionary made by train_dictionary(), for 'zlib'
+        or 'zstd'. Payloads written with it can only be read with it.
+    """
+
+    def __init__(
+        self,
+        serializer: SerializerInterface | None = None,
+        codec: str = 'zlib',
+        threshold: int = 1024,
+        level: int | None = None,
+        dictionary: bytes | None = None
+    ):
+        if codec not in _CODECS:
+            raise ValueError(f"Unknown codec '{codec}'.")
+
+        self.serializer = serializer or tagged_serializer
+        self.threshold = threshold
+        self._codec = _CODECS[codec](level, dictionary)
+        self._codec_id = self._codec.id
+        self._dictionary = dictionary
+        self._prefix = bytes((_COMPRESSED, self._codec.id))
+        if dictionary is not None:
+            self._codec_id |= _DICTIONARY
+            self._dictionary_id = blake2b(dictionary, digest_size=_DICTIONARY_ID_SIZE).digest()
+            self._prefix = bytes((_COMPRESSED, self._codec_id)) + self._dictionary_id
+        self._decoders = {self._codec.id: self._codec}
+
+    def dumps(self, obj: Any) -> bytes:
+        data = self.serializer.dumps(obj)
+        if len(data) >= self.threshold:
+            compressed = self._codec.compress(data)
+            if len(compressed) + len(self._prefix) < len(data):
+                return self._prefix + compressed
+
+        if data[:1] == b'\xc1':
+            return bytes((_COMPRESSED, _STORED)) + data
+        return data
+
+    def loads(self, data: bytes | memoryview) -> Any:
+        if data[:1] != b'\xc1':
+            return self.serializer.loads(data)
+
+        if len(data) < 2:
+            raise ValueError('Truncated CompressedSerializer payload.')
+        codec_id = data[1]
+        if codec_id == _STORED:
+            return self.serializer.loads(data[2:])
+
+        if not codec_id & _DICTIONARY:
+            return self.serializer.loads(self._decoder(codec_id).decompress(data[2:], None))
+
+        # A dictionary is tied to the codec it was made for, so only this
+        # instance's codec can decompress the payload.
+        if self._dictionary is None:
+            raise ValueError('The payload was compressed with a dictionary.')
+        if codec_id != self._codec_id:
+            raise ValueError('The payload was compressed with a dictionary for another codec.')
+        start = 2 + _DICTIONARY_ID_SIZE
+        if data[2:start] != self._dictionary_id:
+            raise ValueError('The payload was compressed with another dictionary.')
+        return self.serializer.loads(self._codec.decompress(data[start:], self._dictionary))
+
+    def _decoder(self, codec_id: int) -> Any:
+        decoder = self._decoders.get(codec_id)
+        if decoder is None:
+            for cls in _CODECS.values():
+                if cls.id == codec_id:
+                    break
+            else:
+                raise ValueError(f'Unknown codec id {codec_id}.')
+            decoder = self._decoders[codec_id] = cls(None, None)
+        return decoder
+
+    @staticmethod
+    def train_dictionary(samples: list[bytes], size: int = 16384, codec: str = 'zlib') -> bytes:
+        """Builds a dictionary from typical serialized values, which helps
+        compressing small values that share structure.
+
+        :param samples: Serialized values, e.g. serializer.dumps(value).
+        :param size: The maximum size of the dictionary. zlib only uses the
+            last 32 KiB.
+        :param codec: 'zstd' trains a dictionary with zstandard. 'zlib'
+            doesn't train anything: the dictionary is the distinct samples
+            concatenated, most common last, where zlib finds them cheapest
+            to reference, and cut to `size`. That works for values sharing
+            most of their bytes; prefer 'zstd' otherwise.
+        """
+        if codec == 'zstd':
+            import zstandard
+            return zstandard.train_dictionary(size, samples).as_bytes()
+
+        if codec != 'zlib':
+            raise ValueError(f"Dictionaries are not supported by '{codec}'.")
+
+        counts = {}
+        for sample in samples:
+            counts[bytes(sample)] = counts.get(bytes(sample), 0) + 1
+        ordered = sorted(counts, key=counts.get)
+        return b''.join(ordered)[-min(size, 32768):]
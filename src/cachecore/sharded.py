@@ -0,0 +1,240 @@
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+from hashlib import md5
+from itertools import chain
+import typing as t
+
+from .base import BaseCache
+from .interface import CacheInterface
+from .utils import KEEP_TTL, iter_pairs, map_in_context
+
+
+_MISSING = object()
+
+
+def _ketama_hash(data: bytes) -> int:
+    return int.from_bytes(md5(data).digest()[:4], 'little')
+
+
+class HashRing:
+    """A consistent hash ring laid out like libketama, so that keys map to
+    the same servers as in other ketama clients when nodes are named
+    'host:port'.
+
+    :param nodes: The node names.
+    :param weights: The relative weight of each node, 1 by default.
+    :param vnodes: The average number of points per node on the ring.
+    """
+
+    def __init__(
+        self,
+        nodes: t.Iterable[str],
+        weights: t.Mapping[str, int] | None = None,
+        vnodes: int = 160
+    ):
+        nodes = list(nodes)
+        if not nodes:
+            raise ValueError('A hash ring needs at least one node.')
+
+        weights = weights or {}
+        total = sum(weights.get(n, 1) for n in nodes)
+        points = []
+        for node in nodes:
+            # Every MD5 digest yields four points.
+            share = weights.get(node, 1) / total
+            for i in range(int(share * len(nodes) * vnodes / 4)):
+                digest = md5(f'{node}-{i}'.encode()).digest()
+                for j in range(4):
+                    point = int.from_bytes(digest[j * 4:j * 4 + 4], 'little')
+                    points.append((point, node))
+
+        points.sort()
+        self._points = [p for p, _ in points]
+        self._nodes = [n for _, n in points]
+
+    def get_node(self, key: str) -> str:
+        """Returns the node owning the key: the first point at or after the
+        key's hash.
+        """
+        idx = bisect_left(self._points, _ketama_hash(key.encode()))
+        if idx == len(self._points):
+            idx = 0
+        return self._nodes[idx]
+
+
+class ShardedCache(BaseCache):
+    """Spreads keys over several caches with a consistent hash ring, so
+    adding or removing a node only moves the keys on its part of the ring.
+
+    Batch operations are split by node and sent to the nodes in parallel,
+    and `keys`, `clear` and `len` fan out to every node.
+
+    :param nodes: The caches, by name. Use 'host:port' names for the same
+        key placement as other ketama clients.
+    :param weights: The relative weight of each node, 1 by default.
+    :param vnodes: The average number of points per node on the ring.
+    :param max_workers: The number of threads used to call nodes in
+        parallel. Defaults to the number of nodes.
+    """
+
+    def __init__(
+        self,
+        nodes: t.Mapping[str, CacheInterface],
+        weights: t.Mapping[str, int] | None = None,
+        vnodes: int = 160,
+        max_workers: int | None = None
+    ):
+        self.nodes = dict(nodes)
+        self._ring = HashRing(self.nodes, weights, vnodes)
+        self._max_workers = max_workers or len(self.nodes)
+
+    @property
+    def _children(self) -> tuple[CacheInterface, ...]:
+        return tuple(self.nodes.values())
+
+    @property
+    def _distributed(self) -> bool:
+        return any(node._distributed for node in self.nodes.values())
+
+    @property
+    def _thread_safe(self) -> bool:
+        # Batch operations call nodes from the thread pool.
+        return all(node._thread_safe for node in self.nodes.values())
+
+    def __getitem__(self, key: str) -> t.Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: t.Any):
+        self.set(key, value)
+
+    def __delitem__(self, key: str):
+        if not self.delete(key):
+            raise KeyError(key)
+
+    def __contains__(self, key: str) -> bool:
+        return self.exists(key)
+
+    def __iter__(self) -> t.Iterator[str]:
+        return self.keys()
+
+    def __len__(self) -> int:
+        return sum(self._fan_out(len, self.nodes.values()))
+
+    def node(self, key: str) -> CacheInterface:
+        """Returns the cache a key is stored in.
+        """
+        return self.nodes[self._ring.get_node(key)]
+
+    @cached_property
+    def _executor(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(self._max_workers, thread_name_prefix='cachecore-sharded')
+
+    def _fan_out(self, fn: t.Callable, items: t.Iterable) -> list:
+        """Apply fn to every item, in the thread pool if there is more than
+        one item.
+        """
+        items = list(items)
+        if len(items) < 2:
+            return [fn(item) for item in items]
+        return list(map_in_context(self._executor, fn, items))
+
+    def _group(self, keys: t.Iterable[str]) -> dict[str, list[tuple[int, str]]]:
+        """Groups keys by node, keeping each key's position.
+        """
+        groups = {}
+        for i, key in enumerate(keys):
+            groups.setdefault(self._ring.get_node(key), []).append((i, key))
+        return groups
+
+    def _scatter(self, keys: t.Iterable[str], fn: t.Callable) -> list:
+        """Calls fn(node, keys) for each node's share of the keys and
+        returns the results in the order of the keys.
+        """
+        keys = list(keys)
+        groups = list(self._group(keys).items())
+
+        def call(group):
+            name, items = group
+            return list(fn(self.nodes[name], [k for _, k in items]))
+
+        results = [None] * len(keys)
+        for (_, items), values in zip(groups, self._fan_out(call, groups)):
+            for (i, _), value in zip(items, values):
+                results[i] = value
+        return results
+
+    def close(self) -> None:
+        """Shut down the thread pool used to call nodes in parallel.
+        """
+        executor = self.__dict__.pop('_executor', None)
+        if executor is not None:
+            executor.shutdown()
+
+    def keys(self, pattern: str | None = None) -> t.Iterator[str]:
+        return chain.from_iterable(
+            self._fan_out(lambda node: list(node.keys(pattern)), self.nodes.values())
+        )
+
+    def get(self, key: str, default: t.Any = None) -> t.Any:
+        return self.node(key).get(key, default)
+
+    def set(self, key: str, value: t.Any, ttl: int | None = None) -> None:
+        self.node(key).set(key, value, ttl)
+
+    def add(self, key: str, value: t.Any, ttl: int | None = None) -> bool:
+        return self.node(key).add(key, value, ttl)
+
+    def replace(self, key: str, value: t.Any, ttl: int | None = KEEP_TTL) -> bool:
+        return self.node(key).replace(key, value, ttl)
+
+    def delete(self, key: str) -> bool:
+        return self.node(key).delete(key)
+
+    def pop(self, key: str, default: t.Any = None) -> t.Any:
+        return self.node(key).pop(key, default)
+
+    def exists(self, key: str) -> bool:
+        return self.node(key).exists(key)
+
+    def get_many(self, keys: t.Iterable[str], default: t.Any = None) -> t.Iterable[t.Any]:
+        return iter(self._scatter(keys, lambda node, keys: node.get_many(keys, default)))
+
+    def set_many(self, mapping: t.Mapping[str, t.Any] | t.Iterable[tuple[str, t.Any]], ttl: int | None = None) -> None:
+        groups = {}
+        for key, value in iter_pairs(mapping):
+            groups.setdefault(self._ring.get_node(key), []).append((key, value))
+        self._fan_out(lambda group: self.nodes[group[0]].set_many(group[1], ttl), groups.items())
+
+    def delete_many(self, keys: t.Iterable[str]) -> t.Iterable[bool]:
+        return iter(self._scatter(keys, lambda node, keys: node.delete_many(keys)))
+
+    def get_ttl(self, key: str, default: int = 0) -> int | None:
+        return self.node(key).get_ttl(key, default)
+
+    def set_ttl(self, key: str, ttl: int | None = None) -> bool:
+        return self.node(key).set_ttl(key, ttl)
+
+    def incr(self, key: str, delta: int = 1) -> int:
+        return self.node(key).incr(key, delta)
+
+    def decr(self, key: str, delta: int = 1) -> int:
+        return self.node(key).decr(key, delta)
+
+    def _get_fresh(self, key: str, ttl: int | None, soft_ttl: int) -> tuple[t.Any, bool]:
+        return self.node(key)._get_fresh(key, ttl, soft_ttl)
+
+    def _set_fresh(self, key: str, value: t.Any, ttl: int | None, soft_ttl: int | None) -> None:
+        self.node(key)._set_fresh(key, value, ttl, soft_ttl)
+
+    def _lock(self, key: str, timeout: float) -> str | None:
+        return self.node(key)._lock(key, timeout)
+
+    def _unlock(self, key: str, token: str) -> None:
+        self.node(key)._unlock(key, token)
+
+    def clear(self) -> None:
+        self._fan_out(lambda node: node.clear(), self.nodes.values())
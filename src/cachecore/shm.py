@@ -0,0 +1,387 @@
+from contextlib import contextmanager
+from hashlib import blake2b
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+import os
+import pickle
+from struct import Struct
+import tempfile
+import threading
+import time
+import typing as t
+
+from .base import BaseCache, _is_reserved
+from .serializers import SerializerInterface
+from .utils import KEEP_TTL, ttl_to_exptime, ttl_remaining, is_expired
+
+
+_MAGIC = b'CCSHM001'
+# magic, slots, key_size, value_size
+_HEADER = Struct('<8sIII')
+_HEADER_SIZE = 64
+
+# Every slot starts with a sequence number that is odd while a writer is
+# modifying the slot, followed by state, key length, value length,
+# expires_at (0.0 means no expiry) and the key's hash.
+_SEQ = Struct('<Q')
+_FIELDS = Struct('<BxHIdQ')
+_SLOT_HEADER_SIZE = _SEQ.size + _FIELDS.size
+
+_EMPTY = 0
+_USED = 1
+_DELETED = 2
+
+
+def _hash(key: bytes) -> int:
+    # The builtin hash() is randomized per process, so it can't be used to
+    # find slots that other processes wrote.
+    return int.from_bytes(blake2b(key, digest_size=8).digest(), 'little')
+
+
+class SharedMemoryCache(BaseCache):
+    """A cache shared by all processes on a host.
+
+    Entries live in a fixed-size open addressing hash table inside a named
+    shared memory segment. Each slot holds the key, the serialized value
+    and its expiry inline, so values larger than `value_size` cannot be
+    stored. Writers are serialized by a file lock, while readers never
+    lock and instead retry if a slot's sequence number changed under them.
+
+    The segment outlives the processes using it; call `unlink` to remove it.
+    This backend requires a POSIX system.
+    """
+
+    serializer = pickle
+
+    def __init__(
+        self,
+        name: str = 'cachecore',
+        slots: int = 4096,
+        key_size: int = 250,
+        value_size: int = 4096,
+        max_probes: int = 32,
+        serializer: SerializerInterface | None = None
+    ):
+        """
+        :param name: The name of the shared memory segment.
+        :param slots: The maximum number of entries.
+        :param key_size: The maximum size of an encoded key.
+        :param value_size: The maximum size of a serialized value.
+        :param max_probes: The number of slots searched for a key before
+            an entry in its neighbourhood is evicted.
+        :param serializer: Overrides the class's serializer.
+        """
+        import fcntl
+        self._fcntl = fcntl
+
+        if serializer is not None:
+            self.serializer = serializer
+
+        self._name = name
+        self._slots = slots
+        self._key_size = key_size
+        self._value_size = value_size
+        self._max_probes = min(max_probes, slots)
+        self._slot_size = -(-(_SLOT_HEADER_SIZE + key_size + value_size) // 8) * 8
+
+        self._lock_path = os.path.join(tempfile.gettempdir(), f'cachecore-{name}.lock')
+        self._lock_file = open(self._lock_path, 'a+b')
+        self._thread_lock = threading.Lock()
+
+        with self._locked():
+            size = _HEADER_SIZE + slots * self._slot_size
+            try:
+                self._shm = SharedMemory(name, create=True, size=size)
+                created = True
+            except FileExistsError:
+                self._shm = SharedMemory(name)
+                created = False
+
+            # The resource tracker would unlink the segment as soon as this
+            # process exits, even though other processes still use it.
+            resource_tracker.unregister(self._shm._name, 'shared_memory')
+            self._buf = self._shm.buf
+
+            header = (_MAGIC, slots, key_size, value_size)
+            if created:
+                _HEADER.pack_into(self._buf, 0, *header)
+            elif _HEADER.unpack_from(self._buf, 0) != header:
+                self.close()
+                raise ValueError(
+                    f"Shared memory segment '{name}' was created with different parameters."
+                )
+
+    def __getitem__(self, key):
+        found = self._find(key, value=True)
+        if found is None:
+            raise KeyError(key)
+        _, _, data = found
+        return self.serializer.loads(data)
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        if not self.delete(key):
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def __iter__(self):
+        for idx in range(self._slots):
+            state, key, expires_at, _ = self._read(idx)
+            if state != _USED or self._is_expired(expires_at):
+                continue
+            key = key.decode()
+            if not _is_reserved(key):
+                yield key
+
+    @contextmanager
+    def _locked(self):
+        # flock() does not exclude threads that share a file descriptor.
+        with self._thread_lock:
+            self._fcntl.flock(self._lock_file, self._fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                self._fcntl.flock(self._lock_file, self._fcntl.LOCK_UN)
+
+    def _offset(self, idx: int) -> int:
+        return _HEADER_SIZE + idx * self._slot_size
+
+    def _probe(self, h: int) -> t.Iterator[int]:
+        home = h % self._slots
+        return ((home + i) % self._slots for i in range(self._max_probes))
+
+    def _is_expired(self, expires_at: float) -> bool:
+        return expires_at != 0.0 and is_expired(expires_at)
+
+    def _encode_key(self, key: str) -> bytes:
+        kb = key.encode()
+        if len(kb) > self._key_size:
+            raise ValueError(f'Key is larger than {self._key_size} bytes.')
+        return kb
+
+    def _read(self, idx, h=None, value=False):
+        """Returns a consistent (state, key, expires_at, value) snapshot of a
+        slot without locking.
+
+        :param idx: The slot index.
+        :param h: If given, the key and value are only read if the slot's
+            hash matches.
+        :param value: True, if the value should be read.
+        """
+        off = self._offset(idx)
+        buf = self._buf
+        for _ in range(1000):
+            seq = _SEQ.unpack_from(buf, off)[0]
+            if seq & 1:
+                time.sleep(0)
+                continue
+
+            snapshot = self._read_fields(off, h, value)
+            if _SEQ.unpack_from(buf, off)[0] == seq:
+                return snapshot
+
+        # A writer died half way through updating the slot.
+        with self._locked():
+            seq = _SEQ.unpack_from(buf, off)[0]
+            if seq & 1:
+                _FIELDS.pack_into(buf, off + _SEQ.size, _DELETED, 0, 0, 0.0, 0)
+                _SEQ.pack_into(buf, off, seq + 1)
+            return self._read_fields(off, h, value)
+
+    def _read_fields(self, off, h, value):
+        buf = self._buf
+        state, klen, vlen, expires_at, sh = _FIELDS.unpack_from(buf, off + _SEQ.size)
+        key = data = None
+        if state == _USED and (h is None or sh == h):
+            koff = off + _SLOT_HEADER_SIZE
+            key = bytes(buf[koff:koff + klen])
+            if value:
+                voff = koff + self._key_size
+                data = bytes(buf[voff:voff + vlen])
+        return state, key, expires_at, data
+
+    def _write(self, idx, state, kb=b'', h=0, data=b'', expires_at=0.0):
+        """Overwrite a slot. The caller must hold the lock.
+        """
+        off = self._offset(idx)
+        buf = self._buf
+        seq = _SEQ.unpack_from(buf, off)[0]
+        _SEQ.pack_into(buf, off, seq + 1)
+
+        _FIELDS.pack_into(buf, off + _SEQ.size, state, len(kb), len(data), expires_at, h)
+        koff = off + _SLOT_HEADER_SIZE
+        buf[koff:koff + len(kb)] = kb
+        voff = koff + self._key_size
+        buf[voff:voff + len(data)] = data
+
+        _SEQ.pack_into(buf, off, seq + 2)
+
+    def _find(self, key, value=False):
+        """Find a live entry without locking.
+
+        :returns: A 3-tuple of slot index, expires_at and value, or None.
+        """
+        kb = key.encode()
+        h = _hash(kb)
+        for idx in self._probe(h):
+            state, slot_key, expires_at, data = self._read(idx, h, value)
+            if state == _EMPTY:
+                return None
+
+            if slot_key == kb:
+                if self._is_expired(expires_at):
+                    return None
+                return idx, expires_at, data
+        return None
+
+    def _locate(self, kb, h):
+        """Find the slot to write a key to. The caller must hold the lock.
+
+        :returns: A 2-tuple of the slot index and, if the key is already
+            stored and live, its expires_at, else None.
+        """
+        free = None
+        victim = None
+        victim_expires_at = None
+        for idx in self._probe(h):
+            off = self._offset(idx)
+            state, _, _, expires_at, sh = _FIELDS.unpack_from(self._buf, off + _SEQ.size)
+            if state == _EMPTY:
+                return (idx if free is None else free), None
+
+            if state == _USED:
+                if sh == h and self._read_fields(off, h, False)[1] == kb:
+                    if self._is_expired(expires_at):
+                        return idx, None
+                    return idx, expires_at
+
+                if self._is_expired(expires_at):
+                    state = _DELETED
+
+            if state == _DELETED:
+                if free is None:
+                    free = idx
+                continue
+
+            # Remember the entry that expires soonest in case the whole
+            # neighbourhood is full.
+            sort_key = float('inf') if expires_at == 0.0 else expires_at
+            if victim is None or sort_key < victim_expires_at:
+                victim = idx
+                victim_expires_at = sort_key
+
+        if free is not None:
+            return free, None
+        return victim, None
+
+    def close(self):
+        """Detach from the shared memory segment.
+        """
+        self._buf.release()
+        self._shm.close()
+        self._lock_file.close()
+
+    def unlink(self):
+        """Remove the shared memory segment. Other processes keep access to
+        it until they close it.
+        """
+        resource_tracker.register(self._shm._name, 'shared_memory')
+        self._shm.unlink()
+        try:
+            os.unlink(self._lock_path)
+        except FileNotFoundError:
+            pass
+
+    def set(self, key, value, ttl=None):
+        self._set(key, value, ttl, 'set')
+
+    def add(self, key, value, ttl=None):
+        return self._set(key, value, ttl, 'add')
+
+    def replace(self, key, value, ttl=KEEP_TTL):
+        return self._set(key, value, ttl, 'replace')
+
+    def _set(self, key, value, ttl, mode):
+        kb = self._encode_key(key)
+        h = _hash(kb)
+        data = self.serializer.dumps(value)
+        if len(data) > self._value_size:
+            raise ValueError(f'Value is larger than {self._value_size} bytes.')
+
+        with self._locked():
+            idx, current_expires_at = self._locate(kb, h)
+            exists = current_expires_at is not None
+            if mode == 'add' and exists:
+                return False
+            if mode == 'replace' and not exists:
+                return False
+
+            if ttl is KEEP_TTL:
+                expires_at = current_expires_at
+            else:
+                expires_at = ttl_to_exptime(ttl) or 0.0
+            self._write(idx, _USED, kb, h, data, expires_at)
+        return True
+
+    def delete(self, key):
+        kb = key.encode()
+        h = _hash(kb)
+        with self._locked():
+            idx, expires_at = self._locate(kb, h)
+            if expires_at is None:
+                return False
+            self._write(idx, _DELETED)
+        return True
+
+    def pop(self, key, default=None):
+        kb = key.encode()
+        h = _hash(kb)
+        with self._locked():
+            idx, expires_at = self._locate(kb, h)
+            if expires_at is None:
+                return default
+            _, _, _, data = self._read_fields(self._offset(idx), h, True)
+            self._write(idx, _DELETED)
+        return self.serializer.loads(data)
+
+    def get_ttl(self, key, default=0):
+        found = self._find(key)
+        if found is None:
+            return default
+        _, expires_at, _ = found
+        return ttl_remaining(expires_at or None)
+
+    def set_ttl(self, key, ttl=None):
+        kb = key.encode()
+        h = _hash(kb)
+        with self._locked():
+            idx, expires_at = self._locate(kb, h)
+            if expires_at is None:
+                return False
+            _, _, _, data = self._read_fields(self._offset(idx), h, True)
+            self._write(idx, _USED, kb, h, data, ttl_to_exptime(ttl) or 0.0)
+        return True
+
+    def incr(self, key, delta=1):
+        kb = self._encode_key(key)
+        h = _hash(kb)
+        with self._locked():
+            idx, expires_at = self._locate(kb, h)
+            if expires_at is None:
+                value = delta
+                expires_at = 0.0
+            else:
+                _, _, _, data = self._read_fields(self._offset(idx), h, True)
+                value = self.serializer.loads(data) + delta
+
+            self._write(idx, _USED, kb, h, self.serializer.dumps(value), expires_at)
+        return value
+
+    def clear(self):
+        with self._locked():
+            for idx in range(self._slots):
+                self._write(idx, _EMPTY)
@@ -0,0 +1,205 @@
+import typing as t
+
+from .base import BaseCache
+from .interface import CacheInterface
+from .utils import KEEP_TTL, iter_pairs
+
+
+_MISSING = object()
+# The TTL of a value read from an L2 that can't report TTLs.
+_UNKNOWN = object()
+
+
+class TieredCache(BaseCache):
+    """A fast local cache (L1) in front of a shared one (L2).
+
+    Reads are served from L1 when possible, and values found in L2 are
+    copied into L1 for the rest of their TTL. Writes go to L2 and then
+    either update or drop the L1 copy. Other processes' writes to L2 are
+    not seen until the L1 copy expires, so use `l1_ttl` to bound how stale
+    a read may be.
+
+    :param l1: The local cache, e.g. a bounded LocalCache.
+    :param l2: The shared cache, e.g. a RedisCache.
+    :param l1_ttl: The maximum number of seconds a value is kept in L1.
+        Values read from an L2 that can't report their remaining TTL, e.g.
+        Memcached, are kept for `l1_ttl`, or `unknown_ttl` if it is None.
+    """
+
+    # The number of seconds values with an unknown TTL are kept in L1 when
+    # no l1_ttl is given.
+    unknown_ttl = 60
+
+    def __init__(self, l1: CacheInterface, l2: CacheInterface, l1_ttl: int | None = None):
+        self.l1 = l1
+        self.l2 = l2
+        self._l1_ttl = l1_ttl
+
+    @property
+    def _children(self) -> tuple[CacheInterface, ...]:
+        return (self.l1, self.l2)
+
+    @property
+    def _distributed(self) -> bool:
+        return self.l2._distributed
+
+    @property
+    def _thread_safe(self) -> bool:
+        return self.l1._thread_safe and self.l2._thread_safe
+
+    def __getitem__(self, key: str) -> t.Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: t.Any):
+        self.set(key, value)
+
+    def __delitem__(self, key: str):
+        if not self.delete(key):
+            raise KeyError(key)
+
+    def __contains__(self, key: str) -> bool:
+        return self.exists(key)
+
+    def __iter__(self) -> t.Iterator[str]:
+        return iter(self.l2)
+
+    def keys(self, pattern: str | None = None) -> t.Iterable[str]:
+        return self.l2.keys(pattern)
+
+    def _l1_ttl_for(self, ttl: int | None) -> int | None:
+        """Returns the TTL of an L1 copy of a value with the given TTL.
+        """
+        if self._l1_ttl is None:
+            return ttl
+        if ttl is None:
+            return self._l1_ttl
+        return min(ttl, self._l1_ttl)
+
+    def _fetch(self, keys: list[str]) -> list[tuple[t.Any, int | None]]:
+        """Read values and their remaining TTL from L2, in one round trip
+        where L2 supports batching.
+
+        :returns: A list of (value, ttl) pairs, with _MISSING values for
+            keys that were not found and an _UNKNOWN ttl if L2 can't tell.
+        """
+        batch = getattr(self.l2, 'batch', None)
+        if batch is not None:
+            with batch() as p:
+                values = p.get_many(keys, _MISSING)
+                ttls = [p.get_ttl(k) for k in keys]
+            return list(zip(values.value, (ttl.value for ttl in ttls)))
+
+        values = list(self.l2.get_many(keys, _MISSING))
+        results = []
+        for key, value in zip(keys, values):
+            ttl = None
+            if value is not _MISSING:
+                try:
+                    # A key that expired since it was read isn't promoted.
+                    ttl = self.l2.get_ttl(key, default=0)
+                except NotImplementedError:
+                    ttl = _UNKNOWN
+            results.append((value, ttl))
+        return results
+
+    def _promote(self, key: str, value: t.Any, ttl: t.Any) -> None:
+        if ttl is _UNKNOWN:
+            # The copy must not outlive the value in L2 for long.
+            ttl = self.unknown_ttl if self._l1_ttl is None else self._l1_ttl
+        elif ttl == 0:
+            # The value expires within the second.
+            return
+        self.l1.set(key, value, self._l1_ttl_for(ttl))
+
+    def get(self, key: str, default: t.Any = None) -> t.Any:
+        value = self.l1.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        [(value, ttl)] = self._fetch([key])
+        if value is _MISSING:
+            return default
+
+        self._promote(key, value, ttl)
+        return value
+
+    def get_many(self, keys: t.Iterable[str], default: t.Any = None) -> t.Iterable[t.Any]:
+        keys = list(keys)
+        values = list(self.l1.get_many(keys, _MISSING))
+        missing = [i for i, v in enumerate(values) if v is _MISSING]
+        if missing:
+            fetched = self._fetch([keys[i] for i in missing])
+            for i, (value, ttl) in zip(missing, fetched):
+                values[i] = value
+                if value is not _MISSING:
+                    self._promote(keys[i], value, ttl)
+
+        return (default if v is _MISSING else v for v in values)
+
+    def set(self, key: str, value: t.Any, ttl: int | None = None) -> None:
+        self.l2.set(key, value, ttl)
+        self.l1.set(key, value, self._l1_ttl_for(ttl))
+
+    def add(self, key: str, value: t.Any, ttl: int | None = None) -> bool:
+        added = self.l2.add(key, value, ttl)
+        if added:
+            self.l1.set(key, value, self._l1_ttl_for(ttl))
+        else:
+            # Another process holds a different value.
+            self.l1.delete(key)
+        return added
+
+    def replace(self, key: str, value: t.Any, ttl: int | None = KEEP_TTL) -> bool:
+        replaced = self.l2.replace(key, value, ttl)
+        self.l1.delete(key)
+        return replaced
+
+    def delete(self, key: str) -> bool:
+        self.l1.delete(key)
+        return self.l2.delete(key)
+
+    def pop(self, key: str, default: t.Any = None) -> t.Any:
+        self.l1.delete(key)
+        return self.l2.pop(key, default)
+
+    def exists(self, key: str) -> bool:
+        return self.l1.exists(key) or self.l2.exists(key)
+
+    def set_many(self, mapping: t.Mapping[str, t.Any] | t.Iterable[tuple[str, t.Any]], ttl: int | None = None) -> None:
+        pairs = list(iter_pairs(mapping))
+        self.l2.set_many(pairs, ttl)
+        self.l1.set_many(pairs, self._l1_ttl_for(ttl))
+
+    def delete_many(self, keys: t.Iterable[str]) -> t.Iterable[bool]:
+        keys = list(keys)
+        list(self.l1.delete_many(keys))
+        return self.l2.delete_many(keys)
+
+    def get_ttl(self, key: str, default: int = 0) -> int | None:
+        return self.l2.get_ttl(key, default)
+
+    def set_ttl(self, key: str, ttl: int | None = None) -> bool:
+        self.l1.delete(key)
+        return self.l2.set_ttl(key, ttl)
+
+    def incr(self, key: str, delta: int = 1) -> int:
+        self.l1.delete(key)
+        return self.l2.incr(key, delta)
+
+    def decr(self, key: str, delta: int = 1) -> int:
+        self.l1.delete(key)
+        return self.l2.decr(key, delta)
+
+    def _lock(self, key: str, timeout: float) -> str | None:
+        # Locks only matter between processes, so they are never copied to L1.
+        return self.l2._lock(key, timeout)
+
+    def _unlock(self, key: str, token: str) -> None:
+        self.l2._unlock(key, token)
+
+    def clear(self) -> None:
+        self.l1.clear()
+        self.l2.clear()
@@ -1,10 +1,26 @@
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from collections.abc import Awaitable, Callable, Hashable, Iterable, Iterator, Mapping
 from dataclasses import dataclass
 from functools import cache
-from math import ceil
+from itertools import islice
+from math import ceil, log
+import random
+import threading
 import time
 from typing import Optional, Any
 
 
+def map_in_context(executor: Executor, fn: Callable, items: list) -> Iterator:
+    """Like executor.map, but every call runs in a copy of the caller's
+    context, so that it sees the caller's context variables.
+    """
+    contexts = [copy_context() for _ in items]
+    return executor.map(lambda ctx, item: ctx.run(fn, item), contexts, items)
+
+
 def ttl_to_exptime(ttl: int | None) -> float | None:
     if ttl is None:
         return None
@@ -21,10 +37,28 @@ def is_expired(exp_time: float | None) -> bool:
     return ttl_remaining(exp_time) == 0
 
 
+def iter_pairs(mapping: Mapping | Iterable[tuple[str, Any]]) -> Iterator[tuple[str, Any]]:
+    """Returns the key, value pairs of a mapping or of an iterable of pairs.
+    """
+    if isinstance(mapping, Mapping):
+        return iter(mapping.items())
+    return iter(mapping)
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[list]:
+    """Split an iterable into lists of at most `size` items.
+    """
+    it = iter(iterable)
+    while chunk := list(islice(it, size)):
+        yield chunk
+
+
 @dataclass(slots=True)
 class ExpiryValue:
     value: Any
     expires_at: Optional[float] = None
+    # When the value should be refreshed, while still being served.
+    stale_at: Optional[float] = None
 
     @property
     def ttl(self):
@@ -37,6 +71,207 @@ class ExpiryValue:
     def is_expired(self):
         return is_expired(self.expires_at)
 
+    def is_stale(self):
+        return self.stale_at is not None and time.time() >= self.stale_at
+
+
+@dataclass(slots=True)
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        if total == 0:
+            return 0.0
+        return self.hits / total
+
+
+class _Call:
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapses concurrent calls for the same key into one: the first
+    caller runs the function and the others wait for its result.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines running on one event loop.
+    """
+
+    def __init__(self):
+        self._calls: dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._calls.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            value = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Nobody may be waiting; don't warn about an unretrieved error.
+            future.exception()
+            raise
+        finally:
+            del self._calls[key]
+
+        future.set_result(value)
+        return value
+
+
+class ComputeTimes:
+    """Remembers how long recent values took to compute, for XFetch.
+
+    :param maxsize: The number of keys to remember.
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self._maxsize = maxsize
+        self._times: OrderedDict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, key: str, seconds: float) -> None:
+        with self._lock:
+            self._times[key] = seconds
+            self._times.move_to_end(key)
+            if len(self._times) > self._maxsize:
+                self._times.popitem(last=False)
+
+    def get(self, key: str) -> float | None:
+        return self._times.get(key)
+
+
+class Refresher:
+    """Runs background refreshes on a thread pool, at most one per key.
+    A refresh that raises is dropped, so the stale value keeps being served.
+
+    :param max_workers: The number of refreshes run at once.
+    """
+
+    def __init__(self, max_workers: int = 4):
+        self._max_workers = max_workers
+        self._lock = threading.Lock()
+        self._pending: dict[Hashable, Future] = {}
+        self._executor: ThreadPoolExecutor | None = None
+
+    def submit(self, key: Hashable, fn: Callable[[], Any]) -> bool:
+        """Schedule a refresh, unless one for the key is already pending.
+
+        :returns: True, if the refresh was scheduled.
+        """
+        with self._lock:
+            if key in self._pending:
+                return False
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    self._max_workers, thread_name_prefix='cachecore-refresh'
+                )
+            self._pending[key] = self._executor.submit(self._run, key, fn)
+        return True
+
+    def _run(self, key: Hashable, fn: Callable[[], Any]) -> None:
+        try:
+            fn()
+        except Exception:
+            pass
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def join(self) -> None:
+        """Wait for the pending refreshes.
+        """
+        with self._lock:
+            futures = list(self._pending.values())
+        wait(futures)
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait)
+
+
+class AsyncRefresher:
+    """Refresher for coroutines, running each refresh as a task.
+    """
+
+    def __init__(self):
+        self._tasks: dict[Hashable, asyncio.Task] = {}
+
+    def submit(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> bool:
+        if key in self._tasks:
+            return False
+        task = self._tasks[key] = asyncio.get_running_loop().create_task(fn())
+        task.add_done_callback(lambda task: self._done(key, task))
+        return True
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        del self._tasks[key]
+        if not task.cancelled():
+            task.exception()
+
+    async def join(self) -> None:
+        """Wait for the pending refreshes.
+        """
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+
+def should_refresh(delta: float, ttl: float, beta: float) -> bool:
+    """XFetch: decide whether to recompute a value before it expires. The
+    closer the value is to expiring, and the longer it takes to compute,
+    the likelier an early refresh is.
+
+    :param delta: The number of seconds the value took to compute.
+    :param ttl: The number of seconds until the value expires.
+    :param beta: Values over 1 favour earlier refreshes.
+    """
+    return -delta * beta * log(1.0 - random.random()) >= ttl
+
 
 class Singleton:
     @cache
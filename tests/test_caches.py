@@ -1,13 +1,30 @@
+import asyncio
+import copy
+import multiprocessing
 import os
+import pickle
+import shutil
 import string
+import struct
+import threading
 import time
 import unittest
+import uuid
 
 import redis
 import pymemcache
 
 from src.cachecore import CacheInterface, DummyCache, LocalCache, \
-    FileCache, MemcachedCache, RedisCache
+    FileCache, MemcachedCache, RedisCache, SharedMemoryCache, \
+    AsyncCacheInterface, AsyncCacheWrapper, AsyncFileCache, AsyncLocalCache, \
+    AsyncMemcachedCache, AsyncRedisCache, InstrumentedCache, ShardedCache, \
+    TieredCache
+from src.cachecore.base import BaseCache, _fresh_key, _lock_key
+from src.cachecore.file import _HEADER, _MAGIC, _VERSION
+from src.cachecore.near import NearCache
+from src.cachecore.replicas import ReplicaSet
+from src.cachecore.serializers import JSONSerializer, Pickle5Serializer
+from src.cachecore.sharded import HashRing
 
 
 class TestProtocol(unittest.TestCase):
@@ -17,6 +34,13 @@ class TestProtocol(unittest.TestCase):
         assert issubclass(LocalCache, CacheInterface)
         assert issubclass(MemcachedCache, CacheInterface)
         assert issubclass(RedisCache, CacheInterface)
+        assert issubclass(SharedMemoryCache, CacheInterface)
+        assert issubclass(TieredCache, CacheInterface)
+
+    def test_async_protocol(self):
+        assert issubclass(AsyncCacheWrapper, AsyncCacheInterface)
+        assert issubclass(AsyncMemcachedCache, AsyncCacheInterface)
+        assert issubclass(AsyncRedisCache, AsyncCacheInterface)
 
 
 class TestDummyCache(unittest.TestCase):
@@ -155,6 +179,17 @@ class AbstractCacheTest:
         assert self.cache.add('b', 2, 300) is True
         assert self.cache.add('b', 2, 300) is False
 
+    def test_lock(self):
+        token = self.cache._lock('a', 10)
+        assert token is not None
+        assert self.cache._lock('a', 10) is None
+
+        # Only the holder's token releases the lock.
+        self.cache._unlock('a', 'other')
+        assert self.cache._lock('a', 10) is None
+        self.cache._unlock('a', token)
+        assert self.cache._lock('a', 10) is not None
+
     def test_replace(self):
         assert self.cache.replace('a', 1) is False
         assert not self.cache.exists('a')
@@ -224,11 +259,50 @@ class AbstractCacheTest:
         for k in ['a', 'b', 'c']:
             assert self.cache.get_ttl(k) == 300
 
+    def test_get_or_set(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'value'
+
+        threads = [
+            threading.Thread(target=self.cache.get_or_set, args=('a', compute, 300))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(calls) == 1
+        assert self.cache.get('a') == 'value'
+        assert self.cache.get_or_set('a', compute) == 'value'
+        assert len(calls) == 1
+
+    def test_stale_while_revalidate(self):
+        assert self.cache.get_or_set('a', lambda: 1, 300, soft_ttl=1) == 1
+        assert self.cache.get_or_set('a', lambda: 2, 300, soft_ttl=1) == 1
+        time.sleep(1.1)
+        # The stale value is served while it is refreshed in the background.
+        assert self.cache.get_or_set('a', lambda: 2, 300, soft_ttl=1) == 1
+        self.cache._get_or_set_state()[2].join()
+        assert self.cache.get('a') == 2
+        assert self.cache.get_or_set('a', lambda: 3, 300, soft_ttl=1) == 2
+
+    def test_set_many_mapping(self):
+        self.cache.set_many({'a': 1, 'b': 2})
+        assert list(self.cache.get_many(['a', 'b'])) == [1, 2]
+
     def test_delete_many(self):
         self.cache.set_many({'a': 1, 'b': 2, 'c': 3}.items())
         assert list(self.cache.delete_many(['a', 'b', 'c'])) == [True] * 3
         assert list(self.cache.get_many(['a', 'b', 'c'])) == [None] * 3
 
+        self.cache.set('a', 1)
+        assert list(self.cache.delete_many(['a', 'b'])) == [True, False]
+
     def test_incr(self):
         assert self.cache.incr('a') == 1
         assert self.cache.incr('a') == 2
@@ -259,16 +333,832 @@ class TestLocalCache(unittest.TestCase, AbstractCacheTest):
         self.cache = LocalCache()
 
 
+class TestGetOrSet(unittest.TestCase):
+    def setUp(self):
+        self.cache = LocalCache(thread_safe=True)
+
+    def test_early_refresh(self):
+        # A compute time too short for the clock would never refresh early.
+        self.cache.get_or_set('a', lambda: time.sleep(0.01) or 1, 300)
+        # A huge beta makes an early refresh certain.
+        assert self.cache.get_or_set('a', lambda: 2, 300, beta=1e12) == 2
+        assert self.cache.get_or_set('a', lambda: 3, 300, beta=0) == 2
+
+    def test_error(self):
+        def fail():
+            raise ValueError
+
+        with self.assertRaises(ValueError):
+            self.cache.get_or_set('a', fail)
+        assert self.cache.get_or_set('a', lambda: 1) == 1
+
+    def test_distributed_lock(self):
+        self.cache._distributed = True
+        # Another process holds the lock and stores the value meanwhile.
+        self.cache.add(_lock_key('a'), 1, 10)
+        timer = threading.Timer(0.2, self.cache.set, ('a', 'theirs'))
+        timer.start()
+        assert self.cache.get_or_set('a', lambda: 'ours') == 'theirs'
+        timer.join()
+
+        # The lock holder is refreshing, so the current value is served.
+        self.cache.get_or_set('b', lambda: 1, 300)
+        self.cache.add(_lock_key('b'), 1, 10)
+        assert self.cache.get_or_set('b', lambda: 2, 300, beta=1e12) == 1
+
+        # Give up waiting after the timeout.
+        self.cache.add(_lock_key('c'), 1, 10)
+        assert self.cache.get_or_set('c', lambda: 'ours', lock_timeout=0.1) == 'ours'
+
+        # Locks are released after computing.
+        assert self.cache.get_or_set('d', lambda: 'ours') == 'ours'
+        assert self.cache.exists(_lock_key('d')) is False
+
+    def test_soft_ttl_kept(self):
+        # A soft TTL of 0 makes the value stale at once.
+        self.cache._set_fresh('a', 1, 300, 0)
+        assert self.cache.replace('a', 2) is True
+        assert self.cache._get_fresh('a', 300, 0) == (2, True)
+        assert self.cache.incr('a') == 3
+        assert self.cache._get_fresh('a', 300, 0) == (3, True)
+
+        # A new TTL drops the soft deadline.
+        assert self.cache.replace('a', 4, 300) is True
+        assert self.cache._get_fresh('a', 300, 0) == (4, False)
+
+    def test_expired_lock(self):
+        self.cache._distributed = True
+
+        # The lock expired while computing and another worker took it.
+        def compute():
+            self.cache.set(_lock_key('a'), 'theirs', 10)
+            return 'ours'
+
+        assert self.cache.get_or_set('a', compute) == 'ours'
+        assert self.cache.get(_lock_key('a')) == 'theirs'
+
+    def test_reserved_keys(self):
+        self.cache._distributed = True
+
+        def compute():
+            # The lock is held while computing.
+            assert list(self.cache) == []
+            return 1
+
+        self.cache.get_or_set('a', compute)
+        BaseCache._set_fresh(self.cache, 'b', 2, None, 300)
+        assert self.cache.exists(_fresh_key('b'))
+        assert sorted(self.cache) == ['a', 'b']
+        assert len(self.cache) == 2
+
+    def test_stale_on_error(self):
+        calls = []
+
+        def fail():
+            calls.append(1)
+            raise ValueError
+
+        self.cache.get_or_set('a', lambda: 1, 2, soft_ttl=0)
+        refresher = self.cache._get_or_set_state()[2]
+        for _ in range(2):
+            assert self.cache.get_or_set('a', fail, 2, soft_ttl=0) == 1
+            refresher.join()
+        assert len(calls) == 2
+
+        # Stale values are only served until they expire.
+        time.sleep(2)
+        with self.assertRaises(ValueError):
+            self.cache.get_or_set('a', fail, 2, soft_ttl=0)
+
+
+class TestBoundedLocalCache(unittest.TestCase, AbstractCacheTest):
+    def setUp(self):
+        self.cache = LocalCache(max_entries=1000, policy='tinylfu')
+
+    def test_lru(self):
+        cache = LocalCache(max_entries=3, policy='lru')
+        cache.set_many([('a', 1), ('b', 2), ('c', 3)])
+        cache.get('a')
+        cache.set('d', 4)
+        assert cache.exists('b') is False
+        assert sorted(cache) == ['a', 'c', 'd']
+        assert cache.stats().evictions == 1
+
+    def test_lfu(self):
+        cache = LocalCache(max_entries=3, policy='lfu')
+        cache.set_many([('a', 1), ('b', 2), ('c', 3)])
+        for _ in range(3):
+            cache.get('a')
+            cache.get('c')
+        cache.set('d', 4)
+        assert sorted(cache) == ['a', 'c', 'd']
+
+    def test_lfu_admits_new_keys(self):
+        cache = LocalCache(max_entries=3, policy='lfu')
+        cache.set_many([('a', 1), ('b', 2), ('c', 3)])
+        for key in ('a', 'b', 'c', 'a', 'c'):
+            cache.get(key)
+        cache.set('d', 4)
+        assert cache.get('d') == 4
+        assert sorted(cache) == ['a', 'c', 'd']
+
+    def test_tinylfu(self):
+        cache = LocalCache(max_entries=100, policy='tinylfu')
+        hot = [f'hot{i}' for i in range(50)]
+        for _ in range(5):
+            for key in hot:
+                if key not in cache:
+                    cache.set(key, key)
+                cache.get(key)
+
+        # A scan of one-hit wonders should not flush out the hot keys.
+        for i in range(1000):
+            cache.set(f'cold{i}', i)
+
+        assert len(cache) <= 100
+        assert sum(key in cache for key in hot) >= 45
+
+    def test_max_bytes(self):
+        cache = LocalCache(max_bytes=1000)
+        for i in range(100):
+            cache.set(str(i), b'x' * 100)
+        assert cache._shards[0].bytes <= 1000
+        assert 0 < len(cache) < 10
+
+        # Values that can never fit are not stored.
+        cache.set('big', b'x' * 2000)
+        assert cache.exists('big') is False
+
+    def test_stats(self):
+        cache = LocalCache(max_entries=10)
+        cache.set('a', 1)
+        cache.get('a')
+        cache.get('b')
+        stats = cache.stats()
+        assert stats.hits == 1
+        assert stats.misses == 1
+        assert stats.hit_ratio == 0.5
+
+
+class TestLocalCacheExpiry(unittest.TestCase):
+
+    def test_expire_on_write(self):
+        cache = LocalCache(sweep_batch=100)
+        cache.set_many([(str(i), i) for i in range(50)], 1)
+        time.sleep(1)
+        cache.set('a', 1)
+        assert list(cache._shards[0].data) == ['a']
+        assert cache.stats().expirations == 50
+
+    def test_sweep(self):
+        cache = LocalCache(sweep_batch=0)
+        cache.set_many([(str(i), i) for i in range(200)], 1)
+        cache.set('a', 1)
+        cache.set_ttl('a', 300)
+        time.sleep(1)
+        assert len(cache._shards[0].data) == 201
+        assert cache.sweep() == 200
+        assert list(cache._shards[0].data) == ['a']
+
+    def test_sweep_skips_updated_ttl(self):
+        cache = LocalCache(sweep_batch=0)
+        cache.set('a', 1, 1)
+        cache.set_ttl('a', None)
+        time.sleep(1)
+        assert cache.sweep() == 0
+        assert cache.get('a') == 1
+
+    def test_background_sweeper(self):
+        cache = LocalCache(sweep_interval=0.1)
+        cache.set('a', 1, 1)
+        time.sleep(1.3)
+        assert 'a' not in cache._shards[0].data
+        cache.close()
+
+
+class TestShardedLocalCache(unittest.TestCase, AbstractCacheTest):
+    def setUp(self):
+        self.cache = LocalCache(thread_safe=True, shards=8)
+
+    def test_concurrent_incr(self):
+        def worker(n):
+            for _ in range(1000):
+                self.cache.incr('counter')
+                self.cache.incr(f'key{n}')
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert self.cache.get('counter') == 8000
+        assert len(self.cache) == 9
+
+    def test_bounded_shards(self):
+        cache = LocalCache(max_entries=64, thread_safe=True, shards=4)
+        cache.set_many([(str(i), i) for i in range(1000)])
+        assert len(cache) <= 64
+        assert cache.stats().evictions >= 1000 - 64
+
+
+class TestUnserializedLocalCache(unittest.TestCase, AbstractCacheTest):
+    def setUp(self):
+        self.cache = LocalCache(serialize=False)
+
+    def test_references(self):
+        value = {'a': [1, 2, 3]}
+        self.cache.set('a', value)
+        assert self.cache.get('a') is value
+
+    def test_copier(self):
+        cache = LocalCache(serialize=False, copier=copy.deepcopy)
+        value = {'a': [1, 2, 3]}
+        cache.set('a', value)
+        cached = cache.get('a')
+        assert cached == value
+        cached['a'].append(4)
+        assert cache.get('a') == {'a': [1, 2, 3]}
+
+    def test_invalid_options(self):
+        with self.assertRaises(ValueError):
+            LocalCache(serialize=False, max_bytes=1000)
+
+        with self.assertRaises(ValueError):
+            LocalCache(copier=copy.deepcopy)
+
+    def test_serializer(self):
+        cache = LocalCache(serializer=JSONSerializer())
+        cache.set('a', {'b': 1})
+        assert cache._shards[0].data['a'].value == b'{"b":1}'
+        assert cache.get('a') == {'b': 1}
+
+
 class TestFileCache(unittest.TestCase, AbstractCacheTest):
+    options = {}
+
     def setUp(self):
         home_dir = os.environ['HOME']
-        dir = os.path.join(home_dir, 'cachecore-tests')
-        self.cache = FileCache(dir=dir)
+        self.dir = os.path.join(home_dir, 'cachecore-tests')
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self.cache = FileCache(dir=self.dir)
+
+    def test_layout(self):
+        self.cache.set('a', 1)
+        path = self.cache._key_to_path('a')
+        assert os.path.relpath(path, self.dir).count(os.sep) == 2
+        assert os.path.exists(path)
+
+        flat = FileCache(dir=self.dir, levels=0)
+        assert os.path.dirname(flat._key_to_path('a')) == self.dir
+
+    def test_layout_change(self):
+        flat = FileCache(dir=self.dir, levels=0, **self.options)
+        flat.set_many({'a': 1, 'b': 2})
+        flat.set('c', 3)
+
+        cache = FileCache(dir=self.dir, levels=1, **self.options)
+        assert cache.get('a') == 1
+        assert sorted(cache) == ['a', 'b', 'c']
+        assert not [name for name in os.listdir(self.dir) if name.endswith('.cachecore')]
+
+        flat.set('d', 4)
+        cache.clear()
+        assert list(flat) == []
+        assert list(FileCache(dir=self.dir, levels=2, **self.options)) == []
+
+    def test_corrupt_files(self):
+        path = self.cache._key_to_path('a')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        for data in (b'', b'\x00' * 4, b'\x00' * 8 + b'\x80\x04\x95'):
+            with open(path, 'wb') as f:
+                f.write(data)
+            assert self.cache.get('a') is None
+
+        # A valid header followed by a payload the serializer rejects.
+        for payload in (b'\x80\x04\x95', b'\xff', b'\x02\x80'):
+            with open(path, 'wb') as f:
+                f.write(_HEADER.pack(_MAGIC, _VERSION, 0.0, 0.0) + payload)
+            assert self.cache.get('a') is None
+            assert not os.path.exists(path)
+
+    def test_tmp_files(self):
+        self.cache.set('a', 1)
+        dirname = os.path.dirname(self.cache._key_to_path('a'))
+        old = os.path.join(dirname, '.old.cachecore.0123456789ab.tmp')
+        new = os.path.join(dirname, '.new.cachecore.0123456789ab.tmp')
+        for path in (old, new):
+            with open(path, 'wb') as f:
+                f.write(b'x')
+        # Left behind by a writer that crashed long ago.
+        os.utime(old, (time.time() - 7200, time.time() - 7200))
+
+        self.cache.clear()
+        assert not os.path.exists(old)
+        # Possibly still being written.
+        assert os.path.exists(new)
+
+        # Culling sweeps the directories it visits.
+        cache = FileCache(dir=self.dir, levels=0, max_files=1, **self.options)
+        old = os.path.join(self.dir, '.old.cachecore.0123456789ab.tmp')
+        with open(old, 'wb') as f:
+            f.write(b'x')
+        os.utime(old, (time.time() - 7200, time.time() - 7200))
+        cache.set_many({'a': 1, 'b': 2})
+        assert not os.path.exists(old)
+
+    def test_soft_ttl_kept(self):
+        # A soft TTL of 0 makes the value stale at once.
+        self.cache._set_fresh('a', 1, 300, 0)
+        assert self.cache.replace('a', 2) is True
+        assert self.cache._get_fresh('a', 300, 0) == (2, True)
+        assert self.cache.incr('a') == 3
+        assert self.cache._get_fresh('a', 300, 0) == (3, True)
+
+        # A new TTL drops the soft deadline.
+        assert self.cache.replace('a', 4, 300) is True
+        assert self.cache._get_fresh('a', 300, 0) == (4, False)
+
+    def test_old_format(self):
+        # A file from before the header had a magic number and version.
+        path = self.cache._key_to_path('a')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(struct.pack('d', 0.0) + pickle.dumps(1))
+
+        assert self.cache.get('a') is None
+        assert not os.path.exists(path)
+
+    def test_atomic_write(self):
+        self.cache.set('a', 1)
+        path = self.cache._key_to_path('a')
+        with open(path, 'rb') as f:
+            self.cache.set('a', 2)
+            # The open file still sees the complete old value.
+            assert f.read()[_HEADER.size:] == self.cache.serializer.dumps(1)
+
+        assert self.cache.get('a') == 2
+        assert os.listdir(os.path.dirname(path)) == [os.path.basename(path)]
+
+    def test_fsync(self):
+        cache = FileCache(dir=self.dir, fsync=True)
+        cache.set('a', 1)
+        assert cache.get('a') == 1
+
+    def test_sweep(self):
+        self.cache.set_many([(str(i), i) for i in range(10)], 1)
+        self.cache.set('a', 1)
+        time.sleep(1)
+        assert self.cache.sweep() == 10
+        assert len(list(self.cache._iterdir())) == 1
+
+    def test_max_files(self):
+        cache = FileCache(dir=self.dir, levels=0, max_files=10, **self.options)
+        for i in range(10):
+            cache.set(str(i), i)
+        # Reading a key makes it the most recently used one.
+        assert cache.get('0') == 0
+        cache.set('10', 10)
+
+        assert len(list(cache._iterdir())) == 9
+        assert cache.exists('0') is True
+        assert cache.exists('1') is False
+        assert cache.exists('10') is True
+
+    def test_cull_expired_first(self):
+        cache = FileCache(dir=self.dir, levels=0, max_files=10, **self.options)
+        for i in range(9):
+            cache.set(str(i), i)
+        cache.set('a', 1, 1)
+        time.sleep(1)
+        cache.set('9', 9)
+
+        # The expired key goes first, then the least recently used one.
+        assert cache.exists('a') is False
+        assert cache.exists('0') is False
+        assert all(cache.exists(str(i)) for i in range(1, 10))
+
+    def test_max_bytes(self):
+        cache = FileCache(dir=self.dir, max_bytes=10_000, **self.options)
+        for i in range(100):
+            cache.set(str(i), b'x' * 1000)
+
+        size = sum(entry.stat().st_size for entry in cache._iterdir())
+        assert size <= 10_000
+        assert cache._usage == [len(list(cache._iterdir())), size]
+
+        # The tally is taken from disk when the cache is opened.
+        assert FileCache(dir=self.dir, max_bytes=10_000)._usage == cache._usage
+
+    def test_batch(self):
+        self.cache.batch_size = 7
+        keys = [str(i) for i in range(50)]
+        self.cache.set_many({k: int(k) for k in keys}, 300)
+        assert list(self.cache.get_many(keys + ['x'])) == list(range(50)) + [None]
+        assert self.cache.get_ttl('0') == 300
+        assert all(self.cache.delete_many(keys))
+        assert len(self.cache) == 0
+        self.cache.close()
+
+    def test_mmap(self):
+        cache = FileCache(
+            dir=self.dir,
+            serializer=Pickle5Serializer(),
+            mmap_threshold=1024,
+            **self.options
+        )
+        blob = os.urandom(4096)
+        cache.set('blob', blob)
+        cache.set('small', b'abc')
+        cache.set('nested', {'a': pickle.PickleBuffer(blob), 'b': 1})
+
+        value = cache.get('blob')
+        assert isinstance(value, memoryview) and value.readonly
+        assert value == blob
+        assert cache.get('small') == b'abc'
+        nested = cache.get('nested')
+        assert nested['a'] == blob and nested['a'].readonly
+        assert nested['b'] == 1
+
+        # The mapping outlives the file being replaced.
+        cache.set('blob', b'')
+        assert value == blob
+
+
+def _shm_incr(name, n):
+    cache = SharedMemoryCache(name=name, slots=256)
+    for _ in range(n):
+        cache.incr('counter')
+    cache.close()
+
+
+class _CountingCache(LocalCache):
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def get_many(self, keys, default=None):
+        keys = list(keys)
+        self.calls.append(keys)
+        return super().get_many(keys, default)
+
+
+class _NoTTLCache(LocalCache):
+    def get_ttl(self, key, default=0):
+        raise NotImplementedError
+
+
+class TestTieredCache(unittest.TestCase, AbstractCacheTest):
+    def setUp(self):
+        self.l1 = LocalCache()
+        self.l2 = _CountingCache()
+        self.cache = TieredCache(self.l1, self.l2)
+
+    def test_read_through(self):
+        self.l2.set('a', 1, 300)
+        assert self.cache.get('a') == 1
+        # The copy in L1 expires with the value in L2.
+        assert self.l1.get('a') == 1
+        assert self.l1.get_ttl('a') == 300
+
+        self.l2.set('a', 2)
+        assert self.cache.get('a') == 1
+
+    def test_soft_ttl(self):
+        assert self.cache.get_or_set('a', lambda: 1, 300, soft_ttl=60) == 1
+        assert self.cache.get_or_set('a', lambda: 2, 300, soft_ttl=60) == 1
+        assert list(self.cache) == ['a']
+        assert list(self.l1) == ['a']
+
+    def test_unknown_ttl(self):
+        l2 = _NoTTLCache()
+        l2.set('a', 1, 5)
+        assert TieredCache(self.l1, l2).get('a') == 1
+        assert self.l1.get_ttl('a') == TieredCache.unknown_ttl
+
+        l2.set('b', 1, 5)
+        assert TieredCache(self.l1, l2, l1_ttl=3).get('b') == 1
+        assert self.l1.get_ttl('b') == 3
+
+    def test_l1_ttl(self):
+        cache = TieredCache(self.l1, self.l2, l1_ttl=10)
+        cache.set('a', 1)
+        assert self.l1.get_ttl('a') == 10
+        assert self.l2.get_ttl('a') is None
+
+        cache.set('b', 1, 5)
+        assert self.l1.get_ttl('b') == 5
+
+    def test_get_many_batches_misses(self):
+        self.l2.set_many({'a': 1, 'b': 2, 'c': 3})
+        self.l1.set('b', 2)
+        self.l2.calls.clear()
+
+        assert list(self.cache.get_many(['a', 'b', 'c', 'd'])) == [1, 2, 3, None]
+        assert self.l2.calls == [['a', 'c', 'd']]
+        assert list(self.l1.get_many(['a', 'c', 'd'])) == [1, 3, None]
+
+    def test_writes_invalidate_l1(self):
+        self.cache.set('a', 1)
+        assert self.cache.incr('a') == 2
+        assert self.l1.get('a') is None
+        assert self.cache.get('a') == 2
+
+        self.l2.set('b', 1)
+        self.l1.set('b', 0)
+        assert self.cache.add('b', 2) is False
+        assert self.cache.get('b') == 1
+
+
+class TestInstrumentedLocalCache(unittest.TestCase, AbstractCacheTest):
+    def setUp(self):
+        self.cache = InstrumentedCache(LocalCache(thread_safe=True))
+
+
+class TestShardedCache(unittest.TestCase, AbstractCacheTest):
+    def setUp(self):
+        self.nodes = {f'10.0.0.{i}:11211': _CountingCache() for i in range(3)}
+        self.cache = ShardedCache(self.nodes)
+
+    def tearDown(self):
+        self.cache.close()
+
+    def test_soft_ttl(self):
+        self.cache.get_or_set('a', lambda: 1, 300, soft_ttl=60)
+        # The node stores the soft TTL with the value.
+        assert sum(len(node) for node in self.nodes.values()) == 1
+        assert list(self.cache) == ['a']
+
+    def test_spread(self):
+        keys = [f'key{i}' for i in range(300)]
+        self.cache.set_many({k: k for k in keys})
+        for node in self.nodes.values():
+            assert 50 < len(node) < 150
+        for key in keys:
+            assert self.cache.node(key).get(key) == key
+
+    def test_get_many_by_node(self):
+        self.cache.set_many({f'key{i}': i for i in range(30)})
+        for node in self.nodes.values():
+            node.calls.clear()
+
+        keys = [f'key{i}' for i in range(30)] + ['missing']
+        assert list(self.cache.get_many(keys)) == list(range(30)) + [None]
+        # One batch per node.
+        assert sum(len(node.calls) for node in self.nodes.values()) == 3
+
+
+class TestHashRing(unittest.TestCase):
+    def test_stable(self):
+        nodes = [f'10.0.0.{i}:11211' for i in range(4)]
+        ring = HashRing(nodes)
+        keys = [f'key{i}' for i in range(1000)]
+        before = {k: ring.get_node(k) for k in keys}
+        assert before == {k: HashRing(reversed(nodes)).get_node(k) for k in keys}
+
+        # Only keys owned by a removed node move.
+        smaller = HashRing(nodes[:3])
+        for key, node in before.items():
+            if node != nodes[3]:
+                assert smaller.get_node(key) == node
+
+    def test_weights(self):
+        ring = HashRing(['a', 'b'], weights={'a': 3})
+        owners = [ring.get_node(f'key{i}') for i in range(1000)]
+        assert 650 < owners.count('a') < 850
+
+    def test_empty(self):
+        with self.assertRaises(ValueError):
+            HashRing([])
+
+
+class TestSharedMemoryCache(unittest.TestCase, AbstractCacheTest):
+    def setUp(self):
+        self.name = f'cachecore-test-{uuid.uuid4().hex[:8]}'
+        self.cache = SharedMemoryCache(name=self.name, slots=256)
+
+    def tearDown(self):
+        self.cache.unlink()
+        self.cache.close()
+
+    def test_attach(self):
+        other = SharedMemoryCache(name=self.name, slots=256)
+        self.cache.set('a', 1)
+        assert other.get('a') == 1
+        other.close()
+
+        with self.assertRaises(ValueError):
+            SharedMemoryCache(name=self.name, slots=512)
+
+    def test_processes(self):
+        ctx = multiprocessing.get_context('spawn')
+        procs = [ctx.Process(target=_shm_incr, args=(self.name, 200)) for _ in range(4)]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+        assert self.cache.get('counter') == 800
+
+    def test_full_table(self):
+        # Once every slot is taken, writes evict entries instead of failing.
+        for i in range(1000):
+            self.cache.set(str(i), i)
+        assert self.cache.get('999') == 999
+        assert len(self.cache) <= 256
+
+    def test_too_large(self):
+        with self.assertRaises(ValueError):
+            self.cache.set('a', b'x' * 5000)
+
+
+class TestIndexedFileCache(TestFileCache):
+    options = {'index': True}
+
+    def setUp(self):
+        super().setUp()
+        self.cache = FileCache(dir=self.dir, index=True)
+
+    def test_set_ttl_in_place(self):
+        self.cache.set('a', 1)
+        path = self.cache._key_to_path('a')
+        inode = os.stat(path).st_ino
+        assert self.cache.set_ttl('a', 300) is True
+        assert os.stat(path).st_ino == inode
+        assert self.cache.get_ttl('a') == 300
+        assert self.cache.get('a') == 1
+
+    def test_sweep(self):
+        self.cache.set_many([(str(i), i) for i in range(10)], 1)
+        self.cache.set('a', 1)
+        time.sleep(1)
+        assert self.cache.sweep() == 10
+        assert list(self.cache) == ['a']
+        assert len(list(self.cache._iterdir())) == 1
+
+    def test_rebuild_index(self):
+        FileCache(dir=self.dir).set('a', 1)
+        assert self.cache.exists('a') is False
+        self.cache.rebuild_index()
+        assert self.cache.exists('a') is True
+
+
+class TestNearCache(unittest.TestCase):
+    def test_invalidated_while_reading(self):
+        near = NearCache(client=None, max_entries=10)
+        token = near._begin('a')
+        near.invalidate('a')
+        near._store('a', token, b'1')
+        assert near._local.get('a') is None
+
+        token = near._begin('a')
+        near._store('a', token, b'1')
+        assert near._local.get('a') == b'1'
+        assert near._local.get_ttl('a') == 1
+
+
+class _FakeRedis:
+    """Just enough of redis.Redis to route reads to.
+    """
+
+    def __init__(self, data, role='slave'):
+        self.data = data
+        self.role = role
+        self.link = 'up'
+        self.down = False
+        self.reads = 0
+
+    def _read(self):
+        if self.down:
+            raise redis.ConnectionError
+        self.reads += 1
+
+    def info(self, section=None):
+        self._read()
+        return {'role': self.role, 'master_link_status': self.link}
+
+    def get(self, key):
+        self._read()
+        return self.data.get(key)
+
+    def mget(self, keys):
+        self._read()
+        return [self.data.get(k) for k in keys]
+
+    def exists(self, key):
+        self._read()
+        return int(key in self.data)
+
+    def ttl(self, key):
+        self._read()
+        return -1 if key in self.data else -2
+
+    def scan(self, cursor, match=None, count=None):
+        self._read()
+        return 0, [k.encode() for k in self.data]
+
+
+class TestReplicaSet(unittest.TestCase):
+    def setUp(self):
+        data = {'a': RedisCache.serializer.dumps(1)}
+        self.primary = _FakeRedis(data, role='master')
+        self.replicas = [_FakeRedis(data), _FakeRedis(data)]
+        self.cache = RedisCache(self.primary, replicas=self.replicas)
+
+    def tearDown(self):
+        self.cache.close()
+
+    def reset(self):
+        for client in [self.primary] + self.replicas:
+            client.reads = 0
+
+    def test_round_robin(self):
+        self.reset()
+        for _ in range(4):
+            assert self.cache.get('a') == 1
+        assert list(self.cache.get_many(['a', 'b'])) == [1, None]
+        assert self.cache.exists('a') is True
+        assert self.cache.get_ttl('a') is None
+        assert list(self.cache.keys()) == ['a']
+        assert [r.reads for r in self.replicas] == [4, 4]
+        assert self.primary.reads == 0
+
+    def test_least_latency(self):
+        replicas = ReplicaSet(self.primary, self.replicas, 'least_latency')
+        replicas.replicas[0].latency = 0.002
+        replicas.replicas[1].latency = 0.001
+        assert replicas.choose() is replicas.replicas[1]
+
+    def test_fallback(self):
+        self.replicas[0].down = True
+        self.replicas[1].link = 'down'
+        self.reset()
+        # The failed read is retried on the primary, and the replica is
+        # skipped afterwards.
+        assert self.cache.get('a') == 1
+        assert self.primary.reads == 1
+        assert self.cache.get('a') == 1
+        assert self.replicas[1].reads == 1
+
+        # Both replicas are unhealthy after the next check.
+        self.cache._replicas.check()
+        self.reset()
+        assert self.cache.get('a') == 1
+        assert list(self.cache.keys()) == ['a']
+        assert self.primary.reads == 2
+        assert self.replicas[1].reads == 0
+
+        self.replicas[0].down = False
+        self.replicas[1].link = 'up'
+        self.cache._replicas.check()
+        assert self.cache.get('a') == 1
+        assert self.primary.reads == 2
+
+    def test_strategy(self):
+        with self.assertRaises(ValueError):
+            ReplicaSet(self.primary, self.replicas, 'random')
+
+
+class _RecordingPipeline:
+    def __init__(self, commands):
+        self.commands = commands
 
-        for fname in os.listdir(dir):
-            if fname.endswith('.cachecore'):
-                fpath = os.path.join(dir, fname)
-                os.remove(fpath)
+    def set(self, key, value, ex=None):
+        self.commands.append(('set', key, value))
+
+    def append(self, key, value):
+        self.commands.append(('append', key, value))
+
+    def execute(self):
+        self.commands.append(('execute',))
+
+
+class _RecordingRedis:
+    def __init__(self):
+        self.commands = []
+
+    def set(self, key, value, ex=None):
+        self.commands.append(('set', key, value))
+
+    def pipeline(self, transaction=True):
+        assert transaction
+        return _RecordingPipeline(self.commands)
+
+
+class TestBufferedSet(unittest.TestCase):
+    def test_append_parts(self):
+        client = _RecordingRedis()
+        cache = RedisCache(client, serializer=Pickle5Serializer())
+        cache.append_threshold = 1000
+
+        cache.set('small', {'a': pickle.PickleBuffer(bytearray(10))})
+        assert [c[0] for c in client.commands] == ['set']
+
+        client.commands.clear()
+        buffer = bytearray(2000)
+        cache.set('large', {'a': pickle.PickleBuffer(buffer)})
+        assert [c[0] for c in client.commands] == ['set', 'append', 'append', 'execute']
+        # The buffer is sent as it is.
+        assert client.commands[2][2].obj is buffer
 
 
 class TestRedisCache(unittest.TestCase, AbstractCacheTest):
@@ -277,6 +1167,62 @@ class TestRedisCache(unittest.TestCase, AbstractCacheTest):
         client.flushdb()
         self.cache = RedisCache(client=client)
 
+    def test_pipeline(self):
+        self.cache.set('b', 2, 300)
+        with self.cache.pipeline() as p:
+            a = p.get('a')
+            added = p.add('a', 1)
+            b = p.pop('b')
+            n = p.incr('n', 5)
+            ttl = p.get_ttl('a')
+            values = p.get_many(['a', 'b'], default=0)
+            assert not a.done
+            with self.assertRaises(RuntimeError):
+                a.value
+
+        assert a.value is None
+        assert added.value is True
+        assert b.value == 2
+        assert n.value == 5
+        assert ttl.value is None
+        assert values.value == [1, 0]
+
+    def test_batch(self):
+        p = self.cache.batch()
+        p.set('a', 1)
+        p.set_ttl('a', 300)
+        p.delete_many(['a', 'b'])
+        assert len(p) == 3
+        assert p.execute() == [None, True, [True, False]]
+        assert len(p) == 0
+
+    def test_near_cache(self):
+        cache = RedisCache(near_cache=100)
+        other = RedisCache()
+        try:
+            cache.set('a', 1)
+            assert cache.get('a') == 1
+            assert cache._near._local.get('a') == b'1'
+
+            # Writes from other clients are invalidated by the server.
+            other.set('a', 2)
+            time.sleep(0.1)
+            assert cache.get('a') == 2
+
+            with cache.pipeline() as p:
+                p.set('a', 3)
+            assert cache._near._local.get('a') is None
+            assert list(cache.get_many(['a', 'b'])) == [3, None]
+        finally:
+            cache.close()
+
+    def test_pipeline_error(self):
+        with self.assertRaises(ZeroDivisionError):
+            with self.cache.pipeline() as p:
+                p.set('a', 1)
+                1 / 0
+        assert self.cache.get('a') is None
+
 
 class TestMemcachedCache(unittest.TestCase, AbstractCacheTest):
     def setUp(self):
@@ -336,5 +1282,135 @@ class TestMemcachedCache(unittest.TestCase, AbstractCacheTest):
         assert self.cache.get('a') == 3
 
 
+class AbstractAsyncCacheTest:
+
+    async def test_get_set(self):
+        assert await self.cache.get('a') is None
+        assert await self.cache.get('a', default=1) == 1
+
+        await self.cache.set('a', 1)
+        assert await self.cache.get('a') == 1
+        assert await self.cache.get_ttl('a') is None
+
+        await self.cache.set('a', 1, 20)
+        assert await self.cache.get_ttl('a') == 20
+
+    async def test_add_replace(self):
+        assert await self.cache.add('a', 1) is True
+        assert await self.cache.add('a', 1) is False
+
+        assert await self.cache.replace('b', 1) is False
+        assert await self.cache.replace('a', 2, None) is True
+        assert await self.cache.get('a') == 2
+
+    async def test_delete_pop(self):
+        assert await self.cache.delete('a') is False
+        await self.cache.set('a', 1)
+        assert await self.cache.exists('a') is True
+        assert await self.cache.pop('a') == 1
+        assert await self.cache.exists('a') is False
+
+    async def test_keys(self):
+        await self.cache.set_many([('hello', 1), ('hallo', 2), ('world', 3)])
+        assert sorted([key async for key in self.cache]) == ['hallo', 'hello', 'world']
+        assert sorted([key async for key in self.cache.keys('h*llo')]) == ['hallo', 'hello']
+
+    async def test_get_set_many(self):
+        assert await self.cache.get_many(['a', 'b']) == [None, None]
+        await self.cache.set_many({'a': 1, 'b': 2}.items(), 300)
+        assert await self.cache.get_many(['a', 'b']) == [1, 2]
+        assert await self.cache.delete_many(['a', 'b', 'c']) == [True, True, False]
+
+    async def test_get_set_ttl(self):
+        assert await self.cache.set_ttl('a', 300) is False
+        await self.cache.set('a', 1)
+        assert await self.cache.set_ttl('a', 300) is True
+        assert await self.cache.get_ttl('a') == 300
+
+    async def test_incr(self):
+        assert await self.cache.incr('a') == 1
+        assert await self.cache.incr('a', 20) == 21
+        assert await self.cache.decr('a', 2) == 19
+
+    async def test_get_or_set(self):
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.1)
+            return 'value'
+
+        values = await asyncio.gather(
+            *(self.cache.get_or_set('a', compute, 300) for _ in range(5))
+        )
+        assert values == ['value'] * 5
+        assert len(calls) == 1
+        assert await self.cache.get_or_set('b', lambda: 1) == 1
+
+    async def test_stale_while_revalidate(self):
+        assert await self.cache.get_or_set('a', lambda: 1, 300, soft_ttl=0) == 1
+        # The stale value is served while it is refreshed in a task.
+        assert await self.cache.get_or_set('a', lambda: 2, 300, soft_ttl=0) == 1
+        await self.cache._get_or_set_state()[2].join()
+        assert await self.cache.get('a') == 2
+
+    async def test_concurrent(self):
+        await asyncio.gather(*(self.cache.set(str(i), i) for i in range(20)))
+        values = await asyncio.gather(*(self.cache.get(str(i)) for i in range(20)))
+        assert values == list(range(20))
+
+
+class TestAsyncLocalCache(unittest.IsolatedAsyncioTestCase, AbstractAsyncCacheTest):
+    def setUp(self):
+        self.cache = AsyncLocalCache()
+
+
+class TestAsyncFileCache(unittest.IsolatedAsyncioTestCase, AbstractAsyncCacheTest):
+    def setUp(self):
+        self.dir = os.path.join(os.environ['HOME'], 'cachecore-tests')
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self.cache = AsyncFileCache(dir=self.dir)
+
+    async def test_offloaded(self):
+        main = threading.get_ident()
+        threads = []
+        self.cache.cache._read = lambda *args, **kwargs: (
+            threads.append(threading.get_ident()) or (False, None, None, None)
+        )
+        assert await self.cache.get('a') is None
+        assert threads and main not in threads
+
+
+class TestAsyncRedisCache(unittest.IsolatedAsyncioTestCase, AbstractAsyncCacheTest):
+    async def asyncSetUp(self):
+        self.cache = AsyncRedisCache()
+        await self.cache.clear()
+
+    async def asyncTearDown(self):
+        await self.cache.aclose()
+
+
+class TestAsyncMemcachedCache(unittest.IsolatedAsyncioTestCase, AbstractAsyncCacheTest):
+    async def asyncSetUp(self):
+        self.cache = AsyncMemcachedCache(host='localhost')
+        await self.cache.clear()
+
+    async def asyncTearDown(self):
+        await self.cache.aclose()
+
+    async def test_get_set(self):
+        assert await self.cache.get('a') is None
+        await self.cache.set('a', 1, 20)
+        assert await self.cache.get('a') == 1
+
+    async def test_keys(self):
+        with self.assertRaises(NotImplementedError):
+            self.cache.keys()
+
+    async def test_get_set_ttl(self):
+        with self.assertRaises(NotImplementedError):
+            await self.cache.get_ttl('a')
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,223 @@
+from dataclasses import dataclass
+from datetime import datetime
+import enum
+import threading
+import unittest
+
+from src.cachecore import AsyncLocalCache, LocalCache, make_key
+from src.cachecore.base import _lock_key
+
+
+@dataclass
+class Point:
+    x: int
+    y: int
+
+
+class Color(enum.Enum):
+    RED = 1
+    GREEN = 2
+
+
+class Account:
+    def __init__(self, id):
+        self.id = id
+        self.lock = threading.Lock()
+
+    def __cache_key__(self):
+        return self.id
+
+
+class TestMakeKey(unittest.TestCase):
+
+    def test_stable(self):
+        key = make_key('f', (1, 'a', b'b', None, [1.5], {'x': {2, 1}}), {})
+        assert key == make_key('f', (1, 'a', b'b', None, [1.5], {'x': {1, 2}}), {})
+        assert key.startswith('f:')
+        assert len(key) == 2 + 32
+
+    def test_distinct(self):
+        keys = {
+            make_key('f', args, kwargs) for args, kwargs in [
+                ((), {}), ((1,), {}), (('1',), {}), ((1, 2), {}), (((1, 2),), {}),
+                (([1, 2],), {}), ((), {'a': 1}), ((1,), {'a': 1}), ((Point(1, 2),), {}),
+            ]
+        }
+        assert len(keys) == 9
+        assert make_key('f', (1,), {}) != make_key('g', (1,), {})
+
+    def test_unambiguous(self):
+        # Arguments that look like the normalized form of other arguments.
+        pairs = [
+            (([1],), (('list', (1,)),)),
+            (({'a': 1},), (('dict', (('a', 1),)),)),
+            (({1},), (('set', (1,)),)),
+            (((1,),), ([1],)),
+            ((Point(1, 2),), (('dataclass', f'{__name__}.Point', (('x', 1), ('y', 2))),)),
+            ((Color.RED,), (('enum', f'{__name__}.Color', 'RED'),)),
+        ]
+        for args, other in pairs:
+            assert make_key('f', args, {}) != make_key('f', other, {})
+
+        assert make_key('f', (), {'x': 1}) != make_key('f', ('__kwargs__', ('x', 1)), {})
+        assert make_key('f', (1,), {}) != make_key('f', (), {'x': 1})
+        assert make_key('f', (('x', 1),), {}) != make_key('f', (), {'x': 1})
+
+    def test_objects(self):
+        assert make_key('f', (Point(1, 2),), {}) == make_key('f', (Point(1, 2),), {})
+        assert make_key('f', (Point(1, 2),), {}) != make_key('f', (Point(2, 1),), {})
+        assert make_key('f', (Color.RED,), {}) != make_key('f', (Color.GREEN,), {})
+        assert make_key('f', (Account(1),), {}) == make_key('f', (Account(1),), {})
+        assert make_key('f', (Account(1),), {}) != make_key('f', (Account(2),), {})
+        assert make_key('f', (Account(1),), {}) != make_key('f', (1,), {})
+        assert make_key('f', (datetime(2024, 1, 1),), {}) != make_key('f', (datetime(2024, 1, 2),), {})
+
+        with self.assertRaisesRegex(TypeError, '__cache_key__'):
+            make_key('f', (object(),), {})
+
+    def test_kwargs_order(self):
+        assert make_key('f', (), {'a': 1, 'b': 2}) == make_key('f', (), {'b': 2, 'a': 1})
+
+    def test_typed(self):
+        assert make_key('f', (1,), {}) == make_key('f', (1.0,), {})
+        assert make_key('f', (1,), {}) == make_key('f', (True,), {})
+        assert make_key('f', (1,), {}, typed=True) != make_key('f', (1.0,), {}, typed=True)
+        assert make_key('f', (), {'a': 1}, typed=True) != make_key('f', (), {'a': True}, typed=True)
+
+
+class TestMemoize(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = LocalCache()
+        self.calls = []
+
+        @self.cache.memoize(ttl=300)
+        def add(a, b=0):
+            self.calls.append((a, b))
+            return a + b
+
+        self.add = add
+
+    def test_memoize(self):
+        assert self.add(1, 2) == 3
+        assert self.add(1, 2) == 3
+        assert self.add(1, b=2) == 3
+        assert self.add(2) == 2
+        assert self.calls == [(1, 2), (1, 2), (2, 0)]
+        assert self.cache.get_ttl(self.add.make_key(1, 2)) == 300
+        assert self.add.__name__ == 'add'
+
+    def test_invalidate(self):
+        self.add(1, 2)
+        assert self.add.invalidate(1, 2) is True
+        assert self.add.invalidate(1, 2) is False
+        self.add(1, 2)
+        assert len(self.calls) == 2
+
+    def test_bypass(self):
+        self.add(1, 2)
+        assert self.add.uncached(1, 2) == 3
+        assert self.add.refresh(1, 2) == 3
+        assert self.add(1, 2) == 3
+        assert len(self.calls) == 3
+
+        self.cache.clear()
+        assert self.add(1, 2, cache_bypass=True) == 3
+        assert self.calls[-1] == (1, 2)
+        assert self.cache.get(self.add.make_key(1, 2)) is None
+        assert self.add(1, 2, cache_bypass=False) == 3
+        assert self.cache.get(self.add.make_key(1, 2)) == 3
+
+    def test_method(self):
+        class Accounts(Account):
+            @self.cache.memoize()
+            def balance(self):
+                return self.id * 10
+
+        assert Accounts(1).balance() == 10
+        assert Accounts(2).balance() == 20
+        assert self.cache.get(Accounts.balance.make_key(Accounts(1))) == 10
+
+    def test_key(self):
+        @self.cache.memoize(key=lambda user_id, **_: str(user_id), prefix='user')
+        def load(user_id, verbose=False):
+            return {'id': user_id}
+
+        assert load(7) == {'id': 7}
+        assert self.cache.get('user:7') == {'id': 7}
+        assert load.make_key(7, verbose=True) == 'user:7'
+
+    def test_none(self):
+        calls = []
+
+        @self.cache.memoize()
+        def nothing():
+            calls.append(1)
+
+        nothing()
+        nothing()
+        assert len(calls) == 1
+
+
+class TestAsyncMemoize(unittest.IsolatedAsyncioTestCase):
+
+    async def test_async_cache(self):
+        cache = AsyncLocalCache()
+        calls = []
+
+        @cache.memoize(ttl=300)
+        async def double(x):
+            calls.append(x)
+            return x * 2
+
+        assert await double(2) == 4
+        assert await double(2) == 4
+        assert calls == [2]
+        assert await double.invalidate(2) is True
+        assert await double.refresh(2) == 4
+        assert calls == [2, 2]
+        assert await double(2, cache_bypass=True) == 4
+        assert calls == [2, 2, 2]
+
+        with self.assertRaises(TypeError):
+            cache.memoize()(lambda: 1)
+
+    async def test_sync_cache(self):
+        cache = LocalCache()
+
+        @cache.memoize()
+        async def double(x):
+            return x * 2
+
+        assert await double(3) == 6
+        assert cache.get(double.make_key(3)) == 6
+
+    async def test_sync_cache_lock(self):
+        cache = LocalCache()
+        cache._distributed = True
+
+        @cache.memoize()
+        async def locked(x):
+            return cache.exists(_lock_key(locked.make_key(x)))
+
+        # Shared caches keep their lock when wrapped.
+        assert await locked(1) is True
+
+    async def test_sync_cache_thread(self):
+        cache = LocalCache()
+        threads = set()
+        get = cache.get
+        cache.get = lambda *args: threads.add(threading.get_ident()) or get(*args)
+
+        @cache.memoize()
+        async def double(x):
+            return x * 2
+
+        await double(1)
+        await double(1)
+        # A cache that isn't thread-safe is only used from the event loop.
+        assert threads == {threading.get_ident()}
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,308 @@
+import os
+import random
+import shutil
+import time
+import unittest
+import warnings
+
+from src.cachecore import (
+    DummyCache, FileCache, HotKeySampler, InstrumentedCache, LocalCache, ShardedCache, TieredCache
+)
+from src.cachecore.metrics import Histogram
+from src.cachecore.serializers import TaggedSerializer
+
+
+class _Slow:
+    def __reduce__(self):
+        time.sleep(0.1)
+        return _Slow, ()
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_exact_small_values(self):
+        histogram = Histogram()
+        for value in range(32):
+            histogram.record(value)
+        assert histogram.percentile(50) == 15
+        assert histogram.percentile(100) == 31
+        assert histogram.count_at_most(9) == 10
+
+    def test_relative_error(self):
+        histogram = Histogram()
+        values = sorted(random.randrange(1, 10_000_000) for _ in range(10_000))
+        for value in values:
+            histogram.record(value)
+
+        for q in (50, 90, 99):
+            exact = values[round(q / 100 * len(values)) - 1]
+            assert exact <= histogram.percentile(q) <= exact * (1 + 1 / 16)
+        assert histogram.percentile(100) == values[-1]
+        assert histogram.total == sum(values)
+        # A few hundred buckets cover seconds in microseconds.
+        assert len(histogram.counts) < 400
+
+    def test_empty(self):
+        assert Histogram().percentile(99) == 0
+
+
+class TestInstrumentedCache(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = []
+        self.cache = InstrumentedCache(
+            LocalCache(), name='local',
+            callback=lambda *metric: self.metrics.append(metric)
+        )
+
+    def test_counts(self):
+        self.cache.set('a', 'abc')
+        assert self.cache.get('a') == 'abc'
+        assert self.cache.get('b') is None
+        assert list(self.cache.get_many(['a', 'b', 'c'])) == ['abc', None, None]
+
+        stats = self.cache.stats()
+        assert stats['set']['calls'] == 1
+        assert stats['get']['calls'] == 2
+        assert stats['get']['hits'] == 1 and stats['get']['misses'] == 1
+        assert stats['get']['hit_ratio'] == 0.5
+        assert stats['get_many']['hits'] == 1 and stats['get_many']['misses'] == 2
+        assert stats['total']['hits'] == 2 and stats['total']['misses'] == 3
+        assert stats['get']['latency']['count'] == 2
+        assert 0 < stats['get']['latency']['max'] < 1
+        assert 'delete' not in stats
+
+    def test_bytes(self):
+        size = len(TaggedSerializer().dumps('x' * 100))
+        self.cache.set('a', 'x' * 100)
+        self.cache.get('a')
+        stats = self.cache.stats()
+        assert stats['set']['bytes_written'] == size
+        assert stats['get']['bytes_read'] == size
+        assert stats['get']['bytes_written'] == 0
+
+    def test_bytes_threaded(self):
+        # FileCache serializes batches in a thread pool.
+        path = os.path.join(os.environ['HOME'], 'cachecore-metrics-tests')
+        shutil.rmtree(path, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, path, ignore_errors=True)
+        file = FileCache(path)
+        self.addCleanup(file.close)
+        cache = InstrumentedCache(file)
+
+        size = len(TaggedSerializer().dumps('x' * 100))
+        cache.set_many({'a': 'x' * 100, 'b': 'x' * 100})
+        assert list(cache.get_many(['a', 'b'])) == ['x' * 100] * 2
+        stats = cache.stats()
+        assert stats['set_many']['bytes_written'] == 2 * size
+        assert stats['get_many']['bytes_read'] == 2 * size
+
+    def test_bytes_composite(self):
+        size = len(TaggedSerializer().dumps('x' * 100))
+        tiered = TieredCache(LocalCache(serialize=False), LocalCache())
+        cache = InstrumentedCache(tiered)
+        cache.set('a', 'x' * 100)
+        tiered.l1.clear()
+        assert cache.get('a') == 'x' * 100
+        stats = cache.stats()
+        assert stats['set']['bytes_written'] == size
+        assert stats['get']['bytes_read'] == size
+
+        nodes = {'a': LocalCache(), 'b': LocalCache()}
+        cache = InstrumentedCache(ShardedCache(nodes))
+        cache.set_many({str(i): 'x' * 100 for i in range(10)})
+        assert cache.stats()['set_many']['bytes_written'] == 10 * size
+
+        cache.enabled = False
+        assert all(node.serializer is LocalCache.serializer for node in nodes.values())
+
+    def test_no_serializer(self):
+        with self.assertWarns(RuntimeWarning):
+            InstrumentedCache(DummyCache())
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            InstrumentedCache(DummyCache(), enabled=False)
+
+    def test_keys_lazy(self):
+        consumed = []
+
+        class _Keys(LocalCache):
+            def keys(self, pattern=None):
+                for key in super().keys(pattern):
+                    consumed.append(key)
+                    yield key
+
+        cache = InstrumentedCache(_Keys())
+        cache.set_many({'a': 1, 'b': 2, 'c': 3})
+        keys = cache.keys()
+        assert next(keys) in 'abc'
+        assert len(consumed) == 1
+        assert cache.stats().get('keys') is None
+        keys.close()
+        assert cache.stats()['keys']['calls'] == 1
+        assert sorted(cache) == ['a', 'b', 'c']
+        assert cache.stats()['keys']['calls'] == 2
+
+    def test_errors(self):
+        self.cache.set('a', 'abc')
+        with self.assertRaises(TypeError):
+            self.cache.incr('a')
+        assert self.cache.stats()['incr']['errors'] == 1
+        assert ('cachecore.incr.errors', 1, 'c') in self.metrics
+
+    def test_callback(self):
+        self.cache.get('a')
+        names = [name for name, _, _ in self.metrics]
+        assert names == ['cachecore.get.ms', 'cachecore.get.misses']
+        assert self.metrics[0][2] == 'ms'
+
+    def test_disabled(self):
+        local = self.cache.cache
+        self.cache.enabled = False
+        assert local.serializer is LocalCache.serializer
+        self.cache.set('a', 1)
+        assert self.cache.get('a') == 1
+        assert self.cache.stats() == {'total': {
+            'calls': 0, 'errors': 0, 'hits': 0, 'misses': 0, 'bytes_read': 0,
+            'bytes_written': 0, 'hit_ratio': 0.0
+        }}
+        assert self.metrics == []
+
+        self.cache.enabled = True
+        assert self.cache.get('a') == 1
+        assert self.cache.stats()['get']['bytes_read'] > 0
+
+    def test_prometheus(self):
+        self.cache.set('a', 1)
+        self.cache.get('a')
+        text = self.cache.prometheus()
+        lines = text.splitlines()
+        assert '# TYPE cachecore_operations_total counter' in lines
+        assert 'cachecore_operations_total{cache="local",op="get"} 1' in lines
+        assert 'cachecore_hits_total{cache="local",op="get"} 1' in lines
+        assert 'cachecore_operation_duration_seconds_bucket{cache="local",op="get",le="+Inf"} 1' in lines
+        assert 'cachecore_operation_duration_seconds_count{cache="local",op="set"} 1' in lines
+        assert text.endswith('\n')
+
+
+class TestHotKeySampler(unittest.TestCase):
+
+    def test_hot_keys(self):
+        sampler = HotKeySampler(k=3)
+        keys = [f'key{i}' for i in range(100)]
+        for _ in range(20):
+            for key in keys:
+                sampler.record(key)
+            for _ in range(10):
+                sampler.record('hot')
+            for _ in range(5):
+                sampler.record('warm')
+
+        top = sampler.hot_keys()
+        assert len(top) == 3
+        assert top[0] == ('hot', 200)
+        assert top[1] == ('warm', 100)
+        assert sampler.hot_keys(1) == [('hot', 200)]
+
+    def test_sample_rate(self):
+        sampler = HotKeySampler(k=1, sample_rate=0.5)
+        for _ in range(2000):
+            sampler.record('a')
+        [(key, count)] = sampler.hot_keys()
+        assert key == 'a' and 1700 < count < 2300
+
+    def test_decay(self):
+        sampler = HotKeySampler(k=2, decay_after=100)
+        for _ in range(99):
+            sampler.record('old')
+        sampler.record('new')
+        assert sampler.hot_keys() == [('old', 49)]
+
+        for _ in range(60):
+            sampler.record('new')
+        assert sampler.hot_keys()[0] == ('new', 60)
+
+    def test_big_keys(self):
+        sampler = HotKeySampler(max_value_size=10, max_big_keys=2)
+        sampler.record_size('small', 10)
+        sampler.record_size('a', 20)
+        sampler.record_size('b', 30)
+        sampler.record_size('c', 25)
+        assert sampler.big_keys() == [('b', 30), ('c', 25)]
+
+
+class TestInstrumentedCacheSampler(unittest.TestCase):
+
+    def setUp(self):
+        self.sampler = HotKeySampler(k=2, max_value_size=100)
+        self.cache = InstrumentedCache(LocalCache(), sampler=self.sampler)
+
+    def test_hot_keys(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 1)
+        for _ in range(5):
+            self.cache.get('a')
+        list(self.cache.get_many(['a', 'b', 'c']))
+        self.cache.incr('b')
+
+        assert self.cache.hot_keys() == [('a', 7), ('b', 3)]
+
+    def test_big_keys(self):
+        self.cache.set('small', 'x')
+        self.cache.set('big', 'x' * 200)
+        self.cache.set_many({'a': 'x', 'b': 'x' * 300})
+        self.cache.add('c', 'x' * 150)
+
+        size = len(TaggedSerializer().dumps('x' * 300))
+        assert [key for key, _ in self.cache.big_keys()] == ['b', 'big', 'c']
+        assert self.cache.big_keys()[0] == ('b', size)
+
+    def test_big_keys_threaded(self):
+        # FileCache serializes batches in a thread pool, in any order.
+        path = os.path.join(os.environ['HOME'], 'cachecore-metrics-tests')
+        shutil.rmtree(path, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, path, ignore_errors=True)
+        file = FileCache(path)
+        self.addCleanup(file.close)
+        cache = InstrumentedCache(file, sampler=self.sampler)
+
+        # The first value is serialized last.
+        values = {'slow': _Slow(), 'big': 'x' * 200, 'bigger': 'x' * 300}
+        cache.set_many(values)
+
+        size = len(TaggedSerializer().dumps('x' * 300))
+        assert [key for key, _ in cache.big_keys()] == ['bigger', 'big']
+        assert cache.big_keys()[0] == ('bigger', size)
+
+    def test_big_keys_composite(self):
+        # ShardedCache writes batches to its nodes from a thread pool.
+        nodes = {'a': LocalCache(), 'b': LocalCache()}
+        tiered = TieredCache(LocalCache(serialize=False), ShardedCache(nodes))
+        cache = InstrumentedCache(tiered, sampler=self.sampler)
+        cache.set('big', 'x' * 200)
+        cache.set_many({'small': 'x', 'bigger': 'x' * 300})
+
+        size = len(TaggedSerializer().dumps('x' * 300))
+        assert [key for key, _ in cache.big_keys()] == ['bigger', 'big']
+        assert cache.big_keys()[0] == ('bigger', size)
+
+    def test_disabled(self):
+        self.cache.enabled = False
+        self.cache.set('big', 'x' * 200)
+        self.cache.get('big')
+        assert self.cache.hot_keys() == []
+        assert self.cache.big_keys() == []
+
+    def test_reset(self):
+        self.cache.set('big', 'x' * 200)
+        self.cache.reset()
+        assert self.cache.hot_keys() == []
+        assert self.cache.big_keys() == []
+
+    def test_without_sampler(self):
+        with self.assertRaises(ValueError):
+            InstrumentedCache(LocalCache()).hot_keys()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,23 @@
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
 import pickle
 import unittest
+from uuid import UUID
 
-from src.cachecore.serializers import JSONSerializer, RedisSerializer, SerializerInterface
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from src.cachecore.serializers import CompressedSerializer, JSONSerializer, \
+    MsgPackSerializer, OrjsonSerializer, Pickle5Serializer, RedisSerializer, \
+    SerializerInterface, TaggedSerializer
 
 
 
@@ -11,6 +27,11 @@ class TestSerializerInterface(unittest.TestCase):
         assert isinstance(pickle, SerializerInterface)
         assert issubclass(JSONSerializer, SerializerInterface)
         assert issubclass(RedisSerializer, SerializerInterface)
+        assert issubclass(Pickle5Serializer, SerializerInterface)
+        assert issubclass(TaggedSerializer, SerializerInterface)
+        assert issubclass(CompressedSerializer, SerializerInterface)
+        assert issubclass(MsgPackSerializer, SerializerInterface)
+        assert issubclass(OrjsonSerializer, SerializerInterface)
 
 
 class AbstractSerializerTest(unittest.TestCase):
@@ -52,5 +73,203 @@ class TestJSONSerializer(AbstractSerializerTest):
             assert serializer.loads(svalue) == value
 
 
+class TestPickle5Serializer(AbstractSerializerTest):
+    def test_dumps_loads(self):
+        serializer = Pickle5Serializer()
+
+        for value in self.values:
+            svalue = serializer.dumps(value)
+            assert serializer.loads(svalue) == value
+
+    def test_buffers(self):
+        serializer = Pickle5Serializer()
+        buffer = bytearray(b'x' * 1000)
+        parts = serializer.dumps_buffers({'a': pickle.PickleBuffer(buffer)})
+        # The buffer is passed through rather than copied into the pickle.
+        assert len(parts) == 3
+        assert parts[2].obj is buffer
+        assert serializer.loads(b''.join(parts))['a'] == buffer
+
+    def test_bytes(self):
+        serializer = Pickle5Serializer()
+        data = serializer.dumps(b'abc')
+        assert data == b'Rabc'
+        assert serializer.loads(data) == b'abc'
+
+        view = serializer.loads(memoryview(data))
+        assert isinstance(view, memoryview) and view == b'abc'
+
+    def test_corrupt(self):
+        serializer = Pickle5Serializer()
+        data = serializer.dumps({'a': pickle.PickleBuffer(bytearray(100))})
+        for corrupt in (b'', b'X', data[:5], data[:-1]):
+            with self.assertRaises(ValueError):
+                serializer.loads(corrupt)
+
+
+class TestTaggedSerializer(AbstractSerializerTest):
+    def test_dumps_loads(self):
+        for serializer in (TaggedSerializer(), TaggedSerializer(fallback='json')):
+            for value in self.values + [b'foo', '', -7]:
+                svalue = serializer.dumps(value)
+                assert serializer.loads(svalue) == value
+                assert type(serializer.loads(svalue)) is type(value)
+                assert serializer.loads(memoryview(svalue)) == value
+
+    def test_wire_format(self):
+        serializer = TaggedSerializer()
+        # Integers stay plain so that INCR works on them.
+        assert serializer.dumps(20) == b'20'
+        assert serializer.dumps(-3) == b'-3'
+        assert serializer.dumps(b'abc') == b'\x10abc'
+        assert serializer.dumps('abc') == b'\x11abc'
+        assert serializer.dumps([1])[:1] == b'\x12'
+        assert TaggedSerializer(fallback='json').dumps([1]) == b'\x13[1]'
+
+    def test_legacy(self):
+        serializer = TaggedSerializer()
+        legacy = RedisSerializer()
+        for value in self.values:
+            assert serializer.loads(legacy.dumps(value)) == value
+
+    def test_invalid(self):
+        serializer = TaggedSerializer()
+        for data in (b'', b'\x1f', b'\x12'):
+            with self.assertRaises((ValueError, EOFError)):
+                serializer.loads(data)
+        with self.assertRaises(ValueError):
+            TaggedSerializer(fallback='xml')
+
+
+@dataclass
+class Point:
+    x: int
+    y: int
+
+
+@unittest.skipUnless(msgpack, 'msgpack is not installed')
+class TestMsgPackSerializer(AbstractSerializerTest):
+    def test_dumps_loads(self):
+        serializer = MsgPackSerializer()
+        for value in self.values + [b'foo']:
+            svalue = serializer.dumps(value)
+            assert serializer.loads(svalue) == value
+            assert serializer.loads(memoryview(svalue)) == value
+
+    def test_extensions(self):
+        serializer = MsgPackSerializer()
+        values = [datetime(2020, 1, 2, 3, 4, 5), date(2020, 1, 2), Decimal('1.10'), UUID(int=1)]
+        for value in values:
+            assert serializer.loads(serializer.dumps(value)) == value
+        assert serializer.loads(serializer.dumps(Point(1, 2))) == {'x': 1, 'y': 2}
+
+    def test_hooks(self):
+        serializer = MsgPackSerializer(
+            default=lambda obj: msgpack.ExtType(10, repr(obj).encode()),
+            ext_hook=lambda code, data: (code, data)
+        )
+        assert serializer.loads(serializer.dumps(1j)) == (10, b'1j')
+        with self.assertRaises(TypeError):
+            MsgPackSerializer().dumps(1j)
+
+
+@unittest.skipUnless(orjson, 'orjson is not installed')
+class TestOrjsonSerializer(AbstractSerializerTest):
+    def test_dumps_loads(self):
+        serializer = OrjsonSerializer()
+        for value in self.values:
+            svalue = serializer.dumps(value)
+            assert serializer.loads(svalue) == value
+            assert serializer.loads(memoryview(svalue)) == value
+
+    def test_extensions(self):
+        serializer = OrjsonSerializer()
+        value = {'at': datetime(2020, 1, 2), 'price': Decimal('1.10'), 'point': Point(1, 2)}
+        assert serializer.loads(serializer.dumps(value)) == {
+            'at': '2020-01-02T00:00:00', 'price': '1.10', 'point': {'x': 1, 'y': 2}
+        }
+
+    def test_default(self):
+        serializer = OrjsonSerializer(default=repr)
+        assert serializer.loads(serializer.dumps(1j)) == '1j'
+        with self.assertRaises(TypeError):
+            OrjsonSerializer().dumps(1j)
+
+
+class _RawSerializer:
+    def dumps(self, obj):
+        return obj
+
+    def loads(self, data):
+        return bytes(data)
+
+
+class TestCompressedSerializer(AbstractSerializerTest):
+    def test_dumps_loads(self):
+        for codec in ('zlib', 'lzma'):
+            serializer = CompressedSerializer(codec=codec, threshold=0)
+            for value in self.values + ['x' * 10000]:
+                svalue = serializer.dumps(value)
+                assert serializer.loads(svalue) == value
+                assert serializer.loads(memoryview(svalue)) == value
+
+    def test_threshold(self):
+        # The threshold applies to the payload, including its tag.
+        serializer = CompressedSerializer(threshold=100)
+        assert serializer.dumps('x' * 98) == TaggedSerializer().dumps('x' * 98)
+        assert serializer.dumps('x' * 99)[:2] == b'\xc1\x01'
+        assert len(serializer.dumps('x' * 10000)) < 100
+
+    def test_incompressible(self):
+        serializer = CompressedSerializer(_RawSerializer(), threshold=0)
+        data = bytes(range(256))
+        assert serializer.dumps(data) == data
+        # Payloads that look compressed are escaped.
+        assert serializer.dumps(b'\xc1') == b'\xc1\x00\xc1'
+        assert serializer.loads(b'\xc1\x00\xc1') == b'\xc1'
+
+    def test_other_codec(self):
+        data = CompressedSerializer(codec='lzma', threshold=0).dumps('x' * 1000)
+        assert CompressedSerializer().loads(data) == 'x' * 1000
+
+    def test_dictionary(self):
+        plain = CompressedSerializer(threshold=0)
+        samples = [
+            plain.serializer.dumps({'name': f'user{i}', 'email': f'user{i}@example.com'})
+            for i in range(100)
+        ]
+        dictionary = CompressedSerializer.train_dictionary(samples)
+        serializer = CompressedSerializer(threshold=0, dictionary=dictionary)
+
+        value = {'name': 'someone', 'email': 'someone@example.com'}
+        data = serializer.dumps(value)
+        assert len(data) < len(plain.dumps(value))
+        assert serializer.loads(data) == value
+        assert serializer.loads(memoryview(data)) == value
+        with self.assertRaises(ValueError):
+            plain.loads(data)
+
+    def test_dictionary_mismatch(self):
+        serializer = CompressedSerializer(threshold=0, dictionary=b'{"name": "user"}' * 8)
+        data = serializer.dumps('user' * 100)
+
+        other = CompressedSerializer(threshold=0, dictionary=b'{"email": "user"}' * 8)
+        with self.assertRaisesRegex(ValueError, 'another dictionary'):
+            other.loads(data)
+
+        # The same dictionary, claimed by a zstd payload.
+        zstd = bytes((data[0], 3 | 0x80)) + data[2:]
+        with self.assertRaisesRegex(ValueError, 'another codec'):
+            serializer.loads(zstd)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            CompressedSerializer(codec='rar')
+        with self.assertRaises(ValueError):
+            CompressedSerializer(codec='lzma', dictionary=b'abc')
+        with self.assertRaises(ValueError):
+            CompressedSerializer().loads(b'\xc1\x7f')
+
+
 if __name__ == '__main__':
     unittest.run()
@@ -1,5 +1,18 @@
 import unittest
 
+from src.cachecore.utils import chunked, iter_pairs
+
+
+class TestUtils(unittest.TestCase):
+
+    def test_chunked(self):
+        assert list(chunked(range(5), 2)) == [[0, 1], [2, 3], [4]]
+        assert list(chunked([], 2)) == []
+
+    def test_iter_pairs(self):
+        assert list(iter_pairs({'a': 1, 'b': 2})) == [('a', 1), ('b', 2)]
+        assert list(iter_pairs([('a', 1)])) == [('a', 1)]
+
 
 if __name__ == '__main__':
     unittest.main()